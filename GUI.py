@@ -1,51 +1,69 @@
+import time
+_startup_begin = time.perf_counter()
+
+import threading
 import gradio as gr
-from PIL import Image
-from ocr_task import send_file, receive_result
-from audio_module import audio_process, voice_advice
-from medical_record_module import generate_medical_record, create_template_record
+from ocr_task import ocr_process
+from audio_module import (
+    audio_process_stream, audio_stream_start, audio_stream_feed, audio_stream_finish,
+    voice_advice, answer_voice_stream, warm_up
+)
+from medical_record_module import generate_record_files, create_template_record
+from worker_pools import PoolBusyError
+from metrics import start_metrics_server
+from config import (
+    GRADIO_QUEUE_MAX_SIZE, GRADIO_DEFAULT_CONCURRENCY, OCR_CONCURRENCY,
+    AUDIO_CONCURRENCY, RECORD_CONCURRENCY, METRICS_ENABLED, ASR_STREAMING, ASR_STREAM_CONCURRENCY,
+    BOARD_ADDRESSES
+)
+
+def ocr_handler(image, source, request: gr.Request):
+    """处理OCR图像识别，识别结果记为本会话的就诊信息"""
+    session_id = request.session_hash if request else None
+    return ocr_process(image, source, session_id)
 
-def ocr_handler(image, source):
-    """处理OCR图像识别"""
+def audio_handler(audio_file, request: gr.Request):
+    """处理音频输入，逐步输出AI回答，对话历史按浏览器会话隔离"""
     try:
-        if source == "手动上传" or source == "实时拍摄":
-            image_path = "captured_avatar.jpg"
-            if source == "实时拍摄":
-                # 保存并翻转图像
-                image.save(image_path)
-                with Image.open(image_path) as img:
-                    img = img.transpose(Image.FLIP_LEFT_RIGHT)
-                    img.save(image_path)
-            else:
-                image.save(image_path)
-                
-        # 发送处理后的图像文件并获取结果
-        send_file(image_path)
-        return receive_result()
+        if not audio_file:
+            yield "请先录制音频", "无法提供建议"
+            return
+        session_id = request.session_hash if request else None
+        for question, response in audio_process_stream(audio_file, session_id):
+            yield question, response
     except Exception as e:
-        return f"图像处理出错：{str(e)}"
+        yield f"音频处理出错：{str(e)}", "无法提供建议"
 
-def audio_handler(audio_file):
-    """处理音频输入"""
+def stream_start_handler(request: gr.Request):
+    """开始录音，放弃本会话上一次未结束的流式识别"""
+    audio_stream_start(request.session_hash if request else None)
+
+def stream_audio_handler(chunk, request: gr.Request):
+    """录音过程中逐块转发到开发板，实时显示识别结果"""
+    return audio_stream_feed(chunk, request.session_hash if request else None)
+
+def stream_finish_handler(request: gr.Request):
+    """录音结束，取得最终识别结果后逐步输出AI回答"""
     try:
-        if not audio_file:
-            return "请先录制音频", "无法提供建议"
-        question, response = audio_process(audio_file)
-        return question, response
+        for question, response in audio_stream_finish(request.session_hash if request else None):
+            yield question, response
     except Exception as e:
-        return f"音频处理出错：{str(e)}", "无法提供建议"
+        yield f"音频处理出错：{str(e)}", "无法提供建议"
 
-def generate_medical_record_handler(info, answer):
-    """生成病历图片"""
+def generate_medical_record_handler(info, answer, request: gr.Request):
+    """生成病历图片和可打印的PDF，文件按请求单独生成，互不覆盖"""
     try:
         if not info or not answer:
             # 如果没有信息，返回模板
-            return create_template_record()
+            return create_template_record(), None
             
-        record_path = generate_medical_record(info, answer)
-        return record_path
+        session_id = request.session_hash if request else None
+        return generate_record_files(info, answer, session_id)
+    except PoolBusyError as e:
+        raise gr.Error("当前病历生成人数较多，请稍后再试") from e
     except Exception as e:
         print(f"病历生成出错：{str(e)}")
-        return create_template_record()  # 发生错误时返回模板
+        return create_template_record(), None  # 发生错误时返回模板
 
 def play_voice_advice():
     """播放语音建议"""
@@ -55,6 +73,12 @@ def play_voice_advice():
         print(f"语音建议生成出错：{str(e)}")
         return None
 
+def read_answer_handler(answer):
+    """逐句合成并流式播放AI回答，第一句合成完成即开始播放"""
+    if not answer:
+        return
+    yield from answer_voice_stream(answer)
+
 # GUI界面构建
 with gr.Blocks() as demo:
     with gr.Tab("智慧医疗系统"):
@@ -101,6 +125,14 @@ with gr.Blocks() as demo:
                     label="请说出您的问题"
                 )
                 submit_audio = gr.Button("开始语音咨询")
+                if ASR_STREAMING:
+                    # 边说边识别：录音过程中音频分块发送到开发板，停止录音后直接得到问题
+                    stream_input = gr.Audio(
+                        sources=["microphone"],
+                        type="numpy",
+                        streaming=True,
+                        label="实时语音咨询（边说边识别）"
+                    )
                 
                 question_output = gr.Textbox(
                     label="您的问题",
@@ -113,15 +145,18 @@ with gr.Blocks() as demo:
                 # 添加音频输出组件
                 audio_output = gr.Audio(label="语音建议", visible=True)
                 play_advice = gr.Button("收听语音建议")
+                answer_audio = gr.Audio(label="朗读AI回答", streaming=True, autoplay=True)
+                read_answer = gr.Button("朗读AI回答")
             
             # 右侧病历显示区
             with gr.Column(scale=5):
                 show_record = gr.Button("查看电子病历")
+                # 模板在页面加载时才渲染（每天只渲染一次），不拖慢启动
                 record_display = gr.Image(
                     label="电子病历",
-                    type="filepath",
-                    value=create_template_record()  # 设置初始值为模板
+                    type="filepath"
                 )
+                record_pdf = gr.File(label="下载病历PDF")
 
         # 底部
         gr.Button("-----感谢使用-----", variant="primary")
@@ -130,19 +165,43 @@ with gr.Blocks() as demo:
         submit_ocr.click(
             ocr_handler,
             inputs=[image_input, source_choice],
-            outputs=info_output
+            outputs=info_output,
+            concurrency_limit=OCR_CONCURRENCY * len(BOARD_ADDRESSES),
+            concurrency_id="ocr"
         )
         
         submit_audio.click(
             audio_handler,
             inputs=[audio_input],
-            outputs=[question_output, answer_output]
+            outputs=[question_output, answer_output],
+            concurrency_limit=AUDIO_CONCURRENCY,
+            concurrency_id="audio"
         )
         
+        if ASR_STREAMING:
+            stream_input.start_recording(stream_start_handler, inputs=None, outputs=None)
+            stream_input.stream(
+                stream_audio_handler,
+                inputs=[stream_input],
+                outputs=question_output,
+                show_progress="hidden",
+                concurrency_limit=ASR_STREAM_CONCURRENCY,
+                concurrency_id="asr_stream"
+            )
+            stream_input.stop_recording(
+                stream_finish_handler,
+                inputs=None,
+                outputs=[question_output, answer_output],
+                concurrency_limit=AUDIO_CONCURRENCY,
+                concurrency_id="audio"
+            )
+
         show_record.click(
             generate_medical_record_handler,
             inputs=[info_output, answer_output],
-            outputs=record_display
+            outputs=[record_display, record_pdf],
+            concurrency_limit=RECORD_CONCURRENCY,
+            concurrency_id="record"
         )
         
         play_advice.click(
@@ -151,4 +210,25 @@ with gr.Blocks() as demo:
             outputs=audio_output  # 添加输出组件
         )
 
+        read_answer.click(
+            read_answer_handler,
+            inputs=[answer_output],
+            outputs=answer_audio
+        )
+
+        demo.load(create_template_record, inputs=None, outputs=record_display)
+
+# 启用排队：超过并发数的请求在队列中等待，界面显示排队位置；队列满时新请求直接提示繁忙
+demo.queue(default_concurrency_limit=GRADIO_DEFAULT_CONCURRENCY, max_size=GRADIO_QUEUE_MAX_SIZE)
+
+# 大模型客户端、语音合成等在后台初始化，界面无需等待
+threading.Thread(target=warm_up, name="warm-up", daemon=True).start()
+if METRICS_ENABLED:
+    # Prometheus 从该端口抓取各阶段耗时直方图、错误与缓存命中计数
+    try:
+        start_metrics_server()
+    except OSError as e:
+        # 端口被占用（如同时运行了两个界面）时只是没有指标，界面照常启动
+        print(f"指标服务启动失败，继续运行：{str(e)}")
+print(f"界面构建完成，耗时 {time.perf_counter() - _startup_begin:.2f} s")
 demo.launch(share=True)
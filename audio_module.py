@@ -1,109 +1,325 @@
-import os
-from gtts import gTTS
-import pyttsx3
-import time
-from medical_ai import create_medical_ai
-from config import TEMP_DIR
-import shutil
-
-# 创建项目目录下的temp文件夹
-if not os.path.exists(TEMP_DIR):
-    os.makedirs(TEMP_DIR)
-
-# 创建MedicalAI实例
-medical_ai = create_medical_ai(
-    provider_type="deepseek",
-    enable_search=True,
-    serper_api_key="填入你的搜索引擎api",
-    api_key="sk-填入你的deepseekapi
+"""
+语音咨询流程：语音识别、AI问诊和语音合成
+
+模块导入时不创建任何客户端、线程或文件：大模型客户端、会话存储和语音合成服务
+都在第一次使用时才构造，openai、numpy 等较重的依赖也随之延迟导入。
+"""
+import threading
+from config import (
+    RESPONSE_CACHE_ENABLED, RESPONSE_CACHE_DB_PATH, SEARCH_CACHE_DB_PATH, TTS_PREWARM,
+    KNOWLEDGE_ENABLED, KNOWLEDGE_INDEX_DIR, PATIENT_STORE_ENABLED
 )
+from worker_pools import get_pool, PoolBusyError
+from metrics import span, begin_span
+
+ADVICE_TEXT = "感谢您使用AI医疗助手，请记得按时服药，保持良好的作息习惯。如果症状持续，建议及时就医。"
+
+_medical_ai = None
+_session_store = None
+_asr_streams = None
+_medical_ai_lock = threading.Lock()
+_session_store_lock = threading.Lock()
+_asr_streams_lock = threading.Lock()
+
+def get_medical_ai():
+    """获取MedicalAI实例（所有会话共享，线程安全），首次调用时创建"""
+    global _medical_ai
+    with _medical_ai_lock:
+        if _medical_ai is None:
+            from medical_ai import create_medical_ai
+            _medical_ai = create_medical_ai(
+                provider_type="deepseek",
+                enable_search=True,
+                serper_api_key="填入你的搜索引擎api",
+                enable_cache=RESPONSE_CACHE_ENABLED,
+                cache_db_path=RESPONSE_CACHE_DB_PATH,
+                search_cache_db_path=SEARCH_CACHE_DB_PATH,
+                knowledge_index_dir=KNOWLEDGE_INDEX_DIR if KNOWLEDGE_ENABLED else None,
+                api_key="sk-填入你的deepseekapi"
+            )
+        return _medical_ai
+
+def set_medical_ai(medical_ai):
+    """替换共享的MedicalAI实例（如使用其他密钥、接口地址或搜索服务），返回原来的实例"""
+    global _medical_ai
+    with _medical_ai_lock:
+        previous, _medical_ai = _medical_ai, medical_ai
+        return previous
+
+def get_session_store():
+    """获取会话存储，对话历史按会话分别保存"""
+    global _session_store
+    with _session_store_lock:
+        if _session_store is None:
+            from session_store import SessionStore
+            from temp_manager import get_temp_manager
+            # 会话过期或被淘汰时，其临时文件（病历、语音等）交给后台线程删除
+            _session_store = SessionStore(on_remove=get_temp_manager().release_session)
+        return _session_store
+
+def get_patient_store():
+    """获取患者档案存储"""
+    from patient_store import get_patient_store as _get_patient_store
+    return _get_patient_store()
+
+def remember_patient_info(session_id, info):
+    """记录会话对应的就诊信息（OCR 识别文本），不等待正在进行的问诊"""
+    get_session_store().get(session_id).patient_info = info
+
+def attach_prior_visits(session):
+    """
+    新会话第一轮问诊前，把同一患者既往就诊的摘要作为系统消息放入对话历史
+
+    读取失败时只打印错误，不影响本次问诊。
+    """
+    if not PATIENT_STORE_ENABLED or session.conversation_history or not session.patient_info:
+        return
+    try:
+        summary = get_patient_store().prior_visit_summary(session.patient_info, exclude_session=session.session_id)
+    except Exception as e:
+        print(f"读取既往就诊记录出错：{str(e)}")
+        return
+    if summary:
+        from prompts import MEDICAL_ADVICE_PROMPT
+        session.conversation_history.extend([
+            {"role": "system", "content": MEDICAL_ADVICE_PROMPT},
+            {"role": "system", "content": summary}
+        ])
+
+def merge_history(session, snapshot, history, question, response):
+    """
+    把在会话锁外生成的一轮问答写回会话
+
+    期间会话历史没有变化时直接采用新的历史（含压缩结果）；同一会话的其他请求
+    已经写入时只追加本轮的问题和回答，不覆盖对方的内容。
+    """
+    if session.conversation_history == snapshot:
+        session.conversation_history[:] = history
+    else:
+        session.conversation_history.extend([
+            {"role": "user", "content": question},
+            {"role": "assistant", "content": response}
+        ])
+
+def record_visit(session, question, response):
+    """把成功的问答交给患者档案存储在后台保存"""
+    from medical_ai import is_failed_response
+    if not PATIENT_STORE_ENABLED or not response or is_failed_response(response):
+        return
+    try:
+        get_patient_store().record_visit(session.patient_info, question, response, session.session_id)
+    except Exception as e:
+        print(f"保存问诊记录出错：{str(e)}")
+
+def get_tts():
+    """获取共享的语音合成服务"""
+    from tts_service import get_tts_service
+    return get_tts_service()
+
+def warm_up():
+    """
+    预先完成耗时的初始化，供界面启动后在后台线程调用
+
+    创建大模型客户端和会话存储（同时启动临时文件清理），打开患者档案数据库，
+    并预先合成固定的语音建议，首次请求时无需再等待。
+    """
+    get_medical_ai()
+    get_session_store()
+    if PATIENT_STORE_ENABLED:
+        get_patient_store()
+    if TTS_PREWARM:
+        get_tts().prewarm([ADVICE_TEXT])
 
 def process_audio_file(audio_file_path):
     """处理音频文件并获取识别结果"""
-    from soundreg_task import send_audiofile, receive_result
+    from soundreg_task import recognize_audio, recognize_audio_bytes
+    from audio_preprocess import preprocess_audio
+    import wave
     
-    # 复制音频文件到临时目录
-    temp_audio = os.path.join(TEMP_DIR, "temp_audio.wav")
-    shutil.copy(audio_file_path, temp_audio)
+    # 在内存中混音、重采样、裁剪静音后直接发送
+    try:
+        with span("upload", kind="audio"):
+            processed = preprocess_audio(audio_file_path)
+    except (wave.Error, EOFError) as e:
+        # 非 PCM WAV 格式时退回直接上传原文件
+        print(f"音频预处理跳过：{str(e)}")
+        return recognize_audio(audio_file_path)
     
-    # 发送音频文件并获取识别结果
-    send_audiofile(temp_audio)
-    recognized_text = receive_result()
+    print(processed.report())
+    recognized_text = recognize_audio_bytes(processed.data, processed.content_type)
     
     return recognized_text
 
-def audio_process(audio_file_path):
+def normalize_question(raw_text):
+    """清理语音识别文本，补全结尾标点"""
+    question = raw_text.strip()
+    if question.endswith('。。。') or question.endswith('...'):
+        question = question[:-2]
+    if not any(question.endswith(p) for p in ['。', '？', '！', '.', '?', '!']):
+        question += '。'
+    return question
+
+BUSY_MESSAGE = "当前咨询人数较多，请稍后再试"
+STREAM_FAILED_MESSAGE = "（回答生成中断，以上内容不完整，请稍后重试）"
+
+def audio_process(audio_file_path, session_id=None):
     """处理音频输入并返回问答结果"""
     try:
-        # 获取语音识别结果
-        raw_text = process_audio_file(audio_file_path)
+        with span("consultation", input="audio") as consultation:
+            # 获取语音识别结果（开发板通信在独立线程池中进行）
+            raw_text = get_pool("board").run(process_audio_file, audio_file_path)
+            
+            if not raw_text:
+                consultation.fail("语音识别失败")
+                return "语音识别失败", "无法提供建议"
+            
+            # 清理识别文本
+            question = normalize_question(raw_text)
+            print(f"处理后的语音识别结果: {question}")
+            
+            # 获取医疗建议
+            with get_session_store().session(session_id) as session:
+                attach_prior_visits(session)
+                response = get_pool("llm").run(get_medical_ai().get_medical_advice, question, session.conversation_history)
+                record_visit(session, question, response)
+            print(f"AI回复: {response}")
+            
+            return question, response
+            
+    except PoolBusyError as e:
+        print(f"请求被拒绝: {str(e)}")
+        return BUSY_MESSAGE, "无法提供建议"
+    except Exception as e:
+        print(f"错误详情: {str(e)}")
+        return f"音频处理出错：{str(e)}", "无法提供建议"
+
+def audio_process_stream(audio_file_path, session_id=None):
+    """处理音频输入，流式产出 (问题, 截至目前的回答)"""
+    return _consultation_stream(lambda: process_audio_file(audio_file_path), session_id)
+
+def _consultation_stream(recognize, session_id, **fields):
+    """
+    在开发板线程池中调用 recognize() 取得识别文本，再流式产出 (问题, 截至目前的回答)
+
+    Args:
+        recognize: 返回语音识别文本的函数
+        fields: 记入 consultation 阶段的附加字段
+    """
+    from medical_ai import ResponseStreamError
+    
+    # 生成器会跨越多次 yield，只在提交任务时把整条流程设为当前阶段
+    consultation = begin_span("consultation", input="audio", stream=True, **fields)
+    try:
+        with consultation.activate():
+            raw_text = get_pool("board").run(recognize)
         
         if not raw_text:
-            return "语音识别失败", "无法提供建议"
+            consultation.fail("语音识别失败")
+            yield "语音识别失败", "无法提供建议"
+            return
         
-        # 清理识别文本
-        question = raw_text.strip()
-        if question.endswith('。。。') or question.endswith('...'):
-            question = question[:-2]
-        if not any(question.endswith(p) for p in ['。', '？', '！', '.', '?', '!']):
-            question += '。'
-            
+        question = normalize_question(raw_text)
         print(f"处理后的语音识别结果: {question}")
         
-        # 获取医疗建议
-        response = medical_ai.get_medical_advice(question)
+        # 先展示识别出的问题，再逐步展示AI回答
+        yield question, ""
+        response = ""
+        medical_ai = get_medical_ai()
+        # 生成器可能被界面中途放弃，会话锁不跨越 yield：先复制历史，回答完成后再写回
+        with get_session_store().session(session_id) as session:
+            attach_prior_visits(session)
+            snapshot = [dict(message) for message in session.conversation_history]
+        history = [dict(message) for message in snapshot]
+        with consultation.activate():
+            responses = get_pool("llm").iterate(lambda: medical_ai.get_medical_advice_stream(question, history))
+        for response in responses:
+            yield question, response
+        with get_session_store().session(session_id) as session:
+            merge_history(session, snapshot, history, question, response)
+            record_visit(session, question, response)
         print(f"AI回复: {response}")
-        
-        return question, response
             
+    except ResponseStreamError as e:
+        # 回答中途失败：保留已生成的部分，失败提示单独附在后面，不作为回答内容
+        print(f"回答生成中断: {str(e)}")
+        consultation.fail(str(e))
+        yield question, (e.partial + "\n\n" if e.partial else "") + STREAM_FAILED_MESSAGE
+    except PoolBusyError as e:
+        print(f"请求被拒绝: {str(e)}")
+        consultation.fail(str(e))
+        yield BUSY_MESSAGE, "无法提供建议"
     except Exception as e:
         print(f"错误详情: {str(e)}")
-        return f"音频处理出错：{str(e)}", "无法提供建议"
+        consultation.fail(str(e))
+        yield f"音频处理出错：{str(e)}", "无法提供建议"
+    finally:
+        consultation.end()
+
+def get_asr_streams():
+    """获取按会话保存的流式识别"""
+    global _asr_streams
+    with _asr_streams_lock:
+        if _asr_streams is None:
+            from streaming_asr import StreamingRecognizers
+            _asr_streams = StreamingRecognizers()
+        return _asr_streams
+
+def audio_stream_start(session_id=None):
+    """开始录音：放弃该会话上一次未结束的流式识别"""
+    get_asr_streams().start(session_id or "")
 
-def text_process(text):
+def audio_stream_feed(chunk, session_id=None):
+    """
+    边录音边识别：把一块录音转发到开发板，返回目前的识别结果
+
+    Args:
+        chunk: 界面送来的一块录音 (采样率, 采样数组)
+    """
+    if chunk is None:
+        return ""
+    sample_rate, samples = chunk
+    try:
+        return get_asr_streams().feed(session_id or "", samples, sample_rate)
+    except Exception as e:
+        print(f"流式识别出错：{str(e)}")
+        return ""
+
+def audio_stream_finish(session_id=None):
+    """录音结束：等待开发板给出最终识别结果，然后流式产出 (问题, 截至目前的回答)"""
+    recognizer = get_asr_streams().pop(session_id or "")
+    if recognizer is None:
+        yield "请先录制音频", "无法提供建议"
+        return
+    yield from _consultation_stream(recognizer.finish, session_id, asr="stream")
+
+def text_process(text, session_id=None):
     """处理文本输入"""
     if not text or text.strip() == "":
         return "请输入您的问题"
     try:
-        response = medical_ai.get_medical_advice(text)
+        with span("consultation", input="text"), get_session_store().session(session_id) as session:
+            attach_prior_visits(session)
+            response = get_pool("llm").run(get_medical_ai().get_medical_advice, text, session.conversation_history)
+            record_visit(session, text, response)
         return response
+    except PoolBusyError as e:
+        print(f"请求被拒绝: {str(e)}")
+        return BUSY_MESSAGE
     except Exception as e:
         print(f"文本处理出错：{str(e)}")
         return f"处理出错：{str(e)}"
 
 def voice_advice():
-    """生成语音建议"""
+    """生成语音建议，同一段文本只合成一次，之后直接返回缓存的音频"""
     try:
-        text = "感谢您使用AI医疗助手，请记得按时服药，保持良好的作息习惯。如果症状持续，建议及时就医。"
-        
-        try:
-            # 首先尝试使用 gTTS
-            tts = gTTS(text=text, lang='zh-cn')
-            temp_mp3_path = os.path.join(TEMP_DIR, f"temp_advice_{int(time.time())}.mp3")
-            tts.save(temp_mp3_path)
-            return temp_mp3_path
-            
-        except Exception as e:
-            print(f"gTTS失败，尝试使用本地引擎: {str(e)}")
-            
-            # 如果 gTTS 失败，使用 pyttsx3 作为备选
-            engine = pyttsx3.init()
-            temp_mp3_path = os.path.join(TEMP_DIR, f"temp_advice_{int(time.time())}.mp3")
-            engine.save_to_file(text, temp_mp3_path)
-            engine.runAndWait()
-            return temp_mp3_path
-            
+        return get_tts().synthesize(ADVICE_TEXT)
     except Exception as e:
         print(f"语音生成出错：{str(e)}")
         return None
 
-def clean_temp_files():
-    """清理temp文件夹中的临时文件"""
-    for file in os.listdir(TEMP_DIR):
-        try:
-            os.remove(os.path.join(TEMP_DIR, file))
-        except:
-            pass
-
-# 启动时清理临时文件
-clean_temp_files()
+def answer_voice_stream(answer):
+    """逐句朗读AI回答，依次产出每一句的音频文件路径"""
+    try:
+        yield from get_tts().synthesize_sentences(answer)
+    except Exception as e:
+        print(f"语音生成出错：{str(e)}")
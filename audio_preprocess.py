@@ -0,0 +1,222 @@
+"""
+语音识别上传前的音频预处理
+
+全部在内存中完成：多声道混为单声道、基于能量的端点检测裁掉首尾静音、
+重采样到 AUDIO_SAMPLE_RATE，最后编码为 WAV 字节直接交给开发板传输层。
+浏览器通常以 44.1/48 kHz 双声道录音，处理后上传数据量约为原来的六分之一。
+"""
+import io
+import os
+import struct
+import time
+import wave
+from typing import Dict
+
+import numpy as np
+
+from board_client import CONTENT_TYPE_WAV
+from config import (
+    AUDIO_SAMPLE_RATE, AUDIO_TRIM_SILENCE, AUDIO_VAD_THRESHOLD_DB,
+    AUDIO_VAD_PADDING, AUDIO_ENCODING
+)
+
+VAD_FRAME_SECONDS = 0.02   # 端点检测的帧长（秒）
+VAD_ABSOLUTE_FLOOR_DB = -55  # 低于该能量（dBFS）的帧一律视为静音
+RESAMPLE_FILTER_TAPS = 63    # 抗混叠低通滤波器阶数
+
+
+class AudioPreprocessResult:
+    """预处理结果及各阶段统计"""
+
+    def __init__(self, data: bytes, content_type: int, duration: float, original_duration: float,
+                 original_bytes: int, stage_times: Dict[str, float]):
+        self.data = data
+        self.content_type = content_type
+        self.duration = duration
+        self.original_duration = original_duration
+        self.original_bytes = original_bytes
+        self.stage_times = stage_times
+
+    def report(self) -> str:
+        """生成一行预处理报告：时长、字节数和各阶段耗时"""
+        stages = "，".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.stage_times.items())
+        return (f"音频预处理: {self.original_duration:.2f} s -> {self.duration:.2f} s，"
+                f"{self.original_bytes / 1024:.1f} KB -> {len(self.data) / 1024:.1f} KB（{stages}）")
+
+
+def read_wav(file_path: str):
+    """
+    读取 PCM WAV 文件
+
+    Returns:
+        (samples, sample_rate)，samples 为 float32 数组，形状为 (帧数, 声道数)，取值范围 [-1, 1]
+    """
+    with wave.open(file_path, 'rb') as wav:
+        channels = wav.getnchannels()
+        sample_width = wav.getsampwidth()
+        sample_rate = wav.getframerate()
+        raw = wav.readframes(wav.getnframes())
+
+    if sample_width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif sample_width == 2:
+        samples = np.frombuffer(raw, dtype='<i2').astype(np.float32) / 32768
+    elif sample_width == 3:
+        bytes_ = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        values = (bytes_[:, 0].astype(np.int32) | (bytes_[:, 1].astype(np.int32) << 8)
+                  | (bytes_[:, 2].astype(np.int32) << 16))
+        values = np.where(values & 0x800000, values - 0x1000000, values)
+        samples = values.astype(np.float32) / 8388608
+    elif sample_width == 4:
+        samples = np.frombuffer(raw, dtype='<i4').astype(np.float32) / 2147483648
+    else:
+        raise wave.Error(f"unsupported sample width: {sample_width}")
+    return samples.reshape(-1, channels), sample_rate
+
+
+def to_mono(samples: np.ndarray) -> np.ndarray:
+    """多声道取平均混为单声道"""
+    if samples.ndim == 1:
+        return samples
+    channels = samples.shape[1]
+    if channels == 1:
+        return samples[:, 0]
+    # 矩阵乘法比 mean(axis=1) 在交错存储的数据上快一个数量级
+    return samples @ np.full(channels, 1 / channels, dtype=np.float32)
+
+
+def _lowpass_kernel(cutoff: float, taps: int = RESAMPLE_FILTER_TAPS) -> np.ndarray:
+    """生成汉明窗加权的 sinc 低通滤波器，cutoff 为相对采样率的归一化截止频率"""
+    n = np.arange(taps) - (taps - 1) / 2
+    kernel = 2 * cutoff * np.sinc(2 * cutoff * n) * np.hamming(taps)
+    return (kernel / kernel.sum()).astype(np.float32)
+
+
+def resample(samples: np.ndarray, source_rate: int, target_rate: int) -> np.ndarray:
+    """
+    重采样单声道音频
+
+    降采样前先做抗混叠低通滤波；采样率为整数倍关系时直接抽取，否则线性插值。
+    """
+    if source_rate == target_rate or len(samples) == 0:
+        return samples
+    if target_rate < source_rate:
+        samples = np.convolve(samples, _lowpass_kernel(0.5 * target_rate / source_rate * 0.9), mode="same")
+        if source_rate % target_rate == 0:
+            return samples[::source_rate // target_rate].astype(np.float32)
+
+    duration = len(samples) / source_rate
+    target_length = int(round(duration * target_rate))
+    positions = np.arange(target_length, dtype=np.float64) * (source_rate / target_rate)
+    return np.interp(positions, np.arange(len(samples)), samples).astype(np.float32)
+
+
+def trim_silence(samples: np.ndarray, sample_rate: int, threshold_db: float = AUDIO_VAD_THRESHOLD_DB,
+                 padding: float = AUDIO_VAD_PADDING) -> np.ndarray:
+    """
+    用帧能量端点检测裁掉首尾静音
+
+    Args:
+        threshold_db: 相对于最响帧的能量阈值（dB），低于阈值的帧视为静音
+        padding: 语音段前后保留的余量（秒）
+    """
+    frame = max(1, int(sample_rate * VAD_FRAME_SECONDS))
+    frame_count = len(samples) // frame
+    if frame_count == 0:
+        return samples
+
+    frames = samples[:frame_count * frame].reshape(frame_count, frame)
+    rms = np.sqrt(np.mean(frames * frames, axis=1) + 1e-12)
+    energy_db = 20 * np.log10(rms)
+    threshold = max(energy_db.max() + threshold_db, VAD_ABSOLUTE_FLOOR_DB)
+    voiced = np.flatnonzero(energy_db > threshold)
+    if len(voiced) == 0:
+        # 未检测到语音时保留原始音频，由开发板给出识别结果
+        return samples
+
+    pad = int(padding * sample_rate)
+    start = max(0, voiced[0] * frame - pad)
+    end = min(len(samples), (voiced[-1] + 1) * frame + pad)
+    return samples[start:end]
+
+
+def _mulaw_encode(pcm: np.ndarray) -> np.ndarray:
+    """按 G.711 标准将 16 位 PCM 编码为 8 位 μ-law"""
+    bias, clip = 0x84, 32635
+    sign = np.where(pcm < 0, 0x80, 0)
+    magnitude = np.minimum(np.abs(pcm), clip) + bias
+    exponent = np.clip(np.floor(np.log2(magnitude)).astype(np.int32) - 7, 0, 7)
+    mantissa = (magnitude >> (exponent + 3)) & 0x0F
+    return (~(sign | (exponent << 4) | mantissa) & 0xFF).astype(np.uint8)
+
+
+def encode_wav(samples: np.ndarray, sample_rate: int, encoding: str = AUDIO_ENCODING) -> bytes:
+    """
+    将单声道音频编码为 WAV 字节
+
+    Args:
+        encoding: "pcm16" 为 16 位 PCM；"mulaw" 为 8 位 G.711 μ-law，数据量再减半
+    """
+    samples = np.clip(samples, -1.0, 1.0)
+    if encoding == "pcm16":
+        buffer = io.BytesIO()
+        with wave.open(buffer, 'wb') as wav:
+            wav.setnchannels(1)
+            wav.setsampwidth(2)
+            wav.setframerate(sample_rate)
+            wav.writeframes((samples * 32767).astype('<i2').tobytes())
+        return buffer.getvalue()
+
+    if encoding == "mulaw":
+        data = _mulaw_encode((samples * 32767).astype(np.int32)).tobytes()
+        # wave 模块只支持写 PCM，μ-law（格式码 7）需要手动写头
+        fmt = struct.pack('<HHIIHHH', 7, 1, sample_rate, sample_rate, 1, 8, 0)
+        fact = struct.pack('<I', len(samples))
+        body = (b'WAVE' + b'fmt ' + struct.pack('<I', len(fmt)) + fmt
+                + b'fact' + struct.pack('<I', len(fact)) + fact
+                + b'data' + struct.pack('<I', len(data)) + data + (b'\0' if len(data) % 2 else b''))
+        return b'RIFF' + struct.pack('<I', len(body)) + body
+
+    raise ValueError(f"Unsupported audio encoding: {encoding}")
+
+
+def preprocess_audio(
+    file_path: str,
+    target_rate: int = AUDIO_SAMPLE_RATE,
+    trim: bool = AUDIO_TRIM_SILENCE,
+    encoding: str = AUDIO_ENCODING
+) -> AudioPreprocessResult:
+    """
+    预处理录音文件
+
+    Args:
+        file_path: WAV 录音文件路径
+        target_rate: 目标采样率
+        trim: 是否裁掉首尾静音
+        encoding: 输出编码（"pcm16" 或 "mulaw"）
+
+    Raises:
+        wave.Error: 文件不是受支持的 PCM WAV 格式
+    """
+    stage_times = {}
+
+    def stage(name, func, *args):
+        start = time.perf_counter()
+        result = func(*args)
+        stage_times[name] = time.perf_counter() - start
+        return result
+
+    samples, source_rate = stage("读取", read_wav, file_path)
+    original_bytes = os.path.getsize(file_path)
+    original_duration = len(samples) / source_rate
+
+    samples = stage("混音", to_mono, samples)
+    if trim:
+        # 先裁剪再重采样，滤波只需处理语音段
+        samples = stage("静音裁剪", trim_silence, samples, source_rate)
+    samples = stage("重采样", resample, samples, source_rate, target_rate)
+    data = stage("编码", encode_wav, samples, target_rate, encoding)
+
+    return AudioPreprocessResult(
+        data, CONTENT_TYPE_WAV, len(samples) / target_rate, original_duration, original_bytes, stage_times
+    )
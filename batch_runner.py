@@ -0,0 +1,339 @@
+"""
+批量离线问诊
+
+从 JSONL 或 CSV 文件读取患者问题，以有限并发和限速调用 MedicalAI.get_medical_advice，
+可选生成病历图片，结果逐条追加写入输出目录的 results.jsonl。
+中断后用相同参数重新运行，已成功的条目会被跳过（断点续跑）。
+可用于夜间回归测试，或配合 --cache 预先生成常见问题的回答缓存。
+
+输入每行（或 CSV 每列）支持的字段：
+    id        条目编号，缺省时使用文件中的物理行号，如 line-3（带前缀，不会与显式编号重复）
+    question  患者问题
+    info      就诊信息（OCR 识别文本），生成病历时使用
+    audio     录音文件路径，没有 question 时先进行语音识别
+
+用法：
+    python batch_runner.py questions.jsonl --output-dir batch_output --concurrency 8 --rate 5
+    python batch_runner.py questions.csv --output-dir batch_output --records --cache
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterator, Optional, Set, Tuple
+
+from config import (
+    BATCH_CONCURRENCY, BATCH_RATE_LIMIT, RESPONSE_CACHE_DB_PATH,
+    SEARCH_CACHE_DB_PATH, KNOWLEDGE_ENABLED, KNOWLEDGE_INDEX_DIR
+)
+
+RESULTS_FILE = "results.jsonl"
+SUMMARY_FILE = "summary.json"
+RECORDS_DIR = "records"
+
+
+class RateLimiter:
+    """
+    令牌桶限速器
+
+    Args:
+        rate: 每秒允许的请求数，为 None 或 0 时不限速
+        burst: 允许的突发请求数
+    """
+
+    def __init__(self, rate: Optional[float], burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate or 1))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """取得一个令牌，令牌不足时等待"""
+        if not self.rate:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def read_items(input_path: str) -> Iterator[Dict[str, Any]]:
+    """
+    逐条读取 JSONL 或 CSV 输入，补齐 id 字段
+
+    缺省的 id 为 line-行号，取条目在文件中的物理行号，增删空行或无效行不会改变其他条目的 id。
+    无法解析的行不会中断读取：产出带 line（行号）和 parse_error 字段的条目，由 BatchRunner 记为失败。
+    """
+    with open(input_path, encoding="utf-8-sig", newline="") as f:
+        rows = _csv_rows(f) if input_path.lower().endswith(".csv") else _jsonl_rows(f)
+        for line, row, error in rows:
+            if error is not None:
+                yield {"id": f"line-{line}", "line": line, "parse_error": error}
+                continue
+            item = {key: value for key, value in row.items() if value not in (None, "")}
+            item["id"] = str(item.get("id", f"line-{line}"))
+            yield item
+
+
+def _jsonl_rows(f) -> Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+    """逐行解析 JSONL，产出 (行号, 条目, 错误)，跳过空行"""
+    for line_number, line in enumerate(f, 1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError as e:
+            yield line_number, None, f"第 {line_number} 行不是有效的 JSON：{str(e)}"
+            continue
+        if not isinstance(row, dict):
+            yield line_number, None, f"第 {line_number} 行不是 JSON 对象"
+            continue
+        yield line_number, row, None
+
+
+def _csv_rows(f) -> Iterator[Tuple[int, Optional[Dict[str, Any]], Optional[str]]]:
+    """逐行解析 CSV，产出 (行号, 条目, 错误)"""
+    reader = csv.DictReader(f)
+    while True:
+        try:
+            row = next(reader)
+        except StopIteration:
+            return
+        except csv.Error as e:
+            yield reader.line_num, None, f"第 {reader.line_num} 行无法解析：{str(e)}"
+            continue
+        yield reader.line_num, row, None
+
+
+def load_completed(results_path: str) -> Set[str]:
+    """读取已有结果文件中成功完成的条目编号"""
+    completed = set()
+    if not os.path.exists(results_path):
+        return completed
+    with open(results_path, encoding="utf-8") as f:
+        for line in f:
+            try:
+                result = json.loads(line)
+            except ValueError:
+                continue  # 上次中断时写了一半的行
+            if result.get("status") == "ok":
+                completed.add(result["id"])
+    return completed
+
+
+class BatchRunner:
+    """
+    批量问诊执行器
+
+    Args:
+        medical_ai: MedicalAI 实例
+        output_dir: 输出目录
+        concurrency: 同时处理的条目数
+        rate: 每秒最多发起的大模型请求数，为 None 时不限速
+        records: 是否为每个条目生成病历图片
+        renderer: 病历渲染器，默认使用共享的 RecordRenderer
+    """
+
+    def __init__(
+        self,
+        medical_ai,
+        output_dir: str,
+        concurrency: int = BATCH_CONCURRENCY,
+        rate: Optional[float] = BATCH_RATE_LIMIT,
+        records: bool = False,
+        renderer=None
+    ):
+        self.medical_ai = medical_ai
+        self.output_dir = output_dir
+        self.concurrency = concurrency
+        self.limiter = RateLimiter(rate)
+        self.records = records
+        self.renderer = renderer
+        self.results_path = os.path.join(output_dir, RESULTS_FILE)
+        self._write_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.latencies = []
+        self.succeeded = 0
+        self.failed = 0
+        os.makedirs(output_dir, exist_ok=True)
+        if records:
+            os.makedirs(os.path.join(output_dir, RECORDS_DIR), exist_ok=True)
+
+    def process(self, item: Dict[str, Any]) -> Dict[str, Any]:
+        """处理单个条目，异常记录在结果中而不向外抛出"""
+        from medical_ai import is_failed_response
+
+        start = time.perf_counter()
+        result = {"id": item["id"]}
+        if "line" in item:
+            result["line"] = item["line"]
+        try:
+            if "parse_error" in item:
+                raise ValueError(item["parse_error"])
+            question = item.get("question")
+            if not question and item.get("audio"):
+                from audio_module import process_audio_file, normalize_question
+                raw_text = process_audio_file(item["audio"])
+                if not raw_text:
+                    raise ValueError("语音识别失败")
+                question = normalize_question(raw_text)
+                result["transcript"] = question
+            if not question:
+                raise ValueError("缺少问题（question 或 audio）")
+
+            self.limiter.acquire()
+            # 每个条目都是独立的首轮问诊，可以命中并写入回答缓存
+            answer = self.medical_ai.get_medical_advice(question, [])
+            if is_failed_response(answer):
+                raise RuntimeError(answer)
+            result.update(question=question, answer=answer)
+
+            if self.records:
+                renderer = self.renderer
+                if renderer is None:
+                    from medical_record_module import get_record_renderer
+                    renderer = get_record_renderer()
+                record_path = os.path.join(self.output_dir, RECORDS_DIR, f"{_safe_name(item['id'])}.png")
+                renderer.render(item.get("info", ""), answer, record_path)
+                result["record"] = os.path.relpath(record_path, self.output_dir)
+            result["status"] = "ok"
+        except Exception as e:
+            result.update(status="error", error=str(e))
+        result["seconds"] = round(time.perf_counter() - start, 4)
+        return result
+
+    def _write(self, result: Dict[str, Any]):
+        """追加写入一条结果并立即刷盘，作为断点"""
+        line = json.dumps(result, ensure_ascii=False) + "\n"
+        with self._write_lock:
+            with open(self.results_path, "a", encoding="utf-8") as f:
+                f.write(line)
+                f.flush()
+        with self._stats_lock:
+            if result["status"] == "ok":
+                self.succeeded += 1
+                self.latencies.append(result["seconds"])
+            else:
+                self.failed += 1
+
+    def run(self, items: Iterator[Dict[str, Any]], resume: bool = True) -> Dict[str, Any]:
+        """
+        处理全部条目
+
+        输入按需读取，同时在途的条目不超过并发数的两倍，输入文件再大也不会全部载入内存。
+        无法解析的输入行记为失败并继续处理其余条目。
+
+        Raises:
+            OSError: 结果无法写入输出目录
+
+        Returns:
+            运行摘要（成功数、失败数、跳过数、吞吐量和延迟分位数），同时写入 summary.json
+        """
+        completed = load_completed(self.results_path) if resume else set()
+        if not resume and os.path.exists(self.results_path):
+            os.remove(self.results_path)
+        skipped = 0
+        window = threading.BoundedSemaphore(self.concurrency * 2)
+        start = time.perf_counter()
+
+        def task(item):
+            try:
+                self._write(self.process(item))
+            finally:
+                window.release()
+
+        pending = set()
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="batch") as executor:
+            for item in items:
+                if item["id"] in completed:
+                    skipped += 1
+                    continue
+                window.acquire()
+                pending.add(executor.submit(task, item))
+                # 条目的错误已记录在结果中，任务本身出错（如结果无法写入）时停止提交并抛出
+                done = {future for future in pending if future.done()}
+                pending -= done
+                for future in done:
+                    future.result()
+            for future in pending:
+                future.result()
+
+        elapsed = time.perf_counter() - start
+        latencies = sorted(self.latencies)
+        summary = {
+            "succeeded": self.succeeded,
+            "failed": self.failed,
+            "skipped": skipped,
+            "seconds": round(elapsed, 3),
+            "throughput": round((self.succeeded + self.failed) / elapsed, 2) if elapsed else 0.0,
+            "p50": _percentile(latencies, 0.5),
+            "p95": _percentile(latencies, 0.95),
+        }
+        with open(os.path.join(self.output_dir, SUMMARY_FILE), "w", encoding="utf-8") as f:
+            json.dump(summary, f, ensure_ascii=False, indent=2)
+        return summary
+
+
+def _percentile(values, fraction: float) -> Optional[float]:
+    if not values:
+        return None
+    return values[min(len(values) - 1, int(len(values) * fraction))]
+
+
+def _safe_name(name: str) -> str:
+    """
+    条目编号转为可用作文件名的字符串
+
+    替换特殊字符后不同编号可能相同（如 "a/b" 与 "a_b"，或大小写不敏感的文件系统上的 "A" 与 "a"），
+    末尾附加原始编号的短哈希以保证文件名互不相同。
+    """
+    safe = "".join(char if char.isalnum() or char in "-_." else "_" for char in name)
+    return f"{safe}-{hashlib.sha1(name.encode('utf-8')).hexdigest()[:8]}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批量离线问诊")
+    parser.add_argument("input", help="JSONL 或 CSV 输入文件")
+    parser.add_argument("--output-dir", default="batch_output")
+    parser.add_argument("--concurrency", type=int, default=BATCH_CONCURRENCY)
+    parser.add_argument("--rate", type=float, default=BATCH_RATE_LIMIT, help="每秒最多请求数，0 表示不限速")
+    parser.add_argument("--records", action="store_true", help="为每个条目生成病历图片")
+    parser.add_argument("--cache", action="store_true", help="读写回答缓存（可用于预先生成缓存）")
+    parser.add_argument("--search", action="store_true", help="启用网络搜索（需要 SERPER_API_KEY）")
+    parser.add_argument("--no-resume", action="store_true", help="忽略已有结果，从头运行")
+    parser.add_argument("--api-key", default=None, help="默认读取环境变量 DEEPSEEK_API_KEY")
+    parser.add_argument("--base-url", default="https://api.deepseek.com")
+    parser.add_argument("--model", default="deepseek-chat")
+    args = parser.parse_args()
+
+    from medical_ai import create_medical_ai
+    medical_ai = create_medical_ai(
+        provider_type="deepseek",
+        enable_search=args.search,
+        serper_api_key=os.getenv("SERPER_API_KEY"),
+        enable_cache=args.cache,
+        cache_db_path=RESPONSE_CACHE_DB_PATH,
+        search_cache_db_path=SEARCH_CACHE_DB_PATH,
+        knowledge_index_dir=KNOWLEDGE_INDEX_DIR if KNOWLEDGE_ENABLED else None,
+        api_key=args.api_key,
+        base_url=args.base_url,
+        model=args.model
+    )
+    runner = BatchRunner(medical_ai, args.output_dir, args.concurrency, args.rate, args.records)
+    summary = runner.run(read_items(args.input), resume=not args.no_resume)
+    print(json.dumps(summary, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,1186 @@
+"""
+离线性能基准测试
+
+所有外部依赖均由 fake_servers 中的本地替身服务代替，可在无网络环境下运行。
+
+用法：
+    python benchmark.py ttft --runs 5
+    python benchmark.py board --requests 50 --concurrency 10
+    python benchmark.py cache --runs 1000
+    python benchmark.py search --runs 20
+    python benchmark.py pipeline --search-delay 1.5 --deadline 0.5
+    python benchmark.py upload --size-mb 32 --runs 5
+    python benchmark.py image --width 4000 --height 3000
+    python benchmark.py audio --seconds 30
+    python benchmark.py record --runs 50
+    python benchmark.py tts --delay 0.3
+    python benchmark.py startup --modules audio_module medical_record_module
+    python benchmark.py trigger --terms 5000
+    python benchmark.py knowledge --paragraphs 20000
+    python benchmark.py batch --items 200 --concurrency 16
+    python benchmark.py resilience --requests 300 --slow-rate 0.05
+    python benchmark.py metrics --runs 100000
+    python benchmark.py load --requests 200 --concurrency 16 --max-p95 text=1500 --json load.json
+    python benchmark.py patients --patients 2000 --visits 20000
+    python benchmark.py asr --seconds 5 --chunk 0.5 --rtf 0.2
+    python benchmark.py boards --boards 1 2 4 --requests 200
+"""
+import argparse
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fake_servers import FakeOpenAIServer, FakeBoardServer, FakeSerperServer
+
+
+def bench_ttft(runs: int = 5, first_token_delay: float = 0.2, token_delay: float = 0.02):
+    """对比流式与非流式调用的首字延迟（TTFT）和总耗时"""
+    from medical_ai import DeepSeekProvider
+
+    with FakeOpenAIServer(first_token_delay=first_token_delay, token_delay=token_delay) as server:
+        provider = DeepSeekProvider(api_key="sk-fake", base_url=server.url)
+
+        blocking = []
+        for _ in range(runs):
+            start = time.perf_counter()
+            provider.generate_response("头痛怎么办。", [])
+            blocking.append(time.perf_counter() - start)
+
+        ttft, total = [], []
+        for _ in range(runs):
+            start = time.perf_counter()
+            first = None
+            for _ in provider.generate_response_stream("头痛怎么办。", []):
+                if first is None:
+                    first = time.perf_counter() - start
+            ttft.append(first)
+            total.append(time.perf_counter() - start)
+
+    print(f"非流式  首字/总耗时: {statistics.median(blocking) * 1000:8.1f} ms")
+    print(f"流式    首字耗时:    {statistics.median(ttft) * 1000:8.1f} ms")
+    print(f"流式    总耗时:      {statistics.median(total) * 1000:8.1f} ms")
+
+
+def bench_board(requests: int = 50, concurrency: int = 10, delay: float = 0.1):
+    """测量多个调用方共享一条开发板连接时的识别吞吐量"""
+    from board_client import BoardClient, KIND_OCR
+
+    with FakeBoardServer(delay=delay) as board:
+        client = BoardClient(*board.address)
+        payload = b"\0" * 64 * 1024
+
+        latencies = []
+
+        def one_request(_):
+            start = time.perf_counter()
+            client.request(KIND_OCR, payload)
+            latencies.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(one_request, range(requests)))
+        elapsed = time.perf_counter() - start
+        client.close()
+
+    print(f"并发 {concurrency}，共 {requests} 个请求，耗时 {elapsed:.2f} s")
+    print(f"吞吐量: {requests / elapsed:8.1f} req/s（单请求串行上限 {1 / delay:.1f} req/s）")
+    print(f"中位延迟: {statistics.median(latencies) * 1000:8.1f} ms")
+
+
+def bench_cache(runs: int = 1000):
+    """对比首轮问题未命中（调用模型）与命中回答缓存的耗时"""
+    from cache import TTLCache
+    from medical_ai import DeepSeekProvider, MedicalAI
+
+    with FakeOpenAIServer() as server:
+        medical_ai = MedicalAI(
+            DeepSeekProvider(api_key="sk-fake", base_url=server.url),
+            response_cache=TTLCache()
+        )
+
+        start = time.perf_counter()
+        medical_ai.get_medical_advice("头痛怎么办。", [])
+        miss = time.perf_counter() - start
+
+        start = time.perf_counter()
+        for _ in range(runs):
+            medical_ai.get_medical_advice("头痛怎么办？", [])
+        hit = (time.perf_counter() - start) / runs
+
+    print(f"未命中: {miss * 1000:10.1f} ms")
+    print(f"命中:   {hit * 1e6:10.1f} us")
+    print(f"统计:   {medical_ai.response_cache.stats()}")
+
+
+def bench_search(runs: int = 20, delay: float = 0.05, connect_delay: float = 0.15, fail_rate: float = 0.2):
+    """
+    对比三种搜索方式的单次耗时和新建连接数：
+    冷启动（每次新建会话，等同于原来的 requests.post）、连接复用、命中结果缓存；
+    以及上游间歇性返回 503 时，不重试与带退避重试的成功率
+
+    本机回环连接几乎没有握手开销，替身服务对每条新连接额外等待 connect_delay 秒，
+    模拟访问公网接口时的 TCP 和 TLS 握手。
+    """
+    import contextlib
+    import io
+    from cache import TTLCache
+    from search_service import SearchService
+
+    def timed(service, query):
+        start = time.perf_counter()
+        service.search(query)
+        return time.perf_counter() - start
+
+    with FakeSerperServer(delay=delay, connect_delay=connect_delay) as server:
+        connections = server.connection_count
+        cold = []
+        for i in range(runs):
+            service = SearchService("fake-key", base_url=server.search_url)
+            cold.append(timed(service, f"最新研究 {i}"))
+            service.close()
+        cold_connections, connections = server.connection_count - connections, server.connection_count
+
+        pooled_service = SearchService("fake-key", base_url=server.search_url)
+        timed(pooled_service, "预热连接")
+        connections = server.connection_count
+        pooled = [timed(pooled_service, f"最新研究 {i}") for i in range(runs)]
+        pooled_service.close()
+        pooled_connections = server.connection_count - connections
+
+        cached_service = SearchService("fake-key", base_url=server.search_url, cache=TTLCache())
+        timed(cached_service, "最新研究")
+        requests_before = server.request_count
+        cached = [timed(cached_service, "最新研究") for _ in range(runs)]
+        cached_service.close()
+        cached_requests = server.request_count - requests_before
+
+    # 成功率需要较多样本，这部分不等待服务端延迟
+    retry_runs = 200
+    with FakeSerperServer(delay=0, fail_rate=fail_rate) as server:
+        def success_rate(service):
+            # 失败的搜索会逐条打印错误，这里只关心成功率
+            with contextlib.redirect_stdout(io.StringIO()):
+                succeeded = sum(bool(service.search(f"流感疫苗 {i}")) for i in range(retry_runs))
+            service.close()
+            return succeeded / retry_runs
+
+        no_retry = success_rate(SearchService("fake-key", base_url=server.search_url, max_retries=0))
+        with_retry = success_rate(SearchService("fake-key", base_url=server.search_url))
+
+    print(f"服务端延迟 {delay * 1000:.0f} ms，新连接握手 {connect_delay * 1000:.0f} ms")
+    print(f"冷启动:   {statistics.median(cold) * 1000:8.2f} ms  新建连接 {cold_connections} 次 / {runs} 次搜索")
+    print(f"连接复用: {statistics.median(pooled) * 1000:8.2f} ms  新建连接 {pooled_connections} 次 / {runs} 次搜索")
+    print(f"缓存命中: {statistics.median(cached) * 1000:8.3f} ms  请求上游 {cached_requests} 次 / {runs} 次搜索")
+    print(f"上游 {fail_rate:.0%} 请求返回 503（{retry_runs} 次搜索）：不重试成功率 {no_retry:.1%}，"
+          f"重试后成功率 {with_retry:.1%}")
+
+
+def bench_pipeline(search_delay: float = 1.5, deadline: float = 0.5):
+    """对比搜索慢于截止时间时，各种编排方式下带搜索问题的总耗时"""
+    import asyncio
+    from medical_ai import DeepSeekProvider, MedicalAI
+    from search_service import SearchService
+
+    question = "高血压最新研究进展"
+    with FakeOpenAIServer() as llm, FakeSerperServer(delay=search_delay) as serper:
+        provider = DeepSeekProvider(api_key="sk-fake", base_url=llm.url)
+        search_service = SearchService("fake-key", base_url=serper.search_url)
+
+        def timed(medical_ai):
+            start = time.perf_counter()
+            medical_ai.get_medical_advice(question, [])
+            return time.perf_counter() - start
+
+        plain = timed(MedicalAI(provider))
+        sequential = timed(MedicalAI(provider, search_service, search_deadline=None))
+        bounded = timed(MedicalAI(provider, search_service, search_deadline=deadline))
+        speculative = timed(MedicalAI(provider, search_service, search_deadline=deadline, speculative_generation=True))
+
+        async def timed_async():
+            # 在协程内计时，排除 asyncio.run 退出时等待后台搜索线程的时间
+            async_ai = MedicalAI(provider, search_service, search_deadline=deadline, speculative_generation=True)
+            start = time.perf_counter()
+            await async_ai.aget_medical_advice(question, [])
+            return time.perf_counter() - start
+
+        async_speculative = asyncio.run(timed_async())
+
+    print(f"搜索延迟 {search_delay * 1000:.0f} ms，截止时间 {deadline * 1000:.0f} ms")
+    print(f"不搜索:             {plain * 1000:8.1f} ms")
+    print(f"串行搜索:           {sequential * 1000:8.1f} ms")
+    print(f"搜索截止时间:       {bounded * 1000:8.1f} ms")
+    print(f"截止时间+推测生成:  {speculative * 1000:8.1f} ms")
+    print(f"asyncio 推测生成:   {async_speculative * 1000:8.1f} ms")
+
+
+def bench_upload(size_mb: int = 32, runs: int = 5):
+    """通过本机回环对比整体读入内存上传与流式上传大文件的吞吐量"""
+    import os
+    import tempfile
+    from board_client import BoardClient, KIND_ASR
+
+    with tempfile.TemporaryDirectory() as tmp, FakeBoardServer(delay=0) as board:
+        path = os.path.join(tmp, "recording.wav")
+        with open(path, "wb") as f:
+            f.write(os.urandom(size_mb * 1024 * 1024))
+
+        client = BoardClient(*board.address)
+
+        def read_whole():
+            with open(path, "rb") as f:
+                client.request(KIND_ASR, f.read())
+
+        def streamed():
+            client.request_file(KIND_ASR, path)
+
+        for name, upload in (("整体读入", read_whole), ("流式上传", streamed)):
+            upload()  # 预热连接和页缓存
+            start = time.perf_counter()
+            for _ in range(runs):
+                upload()
+            elapsed = time.perf_counter() - start
+            print(f"{name}: {size_mb * runs / elapsed:8.1f} MB/s")
+
+        client.close()
+
+
+def bench_image(width: int = 4000, height: int = 3000):
+    """对比原先落盘翻转后上传原图与内存预处理后上传的字节数和耗时"""
+    import os
+    import tempfile
+    from PIL import Image, ImageDraw
+    from board_client import BoardClient, KIND_OCR
+    from image_preprocess import preprocess_image
+
+    # 合成一张带文字行的“就诊单”
+    image = Image.new("RGB", (width, height), "white")
+    draw = ImageDraw.Draw(image)
+    for y in range(height // 10, height * 9 // 10, height // 25):
+        draw.rectangle((width // 10, y, width * 9 // 10, y + height // 80), fill="black")
+
+    with tempfile.TemporaryDirectory() as tmp, FakeBoardServer(delay=0) as board:
+        client = BoardClient(*board.address)
+        path = os.path.join(tmp, "captured_avatar.jpg")
+
+        start = time.perf_counter()
+        image.save(path)
+        with Image.open(path) as img:
+            img.transpose(Image.FLIP_LEFT_RIGHT).save(path)
+        client.request_file(KIND_OCR, path)
+        legacy_time = time.perf_counter() - start
+        legacy_bytes = os.path.getsize(path)
+
+        start = time.perf_counter()
+        processed = preprocess_image(image, mirror=True)
+        client.request(KIND_OCR, processed.data, content_type=processed.content_type)
+        new_time = time.perf_counter() - start
+        client.close()
+
+    print(f"原流程:   发送 {legacy_bytes / 1024:8.1f} KB，耗时 {legacy_time * 1000:8.1f} ms")
+    print(f"内存预处理: 发送 {len(processed.data) / 1024:8.1f} KB，耗时 {new_time * 1000:8.1f} ms")
+    print(processed.report())
+
+
+def bench_audio(seconds: float = 30, sample_rate: int = 48000):
+    """对比直接上传浏览器录音与预处理后上传的字节数和耗时"""
+    import os
+    import tempfile
+    import wave
+    import numpy as np
+    from board_client import BoardClient, KIND_ASR
+    from audio_preprocess import preprocess_audio
+
+    # 合成一段双声道录音：首尾各有 1/4 时长的底噪，中间为“语音”
+    t = np.arange(int(seconds * sample_rate)) / sample_rate
+    voice = (t > seconds / 4) & (t < seconds * 3 / 4)
+    signal = 0.002 * np.random.randn(len(t))
+    signal[voice] += 0.4 * np.sin(2 * np.pi * 220 * t[voice]) * np.sin(2 * np.pi * 3 * t[voice])
+    stereo = (np.stack([signal, signal], axis=1) * 32767).astype('<i2')
+
+    with tempfile.TemporaryDirectory() as tmp, FakeBoardServer(delay=0) as board:
+        path = os.path.join(tmp, "recording.wav")
+        with wave.open(path, 'wb') as wav:
+            wav.setnchannels(2)
+            wav.setsampwidth(2)
+            wav.setframerate(sample_rate)
+            wav.writeframes(stereo.tobytes())
+
+        raw_bytes = os.path.getsize(path)
+        client = BoardClient(*board.address)
+        start = time.perf_counter()
+        client.request_file(KIND_ASR, path)
+        raw_time = time.perf_counter() - start
+        print(f"原始录音 发送 {raw_bytes / 1024:8.1f} KB，耗时 {raw_time * 1000:7.1f} ms")
+
+        for encoding in ("pcm16", "mulaw"):
+            start = time.perf_counter()
+            processed = preprocess_audio(path, encoding=encoding)
+            client.request(KIND_ASR, processed.data, content_type=processed.content_type)
+            elapsed = time.perf_counter() - start
+            print(f"{encoding:6s} 发送 {len(processed.data) / 1024:8.1f} KB，耗时 {elapsed * 1000:7.1f} ms，"
+                  f"压缩比 {raw_bytes / len(processed.data):4.1f}x")
+            print("       " + processed.report())
+        client.close()
+
+
+def bench_record(runs: int = 50, font_path: str = None):
+    """
+    对比病历生成的冷路径与缓存路径：
+    冷路径每次重新加载字体、绘制整页并以默认压缩级别保存（等同于原实现），
+    缓存路径复用字体和预渲染的页头页脚，只绘制可变内容
+    """
+    import os
+    import tempfile
+    from config import FONT_PATH
+    from medical_record_module import RecordRenderer, load_font
+    from text_layout import TextLayout
+
+    font_path = font_path or FONT_PATH
+    info = "姓名：张三\n性别：男\n年龄：35\n科室：内科"
+    answer = "我理解您描述的是头痛和头晕的症状。这可能与最近的工作压力和睡眠不足有关。" * 3
+
+    with tempfile.TemporaryDirectory() as tmp:
+        output = os.path.join(tmp, "record.png")
+
+        start = time.perf_counter()
+        for _ in range(runs):
+            load_font.cache_clear()
+            RecordRenderer(font_path=font_path, png_compress_level=6).render(info, answer, output)
+        cold = (time.perf_counter() - start) / runs
+
+        renderer = RecordRenderer(font_path=font_path)
+        renderer.render(info, answer, output)
+        start = time.perf_counter()
+        for _ in range(runs):
+            renderer.render(info, answer, output)
+        warm = (time.perf_counter() - start) / runs
+
+        # 长回答：排版耗时（首次测量字宽 vs 命中换行缓存）以及分页PDF
+        long_answer = answer * 20
+        max_width = renderer.width - renderer.margin * 2
+        start = time.perf_counter()
+        TextLayout(renderer.font).wrap(long_answer, max_width)
+        layout_cold = time.perf_counter() - start
+        start = time.perf_counter()
+        for _ in range(runs):
+            renderer.layout.wrap(long_answer, max_width)
+        layout_warm = (time.perf_counter() - start) / runs
+        start = time.perf_counter()
+        pages = renderer.render_pages(info, long_answer)
+        paginate = time.perf_counter() - start
+
+    print(f"冷路径:   {cold * 1000:8.2f} ms/份")
+    print(f"缓存路径: {warm * 1000:8.2f} ms/份")
+    print(f"长回答排版（{len(long_answer)} 字）: 首次 {layout_cold * 1000:.2f} ms，缓存 {layout_warm * 1000:.3f} ms")
+    print(f"长回答分页: {len(pages)} 页，{paginate * 1000:.2f} ms")
+
+
+def bench_tts(delay: float = 0.3, chars_per_second: float = 200):
+    """
+    对比语音合成的整段合成、逐句合成首段延迟和缓存命中耗时
+
+    合成引擎用固定网络延迟加按字数计时的替身代替，模拟 gTTS 的请求开销
+    """
+    import tempfile
+    from tts_service import TTSService
+
+    answer = ("我理解您描述的是头痛和头晕的症状。这可能与最近的工作压力和睡眠不足有关。"
+              "建议您保证充足的睡眠，适当进行户外运动，注意饮食清淡。如果症状持续或加重，请及时就医。") * 2
+
+    def fake_engine(text, path):
+        time.sleep(delay + len(text) / chars_per_second)
+        with open(path, "wb") as f:
+            f.write(text.encode("utf-8"))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        service = TTSService(cache_dir=tmp)
+        service._synthesize_gtts = fake_engine
+
+        start = time.perf_counter()
+        fake_engine(answer, f"{tmp}/whole.mp3")
+        whole = time.perf_counter() - start
+
+        start = time.perf_counter()
+        sentences = service.synthesize_sentences(answer)
+        next(sentences)
+        first = time.perf_counter() - start
+        count = 1 + len(list(sentences))
+        streamed = time.perf_counter() - start
+
+        start = time.perf_counter()
+        list(service.synthesize_sentences(answer))
+        cached = time.perf_counter() - start
+
+    print(f"整段合成（原实现，每次点击都合成）: {whole * 1000:8.1f} ms")
+    print(f"逐句合成 首段可播放:               {first * 1000:8.1f} ms")
+    print(f"逐句合成 全部 {count} 段:                {streamed * 1000:8.1f} ms")
+    print(f"再次播放（命中缓存）:              {cached * 1000:8.2f} ms")
+
+
+def bench_startup(modules=None, top: int = 10):
+    """
+    在全新的解释器中导入各模块，报告每个模块的导入耗时（python -X importtime），
+    并检查导入过程是否在工作目录中创建了文件
+    """
+    import os
+    import subprocess
+    import sys
+    import tempfile
+
+    modules = modules or ["audio_module", "medical_record_module", "ocr_task", "soundreg_task"]
+    project_dir = os.path.dirname(os.path.abspath(__file__))
+    project_modules = {name[:-3] for name in os.listdir(project_dir) if name.endswith(".py")}
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, PYTHONPATH=project_dir)
+        start = time.perf_counter()
+        result = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import " + ", ".join(modules)],
+            cwd=tmp, env=env, capture_output=True, text=True
+        )
+        wall = time.perf_counter() - start
+        created = sorted(os.listdir(tmp))
+
+    if result.returncode != 0:
+        print(result.stderr.strip().splitlines()[-1])
+        return
+
+    # 每行格式："import time: self [us] | cumulative | imported package"
+    costs = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        costs.append((int(cumulative) / 1e6, name.strip()))
+
+    print(f"解释器启动并导入 {', '.join(modules)}: {wall * 1000:.0f} ms")
+    print("项目模块（含其依赖的累计耗时）:")
+    for seconds, name in sorted((c for c in costs if c[1] in project_modules), reverse=True):
+        print(f"  {name:28s} {seconds * 1000:8.1f} ms")
+    print(f"第三方顶层模块耗时前 {top}:")
+    third_party = [c for c in costs if "." not in c[1] and c[1] not in project_modules
+                   and c[1] not in sys.stdlib_module_names and not c[1].startswith("_")
+                   and c[1] not in ("sitecustomize", "usercustomize")]
+    for seconds, name in sorted(third_party, reverse=True)[:top]:
+        print(f"  {name:28s} {seconds * 1000:8.1f} ms")
+    print(f"导入过程创建的文件: {', '.join(created) if created else '无'}")
+
+
+def bench_trigger(terms: int = 5000, runs: int = 2000):
+    """对比逐个关键词 in 查找全部命中词与 Aho–Corasick 单次扫描在不同词表规模下的判断耗时"""
+    import random
+    from search_trigger import SearchTrigger, DEFAULT_TRIGGER_TERMS
+
+    rng = random.Random(0)
+    questions = [
+        "我最近经常头痛，晚上睡不好，白天注意力也不集中，请问应该怎么调理？",
+        "听说治疗偏头痛有新药上市了，效果怎么样，有没有副作用？",
+        "不需要最新研究，告诉我感冒发烧在家怎么处理就可以。",
+    ]
+    print(f"{'词表规模':>8} {'逐词查找':>12} {'自动机':>12}")
+    for size in (len(DEFAULT_TRIGGER_TERMS), terms // 10, terms):
+        vocabulary = dict(DEFAULT_TRIGGER_TERMS)
+        while len(vocabulary) < size:
+            word = "".join(chr(rng.randint(0x4E00, 0x9FA5)) for _ in range(rng.randint(2, 5)))
+            vocabulary[word] = 1.0
+        keywords = list(vocabulary)
+        trigger = SearchTrigger(vocabulary)
+
+        start = time.perf_counter()
+        for i in range(runs):
+            question = questions[i % len(questions)]
+            # 计算加权得分需要找出全部命中词，不能在第一个命中处提前返回
+            [keyword for keyword in keywords if keyword in question]
+        naive = (time.perf_counter() - start) / runs
+
+        start = time.perf_counter()
+        for i in range(runs):
+            trigger.evaluate(questions[i % len(questions)])
+        automaton = (time.perf_counter() - start) / runs
+        print(f"{size:>8} {naive * 1e6:>10.1f}us {automaton * 1e6:>10.1f}us")
+
+
+def bench_knowledge(paragraphs: int = 20000, runs: int = 200, web_delay: float = 0.8):
+    """
+    在合成语料上建立本地资料索引，报告建索引、加载和检索耗时，
+    并与模拟网络延迟的 Serper 搜索对比
+    """
+    import os
+    import random
+    import tempfile
+    from knowledge_index import build_index, KnowledgeIndex
+    from search_service import SearchService
+
+    rng = random.Random(0)
+    diseases = ["偏头痛", "高血压", "糖尿病", "感冒", "胃炎", "失眠", "哮喘", "湿疹", "贫血", "颈椎病",
+                "甲状腺功能亢进", "冠心病", "肺炎", "痛风", "骨质疏松", "抑郁症", "鼻炎", "结膜炎"]
+    aspects = ["的常见症状包括", "的主要病因是", "的一线治疗药物有", "患者日常应注意", "的诊断标准为", "的预防措施包括"]
+    words = ["头痛", "乏力", "恶心", "发热", "咳嗽", "饮食清淡", "规律作息", "适量运动", "定期复查", "遵医嘱服药",
+             "血压监测", "血糖控制", "充足睡眠", "戒烟限酒", "补充水分", "避免劳累", "心理疏导", "抗生素"]
+    queries = [f"{rng.choice(diseases)}{rng.choice(['有什么症状', '怎么治疗', '要注意什么', '吃什么药'])}"
+               for _ in range(50)]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        source_dir = os.path.join(tmp, "knowledge")
+        os.makedirs(source_dir)
+        per_file = 100
+        for file_number in range(0, paragraphs, per_file):
+            disease = diseases[file_number // per_file % len(diseases)]
+            texts = []
+            for _ in range(min(per_file, paragraphs - file_number)):
+                # 药名随机生成以扩大词表
+                sentences = []
+                for _ in range(4):
+                    drug = "".join(chr(rng.randint(0x4E00, 0x9FA5)) for _ in range(3))
+                    sentences.append(f"{rng.choice(diseases) if rng.random() < 0.3 else disease}"
+                                     f"{rng.choice(aspects)}{'，'.join(rng.sample(words, 4))}，可选用{drug}片。")
+                texts.append("".join(sentences))
+            with open(os.path.join(source_dir, f"{file_number:06d}.md"), "w", encoding="utf-8") as f:
+                f.write(f"# {disease}\n\n" + "\n\n".join(texts))
+
+        index_dir = os.path.join(tmp, "index")
+        meta = build_index(source_dir, index_dir)
+        start = time.perf_counter()
+        index = KnowledgeIndex(index_dir)
+        load = time.perf_counter() - start
+
+        index.search(queries[0])
+        latencies = []
+        for i in range(runs):
+            start = time.perf_counter()
+            index.search(queries[i % len(queries)])
+            latencies.append(time.perf_counter() - start)
+        index.close()
+
+    with FakeSerperServer(delay=web_delay) as server:
+        service = SearchService("fake-key", base_url=server.search_url)
+        service.search("预热连接")
+        start = time.perf_counter()
+        service.search(queries[0])
+        web = time.perf_counter() - start
+        service.close()
+
+    latencies.sort()
+    print(f"语料: {meta['documents']} 个段落，{meta['terms']} 个词，建索引 {meta['build_seconds']:.2f} s")
+    print(f"加载索引（内存映射）: {load * 1000:8.2f} ms")
+    print(f"本地检索 p50:         {latencies[len(latencies) // 2] * 1000:8.2f} ms")
+    print(f"本地检索 p95:         {latencies[int(len(latencies) * 0.95)] * 1000:8.2f} ms")
+    print(f"网络搜索（模拟 {web_delay * 1000:.0f} ms 延迟）: {web * 1000:8.2f} ms")
+
+
+def bench_batch(items: int = 200, concurrency: int = 16, delay: float = 0.2, records: bool = False,
+                font_path: str = None):
+    """批量问诊串行与并发吞吐量对比，以及断点续跑时跳过已完成条目的耗时"""
+    import json
+    import os
+    import tempfile
+    from batch_runner import BatchRunner, read_items
+    from medical_ai import DeepSeekProvider, MedicalAI
+    from medical_record_module import RecordRenderer
+
+    renderer = RecordRenderer(font_path) if records and font_path else None
+    with FakeOpenAIServer(first_token_delay=delay, token_delay=0) as server, \
+            tempfile.TemporaryDirectory() as tmp:
+        input_path = os.path.join(tmp, "questions.jsonl")
+        with open(input_path, "w", encoding="utf-8") as f:
+            for i in range(items):
+                f.write(json.dumps({"id": f"q{i}", "question": f"头痛第{i}天怎么办？", "info": "姓名：张三"},
+                                   ensure_ascii=False) + "\n")
+
+        provider = DeepSeekProvider(api_key="sk-fake", base_url=server.url)
+        sequential_items = max(1, items // 10)
+        for label, workers, count, output in (
+            ("串行", 1, sequential_items, "sequential"),
+            (f"并发 {concurrency}", concurrency, items, "concurrent"),
+            ("断点续跑", concurrency, items, "concurrent"),
+        ):
+            runner = BatchRunner(MedicalAI(provider), os.path.join(tmp, output), workers, rate=None,
+                                 records=records, renderer=renderer)
+            rows = (item for index, item in zip(range(count), read_items(input_path)))
+            summary = runner.run(rows)
+            p50 = f"{summary['p50'] * 1000:7.1f} ms" if summary["p50"] is not None else "      -"
+            print(f"{label:<10} 完成 {summary['succeeded']:4d} 失败 {summary['failed']:3d} 跳过 {summary['skipped']:4d}  "
+                  f"耗时 {summary['seconds']:7.2f} s  吞吐 {summary['throughput']:7.1f} 条/s  p50 {p50}")
+
+
+def bench_resilience(requests: int = 300, concurrency: int = 8, slow_rate: float = 0.05,
+                     slow_delay: float = 2.0, fail_rate: float = 0.3):
+    """
+    大模型调用容错：
+    长尾请求下对冲前后的 p50/p95/p99，间歇性 5xx 下重试前后的成功率，
+    以及上游完全不可用时熔断后的失败耗时
+    """
+    from medical_ai import DeepSeekProvider, is_failed_response
+    from resilience import RetryPolicy
+
+    def run(provider, count, workers):
+        def one(_):
+            start = time.perf_counter()
+            answer = provider.generate_response("头痛怎么办。", [])
+            return time.perf_counter() - start, not is_failed_response(answer)
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            return list(executor.map(one, range(count)))
+
+    def quantiles(results):
+        latencies = sorted(seconds for seconds, _ in results)
+        return [latencies[min(len(latencies) - 1, int(len(latencies) * q))] * 1000 for q in (0.5, 0.95, 0.99)]
+
+    print(f"长尾：{slow_rate:.0%} 的请求额外延迟 {slow_delay * 1000:.0f} ms")
+    for hedge in (False, True):
+        with FakeOpenAIServer(first_token_delay=0.1, token_delay=0, slow_rate=slow_rate, slow_delay=slow_delay) as server:
+            provider = DeepSeekProvider(api_key="sk-fake", base_url=server.url, hedge=hedge)
+            provider.caller.hedge_min_delay = 0.0  # 基准中直接使用 p95，不设下限
+            results = run(provider, requests, concurrency)
+            p50, p95, p99 = quantiles(results)
+            stats = provider.caller.stats()
+            label = "对冲" if hedge else "无对冲"
+            print(f"  {label:<6} p50 {p50:7.1f} ms  p95 {p95:7.1f} ms  p99 {p99:7.1f} ms  "
+                  f"对冲 {stats['hedges']} 次（胜出 {stats['hedge_wins']}），上游请求 {server.request_count}")
+
+    print(f"间歇故障：{fail_rate:.0%} 的请求返回 503")
+    for retries in (0, 2):
+        with FakeOpenAIServer(first_token_delay=0.05, token_delay=0, fail_rate=fail_rate) as server:
+            provider = DeepSeekProvider(api_key="sk-fake", base_url=server.url, hedge=False)
+            provider.caller.retry = RetryPolicy(max_retries=retries)
+            provider.breaker.failure_threshold = requests  # 只观察重试
+            results = run(provider, requests // 3, concurrency)
+            success = sum(ok for _, ok in results) / len(results)
+            p50, p95, _ = quantiles(results)
+            print(f"  重试 {retries} 次  成功率 {success:6.1%}  p50 {p50:7.1f} ms  p95 {p95:7.1f} ms")
+
+    print("上游不可用：全部请求返回 503")
+    with FakeOpenAIServer(first_token_delay=0.05, token_delay=0, fail_rate=1.0) as server:
+        provider = DeepSeekProvider(api_key="sk-fake", base_url=server.url, hedge=False)
+        results = run(provider, 30, 1)
+        stats = provider.caller.stats()
+        first = statistics.mean(seconds for seconds, _ in results[:5]) * 1000
+        last = statistics.mean(seconds for seconds, _ in results[-10:]) * 1000
+        print(f"  熔断前平均 {first:7.1f} ms/次  熔断后平均 {last:7.3f} ms/次  "
+              f"熔断器 {stats['breaker']}，拒绝 {stats['breaker_rejected']} 次，上游请求 {server.request_count}")
+
+
+def bench_metrics(runs: int = 100000):
+    """单个阶段计时（含直方图更新）的开销，以及开启追踪导出后的开销和 /metrics 渲染耗时"""
+    import os
+    import tempfile
+    import metrics
+
+    def per_span():
+        start = time.perf_counter()
+        for _ in range(runs):
+            with metrics.span("bench"):
+                pass
+        return (time.perf_counter() - start) / runs
+
+    start = time.perf_counter()
+    for _ in range(runs):
+        pass
+    baseline = (time.perf_counter() - start) / runs
+
+    metrics.configure_tracing(None)
+    plain = per_span()
+    with tempfile.TemporaryDirectory() as tmp:
+        exporter = metrics.configure_tracing(os.path.join(tmp, "traces.jsonl"))
+        traced = per_span()
+        metrics.configure_tracing(None)
+        dropped = exporter.dropped
+
+    start = time.perf_counter()
+    text = metrics.REGISTRY.render()
+    render = time.perf_counter() - start
+
+    print(f"空循环:             {baseline * 1e6:8.2f} µs/次")
+    print(f"阶段计时:           {plain * 1e6:8.2f} µs/次")
+    print(f"阶段计时 + 追踪导出: {traced * 1e6:8.2f} µs/次（队列满丢弃 {dropped} 条）")
+    print(f"/metrics 渲染:      {render * 1000:8.2f} ms，{len(text)} 字节")
+
+
+LOAD_SCENARIOS = ("text", "audio", "ocr", "record")
+LOAD_QUESTIONS = ["头痛怎么办", "感冒发烧吃什么药", "高血压最新研究进展", "失眠有什么治疗方法", "糖尿病饮食要注意什么"]
+
+
+def _percentiles(latencies):
+    ordered = sorted(latencies)
+    if not ordered:
+        return {"p50": None, "p95": None, "p99": None}
+    return {name: ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+            for name, q in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99))}
+
+
+def bench_load(requests: int = 200, concurrency: int = 16, scenarios=None, board_delay: float = 0.1,
+               first_token_delay: float = 0.2, token_delay: float = 0.01, search_delay: float = 0.3,
+               font_path: str = None, max_p95=None, json_path: str = None) -> bool:
+    """
+    端到端负载测试：开发板、大模型和 Serper 均由本地替身服务代替，
+    以给定并发分别驱动 text_process、audio_process、ocr_process（界面的 ocr_handler）
+    和 generate_record_files（界面的病历按钮），报告吞吐量、p50/p95/p99 和各阶段耗时分布
+
+    Args:
+        max_p95: {场景: 毫秒}，任一场景的 p95 超过阈值或出现错误时返回 False，可用于性能回归检查
+
+    Returns:
+        是否通过阈值检查
+    """
+    import json
+    import os
+    import tempfile
+    import wave
+    import numpy as np
+    from PIL import Image
+    import metrics
+    import audio_module
+    import board_client
+    import medical_record_module
+    import patient_store
+    import temp_manager
+    from medical_ai import DeepSeekProvider, MedicalAI, is_failed_response
+    from ocr_task import ocr_process
+    from search_service import SearchService
+
+    scenarios = list(scenarios or LOAD_SCENARIOS)
+    max_p95 = max_p95 or {}
+
+    with tempfile.TemporaryDirectory() as tmp, \
+            FakeBoardServer(delay=board_delay) as board, \
+            FakeOpenAIServer(first_token_delay=first_token_delay, token_delay=token_delay) as llm, \
+            FakeSerperServer(delay=search_delay) as serper:
+        previous_client = board_client.set_board_client(board_client.BoardClient(*board.address))
+        provider = DeepSeekProvider(api_key="sk-fake", base_url=llm.url)
+        previous_ai = audio_module.set_medical_ai(
+            MedicalAI(provider, SearchService("fake-key", base_url=serper.search_url))
+        )
+        # 问诊记录写入临时数据库，不混入真实的患者档案
+        previous_store = patient_store.set_patient_store(
+            patient_store.PatientStore(os.path.join(tmp, "patients.sqlite3"))
+        )
+        # 病历图片和 PDF 也写入临时目录，不占用真实的 TEMP_DIR
+        previous_temp = temp_manager.set_temp_manager(temp_manager.TempFileManager(os.path.join(tmp, "temp")))
+        replace_renderer = bool(font_path)
+        if not font_path and "record" in scenarios and not os.path.exists(medical_record_module.FONT_PATH):
+            # 没有中文字体时改用 Pillow 内置字体：中文显示为方框，但排版、绘制和编码的耗时仍有参考价值
+            print(f"未找到字体 {medical_record_module.FONT_PATH}，病历场景改用 Pillow 内置字体（可用 --font 指定中文字体）")
+            replace_renderer = True
+        previous_renderer = None
+        if replace_renderer:
+            previous_renderer = medical_record_module.set_record_renderer(
+                medical_record_module.RecordRenderer(font_path or None)
+            )
+
+        # 3 秒 16 kHz 语音和一张 1600x1200 的就诊单照片
+        wav_path = os.path.join(tmp, "question.wav")
+        with wave.open(wav_path, "wb") as f:
+            f.setnchannels(1)
+            f.setsampwidth(2)
+            f.setframerate(16000)
+            t = np.arange(48000) / 16000
+            f.writeframes((np.sin(2 * np.pi * 220 * t) * 8000).astype(np.int16).tobytes())
+        image = Image.effect_noise((1600, 1200), 40).convert("RGB")
+        answer = provider.generate_response("头痛怎么办", [])
+
+        def run_text(i):
+            response = audio_module.text_process(LOAD_QUESTIONS[i % len(LOAD_QUESTIONS)], f"load-text-{i}")
+            return not is_failed_response(response) and not response.startswith((audio_module.BUSY_MESSAGE, "处理出错"))
+
+        def run_audio(i):
+            question, response = audio_module.audio_process(wav_path, f"load-audio-{i}")
+            return response != "无法提供建议" and not is_failed_response(response)
+
+        def run_ocr(i):
+            return ocr_process(image, "手动上传") == board.results[board_client.KIND_OCR]
+
+        def run_record(i):
+            record_path, pdf_path = medical_record_module.generate_record_files(
+                board.results[board_client.KIND_OCR], answer, f"load-record-{i}"
+            )
+            # 失败时返回的是模板图片，而不是本次请求的临时文件
+            return pdf_path is not None and os.path.basename(record_path or "").startswith("record")
+
+        runners = {"text": run_text, "audio": run_audio, "ocr": run_ocr, "record": run_record}
+        results = {}
+        try:
+            for scenario in scenarios:
+                metrics.REGISTRY.reset()
+                latencies, errors = [], 0
+
+                def one(i, run=runners[scenario]):
+                    start = time.perf_counter()
+                    try:
+                        ok = run(i)
+                    except Exception as e:
+                        print(f"{scenario} 请求出错: {str(e)}")
+                        ok = False
+                    return time.perf_counter() - start, ok
+
+                start = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=concurrency) as executor:
+                    outcomes = list(executor.map(one, range(requests)))
+                elapsed = time.perf_counter() - start
+                for seconds, ok in outcomes:
+                    latencies.append(seconds)
+                    errors += not ok
+                results[scenario] = {
+                    "requests": requests,
+                    "errors": errors,
+                    "seconds": elapsed,
+                    "throughput": requests / elapsed,
+                    **_percentiles(latencies),
+                    "stages": metrics.stage_summary(),
+                }
+        finally:
+            board_client.set_board_client(previous_client).close()
+            audio_module.set_medical_ai(previous_ai)
+            patient_store.set_patient_store(previous_store).close()
+            temp_manager.set_temp_manager(previous_temp)
+            if replace_renderer:
+                medical_record_module.set_record_renderer(previous_renderer)
+
+    passed = True
+    print(f"\n并发 {concurrency}，每个场景 {requests} 个请求（开发板 {board_delay * 1000:.0f} ms，"
+          f"首字 {first_token_delay * 1000:.0f} ms，搜索 {search_delay * 1000:.0f} ms）")
+    print(f"{'场景':<8}{'吞吐(req/s)':>12}{'错误':>6}{'p50(ms)':>10}{'p95(ms)':>10}{'p99(ms)':>10}")
+    for scenario, result in results.items():
+        print(f"{scenario:<8}{result['throughput']:>12.1f}{result['errors']:>6}"
+              f"{result['p50'] * 1000:>10.1f}{result['p95'] * 1000:>10.1f}{result['p99'] * 1000:>10.1f}")
+        for stage, summary in sorted(result["stages"].items(), key=lambda item: -(item[1]["p95"] or 0)):
+            print(f"    {stage:<14} {summary['count']:>6} 次  错误 {summary['errors']:>4.0f}  "
+                  f"p50 {summary['p50'] * 1000:8.1f} ms  p95 {summary['p95'] * 1000:8.1f} ms")
+        limit = max_p95.get(scenario)
+        if result["errors"] or (limit is not None and result["p95"] * 1000 > limit):
+            passed = False
+            print(f"    未通过：错误 {result['errors']} 个，p95 阈值 {limit} ms")
+
+    if json_path:
+        with open(json_path, "w", encoding="utf-8") as f:
+            json.dump({"concurrency": concurrency, "passed": passed, "scenarios": results}, f,
+                      ensure_ascii=False, indent=2)
+    return passed
+
+
+def bench_patients(patients: int = 2000, visits: int = 20000, runs: int = 500):
+    """
+    患者档案写入吞吐量（请求线程入队耗时与后台落盘耗时），
+    以及既往就诊摘要、全文检索的查询延迟
+    """
+    import os
+    import random
+    import tempfile
+    from patient_store import PatientStore
+
+    rng = random.Random(0)
+    surnames = "赵钱孙李周吴郑王冯陈褚卫蒋沈韩杨朱秦尤许何吕施张"
+    infos = [f"姓名：{rng.choice(surnames)}{chr(rng.randint(0x4E00, 0x9FA5))}{chr(rng.randint(0x4E00, 0x9FA5))} "
+             f"性别：{rng.choice('男女')} 年龄：{rng.randint(5, 90)} 科室：内科 病历号：{100000 + i}"
+             for i in range(patients)]
+    answers = ["这可能与睡眠不足和压力有关。建议保证充足睡眠，适当运动。",
+               "可能是病毒性感冒引起。建议多喝水，注意休息，必要时服用退烧药。",
+               "建议控制饮食中的糖分摄入。定期监测血糖，遵医嘱服药。",
+               "血压偏高需要低盐饮食。规律服药并定期复查。"]
+
+    with tempfile.TemporaryDirectory() as tmp:
+        store = PatientStore(os.path.join(tmp, "patients.sqlite3"), queue_size=visits)
+        start = time.perf_counter()
+        for i in range(visits):
+            store.record_visit(infos[i % patients], LOAD_QUESTIONS[i % len(LOAD_QUESTIONS)] + "。",
+                               answers[i % len(answers)], f"session-{i}", created_at=1.7e9 + i)
+        enqueue = time.perf_counter() - start
+        store.flush()
+        written = time.perf_counter() - start
+
+        def measure(fn):
+            latencies = []
+            for i in range(runs):
+                start = time.perf_counter()
+                fn(i)
+                latencies.append(time.perf_counter() - start)
+            return _percentiles(latencies)
+
+        summary = measure(lambda i: store.prior_visit_summary(infos[rng.randrange(patients)]))
+        search = measure(lambda i: store.search(LOAD_QUESTIONS[i % len(LOAD_QUESTIONS)], limit=10))
+        scoped = measure(lambda i: store.search("失眠", limit=10, info=infos[rng.randrange(patients)]))
+        stats = store.stats()
+        store.close()
+
+    print(f"写入 {visits} 次问诊（{patients} 位患者），写入失败 {stats['failed']}，丢弃 {stats['dropped']}")
+    print(f"请求线程入队:   {enqueue / visits * 1e6:8.2f} µs/次")
+    print(f"后台落盘吞吐量: {visits / written:8.0f} 次/s")
+    for name, result in (("既往就诊摘要", summary), ("全文检索", search), ("单个患者检索", scoped)):
+        print(f"{name}: p50 {result['p50'] * 1000:6.2f} ms  p95 {result['p95'] * 1000:6.2f} ms")
+
+
+def bench_asr(seconds: float = 5.0, chunk: float = 0.5, rtf: float = 0.2, delay: float = 0.05, runs: int = 3):
+    """
+    整段上传与边录边传两种语音识别方式，从说话结束到得到识别结果的延迟对比
+
+    录音按真实时间分块送入；开发板替身每秒音频需要 rtf 秒处理，结束后再用 delay 秒给出结果。
+    """
+    import numpy as np
+    from board_client import BoardClient, KIND_ASR, KIND_PING
+    from streaming_asr import StreamingRecognizer
+    from audio_preprocess import to_mono, resample, encode_wav
+    from config import AUDIO_SAMPLE_RATE
+
+    sample_rate = 48000
+    rng = np.random.default_rng(0)
+    chunks = [(rng.standard_normal((int(sample_rate * chunk), 2)) * 3000).astype(np.int16)
+              for _ in range(int(seconds / chunk))]
+
+    with FakeBoardServer(delay=delay, asr_rtf=rtf) as board:
+        client = BoardClient(*board.address)
+        client.request(KIND_PING, b"")
+
+        batch, streaming, partial_counts = [], [], []
+        for _ in range(runs):
+            # 整段上传：录音结束后才预处理并发送
+            for _ in chunks:
+                time.sleep(chunk)
+            start = time.perf_counter()
+            samples = resample(to_mono(np.concatenate(chunks).astype(np.float32) / 32768), sample_rate,
+                               AUDIO_SAMPLE_RATE)
+            client.request(KIND_ASR, encode_wav(samples, AUDIO_SAMPLE_RATE))
+            batch.append(time.perf_counter() - start)
+
+            # 边录边传：每块录音到达即发送
+            recognizer = StreamingRecognizer(client)
+            partials = set()
+            for piece in chunks:
+                time.sleep(chunk)
+                partials.add(recognizer.feed(piece, sample_rate))
+            start = time.perf_counter()
+            recognizer.finish()
+            streaming.append(time.perf_counter() - start)
+            partial_counts.append(len(partials - {""}))
+        client.close()
+
+    print(f"语音 {seconds:.1f} s，分块 {chunk:.2f} s，开发板处理 {rtf:.2f} s/每秒音频 + {delay * 1000:.0f} ms")
+    print(f"整段上传  说话结束到识别结果: {statistics.median(batch) * 1000:8.1f} ms")
+    print(f"边录边传  说话结束到识别结果: {statistics.median(streaming) * 1000:8.1f} ms"
+          f"（录音过程中显示 {statistics.median(partial_counts):.0f} 次中间结果）")
+
+
+def bench_boards(board_counts=(1, 2, 4), requests: int = 200, delay: float = 0.05, capacity: int = 2,
+                 concurrency: int = 32):
+    """
+    开发板集群：吞吐量随开发板数量的变化，一块开发板宕机时的摘除与恢复，以及过慢开发板的摘除
+
+    每块替身开发板同时只处理 capacity 个请求，模拟开发板的算力上限。
+    """
+    from collections import Counter
+    from board_client import KIND_OCR
+    from board_pool import BoardPool
+
+    def run(pool, count):
+        """并发发送 count 个 OCR 请求，返回 (耗时, 失败数)"""
+        def task(_):
+            try:
+                pool.request(KIND_OCR, b"image")
+                return 0
+            except Exception:
+                return 1
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            failed = sum(executor.map(task, range(count)))
+        return time.perf_counter() - start, failed
+
+    print(f"每块开发板同时处理 {capacity} 个请求，每个请求 {delay * 1000:.0f} ms，并发 {concurrency}")
+    baseline = None
+    for count in board_counts:
+        boards = [FakeBoardServer(delay=delay, capacity=capacity).start() for _ in range(count)]
+        pool = BoardPool([board.address for board in boards], health_interval=0)
+        run(pool, concurrency)
+        elapsed, failed = run(pool, requests)
+        pool.close()
+        for board in boards:
+            board.stop()
+        throughput = requests / elapsed
+        baseline = baseline or throughput / count
+        print(f"{count} 块开发板: {throughput:8.1f} req/s（单块的 {throughput / baseline:4.2f} 倍），失败 {failed}")
+
+    # 一块开发板宕机：连接失败的请求转给其他开发板，连续失败后摘除；重新启动后经探测恢复
+    boards = [FakeBoardServer(delay=delay, capacity=capacity).start() for _ in range(3)]
+    addresses = [board.address for board in boards]
+    pool = BoardPool(addresses, health_interval=0.2, eject_duration=0.5, readmit_probes=2)
+    run(pool, concurrency)
+    boards[0].stop()
+    start = time.perf_counter()
+    elapsed, failed = run(pool, requests)
+    ejected = not pool.stats()[f"{addresses[0][0]}:{addresses[0][1]}"]["healthy"]
+    print(f"宕机一块（共 3 块）: {requests / elapsed:8.1f} req/s，失败 {failed}，已摘除: {ejected}")
+    boards[0] = FakeBoardServer(delay=delay, capacity=capacity, port=addresses[0][1]).start()
+    name = f"{addresses[0][0]}:{addresses[0][1]}"
+    while not pool.stats()[name]["healthy"] and time.perf_counter() - start < 10:
+        time.sleep(0.05)
+    print(f"重新启动后恢复: {pool.stats()[name]['healthy']}（宕机后 {time.perf_counter() - start:.2f} s）")
+    pool.close()
+    for board in boards:
+        board.stop()
+
+    # 一块开发板过慢：移动平均耗时超过其他开发板中位数的 3 倍后摘除
+    boards = [FakeBoardServer(delay=delay, capacity=capacity).start() for _ in range(2)]
+    boards.append(FakeBoardServer(delay=delay * 10, capacity=capacity).start())
+    pool = BoardPool([board.address for board in boards], health_interval=0)
+    run(pool, requests)
+    served = Counter({f"{board.address[0]}:{board.address[1]}": board.request_count for board in boards})
+    slow = f"{boards[2].address[0]}:{boards[2].address[1]}"
+    print(f"过慢开发板处理的请求: {served[slow]} / {requests}，已摘除: {not pool.stats()[slow]['healthy']}")
+    pool.close()
+    for board in boards:
+        board.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="智慧医疗系统离线性能基准测试")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    ttft = subparsers.add_parser("ttft", help="LLM 流式与非流式首字延迟对比")
+    ttft.add_argument("--runs", type=int, default=5)
+    ttft.add_argument("--first-token-delay", type=float, default=0.2)
+    ttft.add_argument("--token-delay", type=float, default=0.02)
+
+    board = subparsers.add_parser("board", help="开发板长连接多路复用吞吐量")
+    board.add_argument("--requests", type=int, default=50)
+    board.add_argument("--concurrency", type=int, default=10)
+    board.add_argument("--delay", type=float, default=0.1)
+
+    cache = subparsers.add_parser("cache", help="回答缓存命中与未命中耗时对比")
+    cache.add_argument("--runs", type=int, default=1000)
+
+    search = subparsers.add_parser("search", help="搜索服务冷启动、连接复用与缓存命中耗时对比")
+    search.add_argument("--runs", type=int, default=20)
+    search.add_argument("--delay", type=float, default=0.05)
+    search.add_argument("--connect-delay", type=float, default=0.15, help="模拟的新连接握手耗时（秒）")
+    search.add_argument("--fail-rate", type=float, default=0.2, help="上游返回 503 的请求比例")
+
+    pipeline = subparsers.add_parser("pipeline", help="搜索与生成的串行、截止时间、推测执行耗时对比")
+    pipeline.add_argument("--search-delay", type=float, default=1.5)
+    pipeline.add_argument("--deadline", type=float, default=0.5)
+
+    upload = subparsers.add_parser("upload", help="大文件整体读入与流式上传的吞吐量对比")
+    upload.add_argument("--size-mb", type=int, default=32)
+    upload.add_argument("--runs", type=int, default=5)
+
+    image = subparsers.add_parser("image", help="OCR 图像预处理前后的上传字节数与耗时")
+    image.add_argument("--width", type=int, default=4000)
+    image.add_argument("--height", type=int, default=3000)
+
+    audio = subparsers.add_parser("audio", help="语音预处理前后的上传字节数与耗时")
+    audio.add_argument("--seconds", type=float, default=30)
+    audio.add_argument("--sample-rate", type=int, default=48000)
+
+    record = subparsers.add_parser("record", help="病历生成冷路径与缓存路径耗时对比")
+    record.add_argument("--runs", type=int, default=50)
+    record.add_argument("--font", default=None, help="字体路径，默认使用 config.FONT_PATH")
+
+    tts = subparsers.add_parser("tts", help="语音合成逐句流式与缓存命中耗时")
+    tts.add_argument("--delay", type=float, default=0.3, help="每次合成请求的固定延迟（秒）")
+
+    startup = subparsers.add_parser("startup", help="各模块导入耗时与导入副作用检查")
+    startup.add_argument("--modules", nargs="+", default=None)
+
+    trigger = subparsers.add_parser("trigger", help="搜索触发判断耗时随词表规模的变化")
+    trigger.add_argument("--terms", type=int, default=5000)
+    trigger.add_argument("--runs", type=int, default=2000)
+
+    knowledge = subparsers.add_parser("knowledge", help="本地资料索引与网络搜索的检索耗时对比")
+    knowledge.add_argument("--paragraphs", type=int, default=20000, help="生成的资料自然段数，建索引时相邻短段会合并")
+    knowledge.add_argument("--runs", type=int, default=200)
+    knowledge.add_argument("--web-delay", type=float, default=0.8)
+
+    batch = subparsers.add_parser("batch", help="批量离线问诊的串行与并发吞吐量对比")
+    batch.add_argument("--items", type=int, default=200)
+    batch.add_argument("--concurrency", type=int, default=16)
+    batch.add_argument("--delay", type=float, default=0.2, help="模拟大模型每次请求的延迟（秒）")
+    batch.add_argument("--records", action="store_true", help="同时生成病历图片")
+    batch.add_argument("--font", default=None, help="字体路径，默认使用 config.FONT_PATH")
+
+    resilience = subparsers.add_parser("resilience", help="大模型调用的对冲、重试与熔断效果")
+    resilience.add_argument("--requests", type=int, default=300)
+    resilience.add_argument("--concurrency", type=int, default=8)
+    resilience.add_argument("--slow-rate", type=float, default=0.05)
+    resilience.add_argument("--slow-delay", type=float, default=2.0)
+    resilience.add_argument("--fail-rate", type=float, default=0.3)
+
+    metrics_parser = subparsers.add_parser("metrics", help="阶段计时与追踪导出的开销")
+    metrics_parser.add_argument("--runs", type=int, default=100000)
+
+    load = subparsers.add_parser("load", help="端到端负载测试（文本、语音、OCR、病历），可设置 p95 阈值作为回归检查")
+    load.add_argument("--requests", type=int, default=200, help="每个场景的请求数")
+    load.add_argument("--concurrency", type=int, default=16)
+    load.add_argument("--scenarios", nargs="+", choices=LOAD_SCENARIOS, default=None)
+    load.add_argument("--board-delay", type=float, default=0.1)
+    load.add_argument("--first-token-delay", type=float, default=0.2)
+    load.add_argument("--token-delay", type=float, default=0.01)
+    load.add_argument("--search-delay", type=float, default=0.3)
+    load.add_argument("--font", default=None, help="病历字体路径，默认使用 config.FONT_PATH")
+    load.add_argument("--max-p95", nargs="+", default=[], metavar="场景=毫秒",
+                      help="p95 阈值，超出或出现错误时以状态码 1 退出")
+    load.add_argument("--json", default=None, help="结果写入 JSON 文件")
+
+    patients = subparsers.add_parser("patients", help="患者档案写入吞吐量与既往就诊查询延迟")
+    patients.add_argument("--patients", type=int, default=2000)
+    patients.add_argument("--visits", type=int, default=20000)
+    patients.add_argument("--runs", type=int, default=500)
+
+    asr = subparsers.add_parser("asr", help="整段上传与流式语音识别的识别延迟对比")
+    asr.add_argument("--seconds", type=float, default=5.0, help="语音时长（秒）")
+    asr.add_argument("--chunk", type=float, default=0.5, help="流式发送的分块时长（秒）")
+    asr.add_argument("--rtf", type=float, default=0.2, help="开发板处理每秒音频所需的时间（秒）")
+    asr.add_argument("--delay", type=float, default=0.05, help="开发板给出最终结果的固定延迟（秒）")
+    asr.add_argument("--runs", type=int, default=3)
+
+    boards = subparsers.add_parser("boards", help="开发板集群的吞吐量扩展、宕机摘除与恢复、过慢摘除")
+    boards.add_argument("--boards", type=int, nargs="+", default=[1, 2, 4])
+    boards.add_argument("--requests", type=int, default=200)
+    boards.add_argument("--delay", type=float, default=0.05)
+    boards.add_argument("--capacity", type=int, default=2, help="每块开发板同时处理的请求数")
+    boards.add_argument("--concurrency", type=int, default=32)
+
+    args = parser.parse_args()
+    if args.command == "ttft":
+        bench_ttft(args.runs, args.first_token_delay, args.token_delay)
+    elif args.command == "board":
+        bench_board(args.requests, args.concurrency, args.delay)
+    elif args.command == "cache":
+        bench_cache(args.runs)
+    elif args.command == "search":
+        bench_search(args.runs, args.delay, args.connect_delay, args.fail_rate)
+    elif args.command == "pipeline":
+        bench_pipeline(args.search_delay, args.deadline)
+    elif args.command == "upload":
+        bench_upload(args.size_mb, args.runs)
+    elif args.command == "image":
+        bench_image(args.width, args.height)
+    elif args.command == "audio":
+        bench_audio(args.seconds, args.sample_rate)
+    elif args.command == "record":
+        bench_record(args.runs, args.font)
+    elif args.command == "tts":
+        bench_tts(args.delay)
+    elif args.command == "startup":
+        bench_startup(args.modules)
+    elif args.command == "trigger":
+        bench_trigger(args.terms, args.runs)
+    elif args.command == "knowledge":
+        bench_knowledge(args.paragraphs, args.runs, args.web_delay)
+    elif args.command == "batch":
+        bench_batch(args.items, args.concurrency, args.delay, args.records, args.font)
+    elif args.command == "resilience":
+        bench_resilience(args.requests, args.concurrency, args.slow_rate, args.slow_delay, args.fail_rate)
+    elif args.command == "metrics":
+        bench_metrics(args.runs)
+    elif args.command == "load":
+        max_p95 = {name: float(value) for name, value in (item.split("=", 1) for item in args.max_p95)}
+        passed = bench_load(args.requests, args.concurrency, args.scenarios, args.board_delay,
+                            args.first_token_delay, args.token_delay, args.search_delay,
+                            args.font, max_p95, args.json)
+        if not passed:
+            raise SystemExit(1)
+    elif args.command == "patients":
+        bench_patients(args.patients, args.visits, args.runs)
+    elif args.command == "asr":
+        bench_asr(args.seconds, args.chunk, args.rtf, args.delay, args.runs)
+    elif args.command == "boards":
+        bench_boards(args.boards, args.requests, args.delay, args.capacity, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,450 @@
+"""
+开发板传输客户端
+
+与开发板之间维持一条长连接，所有 OCR/ASR 请求复用该连接并发发送。
+每个请求携带唯一的请求编号，开发板按编号回复，由后台分发线程将结果
+交还给对应的调用方，因此多个用户可以同时识别而不会互相串结果。
+
+帧格式（网络字节序）：
+    magic(2) | version(1) | kind(1) | status(1) | content_type(1) | request_id(4) | length(8) | payload
+
+文件通过 socket.sendfile 分块发送（支持时由内核零拷贝），不会整体读入内存。
+
+流式请求（KIND_ASR_STREAM）在同一请求编号下连续发送多帧数据，数据为空的帧表示结束，
+状态为 STATUS_ERROR 的空帧表示放弃。开发板可随时回复 STATUS_PARTIAL 的中间结果，
+最后回复一帧 STATUS_OK（或 STATUS_ERROR）的最终结果。
+"""
+import itertools
+import os
+import selectors
+import socket
+import struct
+import threading
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+from typing import BinaryIO, Callable, Dict, Optional, Tuple
+
+from config import OCR_SERVER_IP, OCR_SERVER_PORT, BOARD_CONNECT_TIMEOUT, BOARD_REQUEST_TIMEOUT, BOARD_SEND_TIMEOUT
+from metrics import span
+
+MAGIC = b"MA"
+PROTOCOL_VERSION = 1
+HEADER = struct.Struct("!2sBBBBIQ")
+RECV_CHUNK_SIZE = 256 * 1024
+
+# 请求类型
+KIND_OCR = 1
+KIND_ASR = 2
+KIND_PING = 3
+KIND_ASR_STREAM = 4
+
+# 回复状态
+STATUS_OK = 0
+STATUS_ERROR = 1
+STATUS_PARTIAL = 2   # 流式请求的中间结果，之后还会有最终结果
+
+# 数据类型
+CONTENT_TYPE_OCTET_STREAM = 0
+CONTENT_TYPE_TEXT = 1
+CONTENT_TYPE_JPEG = 2
+CONTENT_TYPE_PNG = 3
+CONTENT_TYPE_WAV = 4
+CONTENT_TYPE_PCM16 = 5   # 无文件头的 16 位小端单声道 PCM，采样率为 AUDIO_SAMPLE_RATE
+
+# 各请求类型对应的指标阶段名
+_STAGES = {KIND_OCR: "board_ocr", KIND_ASR: "board_asr", KIND_PING: "board_ping", KIND_ASR_STREAM: "board_asr_final"}
+
+_CONTENT_TYPES_BY_EXTENSION = {
+    ".jpg": CONTENT_TYPE_JPEG,
+    ".jpeg": CONTENT_TYPE_JPEG,
+    ".png": CONTENT_TYPE_PNG,
+    ".wav": CONTENT_TYPE_WAV,
+    ".txt": CONTENT_TYPE_TEXT,
+}
+
+
+def guess_content_type(file_path: str) -> int:
+    """根据文件扩展名推断数据类型"""
+    extension = os.path.splitext(file_path)[1].lower()
+    return _CONTENT_TYPES_BY_EXTENSION.get(extension, CONTENT_TYPE_OCTET_STREAM)
+
+
+class BoardError(Exception):
+    """开发板返回错误或连接异常"""
+    pass
+
+
+class BoardConnectionError(BoardError):
+    """与开发板的连接断开，等待中的请求没有结果"""
+    pass
+
+
+def _recv_exact(sock: socket.socket, size: int) -> bytearray:
+    """从套接字读取恰好 size 个字节到预分配的缓冲区，连接关闭时抛出 ConnectionError"""
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        n = sock.recv_into(view[received:], min(size - received, RECV_CHUNK_SIZE))
+        if n == 0:
+            raise ConnectionError("connection closed by peer")
+        received += n
+    return buffer
+
+
+def _pack_header(kind: int, request_id: int, length: int, status: int = STATUS_OK,
+                 content_type: int = CONTENT_TYPE_OCTET_STREAM) -> bytes:
+    return HEADER.pack(MAGIC, PROTOCOL_VERSION, kind, status, content_type, request_id, length)
+
+
+def send_frame(sock: socket.socket, kind: int, request_id: int, payload: bytes = b"", status: int = STATUS_OK,
+               content_type: int = CONTENT_TYPE_OCTET_STREAM):
+    """发送一帧内存中的数据，帧头和数据分开写入以避免拼接复制"""
+    sock.sendall(_pack_header(kind, request_id, len(payload), status, content_type))
+    if payload:
+        sock.sendall(payload)
+
+
+def send_file_frame(sock: socket.socket, kind: int, request_id: int, f: BinaryIO, size: int,
+                    content_type: int):
+    """
+    以一帧发送已打开的文件，数据由 socket.sendfile 分块写出，不整体读入内存
+
+    文件由调用方在发送前打开并取得大小，这里抛出的 OSError 都来自连接。
+    """
+    sock.sendall(_pack_header(kind, request_id, size, STATUS_OK, content_type))
+    if size:
+        sock.sendfile(f, 0, size)
+
+
+def recv_frame_with_type(sock: socket.socket) -> Tuple[int, int, int, int, bytearray]:
+    """
+    接收一帧数据
+
+    Returns:
+        (kind, status, content_type, request_id, payload)
+    """
+    magic, version, kind, status, content_type, request_id, length = HEADER.unpack(_recv_exact(sock, HEADER.size))
+    if magic != MAGIC or version != PROTOCOL_VERSION:
+        raise BoardError(f"invalid frame header: magic={magic!r} version={version}")
+    payload = _recv_exact(sock, length) if length else bytearray()
+    return kind, status, content_type, request_id, payload
+
+
+def recv_frame(sock: socket.socket) -> Tuple[int, int, int, bytearray]:
+    """
+    接收一帧数据
+
+    Returns:
+        (kind, status, request_id, payload)
+    """
+    kind, status, _, request_id, payload = recv_frame_with_type(sock)
+    return kind, status, request_id, payload
+
+
+class BoardClient:
+    """
+    复用单条长连接的开发板客户端
+
+    Args:
+        host: 开发板IP
+        port: 开发板端口
+        connect_timeout: 建立连接的超时时间（秒）
+        request_timeout: 单个请求的默认超时时间（秒）
+        send_timeout: 写出或读取一帧时连接停滞的最长时间（秒），超过时断开连接
+    """
+
+    def __init__(
+        self,
+        host: str = OCR_SERVER_IP,
+        port: int = OCR_SERVER_PORT,
+        connect_timeout: float = BOARD_CONNECT_TIMEOUT,
+        request_timeout: float = BOARD_REQUEST_TIMEOUT,
+        send_timeout: float = BOARD_SEND_TIMEOUT
+    ):
+        self.host = host
+        self.port = port
+        self.connect_timeout = connect_timeout
+        self.request_timeout = request_timeout
+        self.send_timeout = send_timeout
+        self._sock: Optional[socket.socket] = None
+        self._pending: Dict[int, Future] = {}
+        self._listeners: Dict[int, Callable[[str], None]] = {}  # 流式请求的中间结果回调
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()        # 保护连接状态和待处理表
+        self._send_lock = threading.Lock()   # 保证帧整体写入，不与其他请求交错
+
+    def _connect(self) -> socket.socket:
+        """建立连接并启动结果分发线程，调用方需持有 self._lock"""
+        sock = socket.create_connection((self.host, self.port), timeout=self.connect_timeout)
+        # 开发板停止接收时，发送在超时后抛出 TimeoutError 并断开连接，不会在发送锁内永久阻塞
+        sock.settimeout(self.send_timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)
+        self._sock = sock
+        threading.Thread(target=self._dispatch_loop, args=(sock,), daemon=True).start()
+        return sock
+
+    def _dispatch_loop(self, sock: socket.socket):
+        """持续读取开发板的回复，并按请求编号交给对应的调用方"""
+        selector = selectors.DefaultSelector()
+        try:
+            selector.register(sock, selectors.EVENT_READ)
+            while True:
+                # 两帧之间可能长时间没有回复，先无限期等到有数据，读取一帧时才受超时限制
+                selector.select()
+                kind, status, request_id, payload = recv_frame(sock)
+                if status == STATUS_PARTIAL:
+                    with self._lock:
+                        listener = self._listeners.get(request_id)
+                    if listener is not None:
+                        listener(payload.decode("utf-8", errors="replace"))
+                    continue
+                with self._lock:
+                    future = self._pending.pop(request_id, None)
+                    self._listeners.pop(request_id, None)
+                if future is None:
+                    # 请求已超时被放弃，丢弃迟到的结果
+                    continue
+                if status == STATUS_OK:
+                    future.set_result(payload)
+                else:
+                    future.set_exception(BoardError(payload.decode("utf-8", errors="replace")))
+        except (OSError, BoardError, ValueError) as e:
+            self._fail_connection(sock, e)
+        finally:
+            selector.close()
+
+    def _fail_connection(self, sock: socket.socket, error: Exception):
+        """连接断开时关闭套接字，并让所有等待中的请求失败"""
+        with self._lock:
+            if self._sock is not sock:
+                return
+            self._sock = None
+            pending, self._pending = self._pending, {}
+            self._listeners = {}
+        try:
+            # 先 shutdown 唤醒阻塞在该连接上的分发线程，再关闭
+            sock.shutdown(socket.SHUT_RDWR)
+        except OSError:
+            pass
+        try:
+            sock.close()
+        except OSError:
+            pass
+        for future in pending.values():
+            future.set_exception(BoardConnectionError(f"connection to board lost: {error}"))
+
+    def _submit(self, send) -> Future:
+        """
+        登记请求编号后在发送锁内调用 send(sock, request_id) 写出整帧
+
+        send 只应因连接出错而抛出 OSError，此时连接被关闭，所有等待中的请求失败。
+        """
+        future = Future()
+        with self._lock:
+            sock = self._sock or self._connect()
+            request_id = next(self._ids) & 0xFFFFFFFF
+            self._pending[request_id] = future
+        future.request_id = request_id
+
+        try:
+            with self._send_lock:
+                send(sock, request_id)
+        except OSError as e:
+            self._fail_connection(sock, e)
+        return future
+
+    def submit(self, kind: int, payload: bytes, content_type: int = CONTENT_TYPE_OCTET_STREAM) -> Future:
+        """
+        发送请求并立即返回 Future，结果为开发板回复的原始字节
+
+        Args:
+            kind: 请求类型（KIND_OCR / KIND_ASR / KIND_PING）
+            payload: 请求数据
+            content_type: 数据类型（CONTENT_TYPE_*）
+        """
+        return self._submit(lambda sock, request_id: send_frame(
+            sock, kind, request_id, payload, content_type=content_type
+        ))
+
+    def submit_file(self, kind: int, file_path: str, content_type: Optional[int] = None) -> Future:
+        """
+        发送文件请求并立即返回 Future，文件以流式方式上传
+
+        Raises:
+            OSError: 文件无法打开或读取，此时不发送任何数据，连接不受影响
+        """
+        if content_type is None:
+            content_type = guess_content_type(file_path)
+        # 在发送之前打开文件，本地文件的错误不会被当作连接故障
+        with open(file_path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            return self._submit(lambda sock, request_id: send_file_frame(
+                sock, kind, request_id, f, size, content_type
+            ))
+
+    def open_stream(self, kind: int = KIND_ASR_STREAM, content_type: int = CONTENT_TYPE_PCM16,
+                    on_partial: Optional[Callable[[str], None]] = None) -> "BoardStream":
+        """
+        开始一个流式请求，之后用 BoardStream.send 逐块发送数据，用 finish 取得最终结果
+
+        Args:
+            kind: 请求类型
+            content_type: 每块数据的类型
+            on_partial: 收到中间结果时在分发线程中调用，必须足够轻量
+        """
+        future = Future()
+        stream = BoardStream(self, kind, content_type, future, on_partial)
+        with self._lock:
+            sock = self._sock or self._connect()
+            request_id = next(self._ids) & 0xFFFFFFFF
+            self._pending[request_id] = future
+            self._listeners[request_id] = stream._on_partial
+        future.request_id = request_id
+        stream.sock, stream.request_id = sock, request_id
+        return stream
+
+    def _send_stream_frame(self, stream: "BoardStream", payload: bytes, status: int = STATUS_OK):
+        """在流式请求建立时的连接上发送一帧，连接已断开或请求已结束时抛出 BoardError"""
+        with self._lock:
+            if self._sock is not stream.sock or stream.future.done():
+                raise BoardError(f"stream {stream.request_id} is no longer active")
+        try:
+            with self._send_lock:
+                send_frame(stream.sock, stream.kind, stream.request_id, payload, status, stream.content_type)
+        except OSError as e:
+            self._fail_connection(stream.sock, e)
+            raise BoardConnectionError(f"connection to board lost: {e}") from e
+
+    def _wait(self, future: Future, timeout: Optional[float]) -> str:
+        timeout = self.request_timeout if timeout is None else timeout
+        try:
+            return future.result(timeout=timeout).decode("utf-8")
+        except FutureTimeoutError:
+            with self._lock:
+                self._pending.pop(future.request_id, None)
+                self._listeners.pop(future.request_id, None)
+            raise TimeoutError(f"board request {future.request_id} timed out after {timeout}s")
+
+    def request(self, kind: int, payload: bytes, timeout: Optional[float] = None,
+                content_type: int = CONTENT_TYPE_OCTET_STREAM) -> str:
+        """
+        发送请求并等待文本结果
+
+        Raises:
+            TimeoutError: 超过超时时间仍未收到回复
+            BoardError: 开发板返回错误或连接断开
+        """
+        with span(_STAGES.get(kind, "board"), bytes=len(payload)):
+            return self._wait(self.submit(kind, payload, content_type), timeout)
+
+    def request_file(self, kind: int, file_path: str, timeout: Optional[float] = None) -> str:
+        """流式上传文件并等待文本结果"""
+        with span(_STAGES.get(kind, "board"), bytes=os.path.getsize(file_path)):
+            return self._wait(self.submit_file(kind, file_path), timeout)
+
+    def close(self):
+        """关闭连接"""
+        with self._lock:
+            sock = self._sock
+        if sock is not None:
+            try:
+                sock.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+            self._fail_connection(sock, ConnectionError("client closed"))
+
+
+class BoardStream:
+    """
+    一个流式请求，由 BoardClient.open_stream 创建
+
+    数据块按发送顺序到达开发板；中间结果保存在 partial 中，最终结果由 finish 返回。
+    """
+
+    def __init__(self, client: BoardClient, kind: int, content_type: int, future: Future,
+                 on_partial: Optional[Callable[[str], None]] = None):
+        self.client = client
+        self.kind = kind
+        self.content_type = content_type
+        self.future = future
+        self.on_partial = on_partial
+        self.partial = ""       # 最近一次收到的中间结果
+        self.bytes_sent = 0
+        self.sock: Optional[socket.socket] = None
+        self.request_id = 0
+
+    def _on_partial(self, text: str):
+        self.partial = text
+        if self.on_partial is not None:
+            self.on_partial(text)
+
+    def send(self, data: bytes):
+        """
+        发送一块数据，空数据会被忽略（空帧表示结束）
+
+        Raises:
+            BoardError: 连接已断开或请求已结束（如开发板已返回错误）
+        """
+        if not data:
+            return
+        self.client._send_stream_frame(self, data)
+        self.bytes_sent += len(data)
+
+    def finish(self, timeout: Optional[float] = None) -> str:
+        """
+        发送结束帧并等待最终结果
+
+        Raises:
+            TimeoutError: 超过超时时间仍未收到最终结果
+            BoardError: 开发板返回错误或连接断开
+        """
+        with span(_STAGES.get(self.kind, "board"), bytes=self.bytes_sent):
+            if not self.future.done():
+                self.client._send_stream_frame(self, b"")
+            return self.client._wait(self.future, timeout)
+
+    def cancel(self):
+        """放弃本次请求，通知开发板丢弃已收到的数据"""
+        if self.future.done():
+            return
+        try:
+            self.client._send_stream_frame(self, b"", STATUS_ERROR)
+        except BoardError:
+            pass
+        with self.client._lock:
+            self.client._pending.pop(self.request_id, None)
+            self.client._listeners.pop(self.request_id, None)
+        self.future.cancel()
+
+
+_default_client = None
+_default_client_lock = threading.Lock()
+
+
+def get_board_client():
+    """
+    获取进程内共享的开发板客户端
+
+    默认是由 config.BOARD_ADDRESSES 中全部开发板组成的 BoardPool，接口与 BoardClient 相同。
+    """
+    global _default_client
+    with _default_client_lock:
+        if _default_client is None:
+            from board_pool import BoardPool
+            _default_client = BoardPool()
+        return _default_client
+
+
+def current_board_client():
+    """返回当前共享的开发板客户端，尚未创建时返回 None（不会创建）"""
+    with _default_client_lock:
+        return _default_client
+
+
+def set_board_client(client):
+    """替换共享的开发板客户端（BoardClient 或 BoardPool，如连接到替身服务），返回原来的客户端"""
+    global _default_client
+    with _default_client_lock:
+        previous, _default_client = _default_client, client
+        return previous
@@ -0,0 +1,285 @@
+"""
+开发板集群
+
+把多块 OCR/ASR 开发板组成一个集群，对外提供与 BoardClient 相同的 request / request_file /
+open_stream 接口。每块开发板维持自己的长连接，请求按“在途请求数 × 近期平均耗时”
+选择负载最轻的开发板，增加开发板即可按比例提升识别吞吐量。
+
+健康检查：
+    - 后台线程定期向每块开发板发送 KIND_PING 探测；
+    - 连续失败（连接断开、超时）达到 BOARD_EJECT_FAILURES 次，或平均耗时超过其他开发板
+      中位数的 BOARD_SLOW_FACTOR 倍时摘除，不再分配请求；
+    - 摘除至少 BOARD_EJECT_DURATION 秒后，连续 BOARD_READMIT_PROBES 次探测成功即恢复；
+    - 所有开发板都被摘除时仍在全部开发板之间分配，避免完全停止服务。
+开发板返回的识别错误（STATUS_ERROR）说明开发板仍在工作，不计为失败。
+"""
+import statistics
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from board_client import (
+    BoardClient, BoardConnectionError, KIND_PING, KIND_ASR_STREAM, CONTENT_TYPE_OCTET_STREAM, CONTENT_TYPE_PCM16,
+    current_board_client
+)
+from config import (
+    BOARD_ADDRESSES, BOARD_HEALTH_INTERVAL, BOARD_PING_TIMEOUT, BOARD_EJECT_FAILURES,
+    BOARD_EJECT_DURATION, BOARD_READMIT_PROBES, BOARD_SLOW_FACTOR, BOARD_LATENCY_ALPHA
+)
+from metrics import REGISTRY
+
+BOARD_REQUESTS = REGISTRY.counter("medical_board_requests_total", "各开发板的请求次数", ["board", "result"])
+BOARD_EJECTIONS = REGISTRY.counter("medical_board_ejections_total", "各开发板被摘除的次数", ["board", "reason"])
+
+# 计为开发板故障的异常：连接失败或断开、超时（TimeoutError 是 OSError 的子类）
+_FAILURES = (OSError, BoardConnectionError)
+
+
+class _Board:
+    """集群中的一块开发板及其负载、耗时和健康状态"""
+
+    def __init__(self, client: BoardClient):
+        self.client = client
+        self.name = f"{client.host}:{client.port}"
+        self.outstanding = 0
+        self.latency: Dict[int, float] = {}  # 各请求类型耗时的指数移动平均（秒）
+        self.failures = 0                    # 连续失败次数
+        self.ejected_until: Optional[float] = None
+        self.probe_successes = 0
+
+    @property
+    def healthy(self) -> bool:
+        return self.ejected_until is None
+
+
+class BoardPool:
+    """
+    多块开发板组成的集群
+
+    Args:
+        addresses: 开发板地址列表 [(IP, 端口), ...]
+        health_interval: 健康探测间隔（秒），为 0 时不启动探测线程
+        ping_timeout: 探测超时（秒）
+        eject_failures: 连续失败多少次后摘除
+        eject_duration: 摘除后至少多久才允许恢复（秒）
+        readmit_probes: 恢复前需要连续成功的探测次数
+        slow_factor: 平均耗时超过其他开发板中位数的倍数时摘除，为 0 时不按耗时摘除
+        latency_alpha: 耗时指数移动平均的平滑系数
+        client_factory: 为每个地址创建客户端的函数，默认 BoardClient
+    """
+
+    def __init__(
+        self,
+        addresses: Sequence[Tuple[str, int]] = BOARD_ADDRESSES,
+        health_interval: float = BOARD_HEALTH_INTERVAL,
+        ping_timeout: float = BOARD_PING_TIMEOUT,
+        eject_failures: int = BOARD_EJECT_FAILURES,
+        eject_duration: float = BOARD_EJECT_DURATION,
+        readmit_probes: int = BOARD_READMIT_PROBES,
+        slow_factor: float = BOARD_SLOW_FACTOR,
+        latency_alpha: float = BOARD_LATENCY_ALPHA,
+        client_factory=BoardClient
+    ):
+        if not addresses:
+            raise ValueError("BoardPool requires at least one board address")
+        self.boards: List[_Board] = [_Board(client_factory(host, port)) for host, port in addresses]
+        self.ping_timeout = ping_timeout
+        self.eject_failures = eject_failures
+        self.eject_duration = eject_duration
+        self.readmit_probes = readmit_probes
+        self.slow_factor = slow_factor
+        self.latency_alpha = latency_alpha
+        self._lock = threading.Lock()
+        self._closed = threading.Event()
+        self._prober = None
+        if health_interval > 0:
+            self._prober = threading.Thread(
+                target=self._probe_loop, args=(health_interval,), name="board-health", daemon=True
+            )
+            self._prober.start()
+
+    # ---------- 选择开发板 ----------
+
+    def _acquire(self, kind: int, exclude: Optional[_Board] = None) -> _Board:
+        """选出负载最轻的开发板并登记一个在途请求"""
+        with self._lock:
+            candidates = [board for board in self.boards if board.healthy and board is not exclude]
+            if not candidates:
+                # 全部被摘除时仍然分配，由请求结果决定是否恢复
+                candidates = [board for board in self.boards if board is not exclude] or self.boards
+            known = [board.latency[kind] for board in candidates if kind in board.latency]
+            default = statistics.median(known) if known else 1.0
+            board = min(candidates, key=lambda b: (b.outstanding + 1) * b.latency.get(kind, default))
+            board.outstanding += 1
+            return board
+
+    def _release(self, board: _Board, kind: int, seconds: Optional[float], error: Optional[BaseException]):
+        """请求结束：更新在途数、耗时和连续失败次数，必要时摘除"""
+        failed = isinstance(error, _FAILURES)
+        BOARD_REQUESTS.inc(board=board.name, result="failure" if failed else "error" if error else "ok")
+        with self._lock:
+            board.outstanding -= 1
+            if failed:
+                board.failures += 1
+                if board.healthy and board.failures >= self.eject_failures:
+                    self._eject_locked(board, "failures")
+                return
+            board.failures = 0
+            if seconds is not None:
+                self._observe_latency_locked(board, kind, seconds)
+                self._check_slow_locked(board, kind)
+
+    def _observe_latency_locked(self, board: _Board, kind: int, seconds: float):
+        """用指数移动平均更新开发板该类请求的耗时"""
+        previous = board.latency.get(kind)
+        board.latency[kind] = seconds if previous is None else (
+            previous + self.latency_alpha * (seconds - previous))
+
+    def _check_slow_locked(self, board: _Board, kind: int):
+        """平均耗时远高于其他健康开发板时摘除，集群中至少保留一块开发板"""
+        if not self.slow_factor or not board.healthy:
+            return
+        others = [b.latency[kind] for b in self.boards if b is not board and b.healthy and kind in b.latency]
+        if others and board.latency[kind] > self.slow_factor * statistics.median(others):
+            self._eject_locked(board, "slow")
+
+    def _eject_locked(self, board: _Board, reason: str):
+        board.ejected_until = time.monotonic() + self.eject_duration
+        board.probe_successes = 0
+        BOARD_EJECTIONS.inc(board=board.name, reason=reason)
+        print(f"开发板 {board.name} 已摘除（{'连续失败' if reason == 'failures' else '响应过慢'}）")
+
+    def _readmit_locked(self, board: _Board):
+        board.ejected_until = None
+        board.failures = 0
+        board.latency.clear()  # 按集群中位数重新开始估计，避免因摘除前的耗时再次被摘除
+        print(f"开发板 {board.name} 已恢复")
+
+    # ---------- 请求接口（与 BoardClient 相同） ----------
+
+    def _call(self, kind: int, method: str, *args, **kwargs) -> str:
+        """在选中的开发板上调用客户端方法，连接失败时换一块开发板重试一次"""
+        tried = None
+        attempts = 2 if len(self.boards) > 1 else 1
+        for attempt in range(attempts):
+            board = self._acquire(kind, exclude=tried)
+            start = time.perf_counter()
+            try:
+                result = getattr(board.client, method)(kind, *args, **kwargs)
+            except BaseException as e:
+                self._release(board, kind, None, e)
+                # 连接失败或断开时换一块开发板重试；超时不重试，避免等待时间翻倍
+                if attempt < attempts - 1 and isinstance(e, _FAILURES) and not isinstance(e, TimeoutError):
+                    tried = board
+                    continue
+                raise
+            self._release(board, kind, time.perf_counter() - start, None)
+            return result
+
+    def request(self, kind: int, payload: bytes, timeout: Optional[float] = None,
+                content_type: int = CONTENT_TYPE_OCTET_STREAM) -> str:
+        """发送请求并等待文本结果（见 BoardClient.request）"""
+        return self._call(kind, "request", payload, timeout, content_type=content_type)
+
+    def request_file(self, kind: int, file_path: str, timeout: Optional[float] = None) -> str:
+        """流式上传文件并等待文本结果（见 BoardClient.request_file）"""
+        # 先确认文件可读，本地文件的 OSError 不应计为开发板故障
+        with open(file_path, 'rb'):
+            pass
+        return self._call(kind, "request_file", file_path, timeout)
+
+    def open_stream(self, kind: int = KIND_ASR_STREAM, content_type: int = CONTENT_TYPE_PCM16, on_partial=None):
+        """在负载最轻的开发板上开始流式请求，请求结束前计为该开发板的在途请求"""
+        board = self._acquire(kind)
+        try:
+            stream = board.client.open_stream(kind, content_type, on_partial)
+        except BaseException as e:
+            self._release(board, kind, None, e)
+            raise
+
+        def done(future: Future):
+            # 流式请求包含说话时间，不计入耗时统计
+            error = None if future.cancelled() else future.exception()
+            self._release(board, kind, None, error)
+
+        stream.future.add_done_callback(done)
+        return stream
+
+    # ---------- 健康检查 ----------
+
+    def probe(self):
+        """同时探测所有开发板一次，等待全部探测完成"""
+        threads = [threading.Thread(target=self._probe_board, args=(board,), daemon=True) for board in self.boards]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+    def _probe_board(self, board: _Board):
+        """摘除期满的开发板连续探测成功后恢复，持续失败的开发板被摘除"""
+        start = time.perf_counter()
+        try:
+            board.client.request(KIND_PING, b"", self.ping_timeout)
+            error = None
+        except Exception as e:
+            error = e
+        seconds = time.perf_counter() - start
+        with self._lock:
+            if error is None:
+                board.probe_successes += 1
+                self._observe_latency_locked(board, KIND_PING, seconds)
+                if board.healthy:
+                    board.failures = 0
+                elif time.monotonic() >= board.ejected_until and board.probe_successes >= self.readmit_probes:
+                    self._readmit_locked(board)
+            else:
+                board.probe_successes = 0
+                board.failures += 1
+                if board.healthy and board.failures >= self.eject_failures:
+                    self._eject_locked(board, "failures")
+
+    def _probe_loop(self, interval: float):
+        while not self._closed.wait(interval):
+            try:
+                self.probe()
+            except Exception as e:
+                print(f"开发板健康检查出错：{str(e)}")
+
+    def stats(self) -> Dict[str, Dict[str, object]]:
+        """各开发板的在途请求数、健康状态、连续失败次数和平均耗时"""
+        with self._lock:
+            return {
+                board.name: {
+                    "outstanding": board.outstanding,
+                    "healthy": board.healthy,
+                    "failures": board.failures,
+                    "latency": dict(board.latency)
+                }
+                for board in self.boards
+            }
+
+    def close(self):
+        """停止健康检查并关闭所有连接"""
+        self._closed.set()
+        for board in self.boards:
+            board.client.close()
+
+
+def _shared_pool_stats() -> Dict[str, Dict[str, object]]:
+    """共享开发板客户端的各板状态；共享客户端尚未创建或不是 BoardPool 时为空"""
+    client = current_board_client()
+    return client.stats() if isinstance(client, BoardPool) else {}
+
+
+# 瞬时指标只反映 get_board_client() 返回的共享集群，测试或压测中临时创建的集群不会覆盖
+REGISTRY.gauge_callback("medical_board_outstanding", "各开发板的在途请求数", ["board"], lambda: {
+    (name,): stats["outstanding"] for name, stats in _shared_pool_stats().items()
+})
+REGISTRY.gauge_callback("medical_board_healthy", "开发板是否在集群中（1 为正常，0 为已摘除）", ["board"], lambda: {
+    (name,): float(stats["healthy"]) for name, stats in _shared_pool_stats().items()
+})
+REGISTRY.gauge_callback("medical_board_latency_seconds", "各开发板各类请求耗时的移动平均（秒）", ["board", "kind"], lambda: {
+    (name, str(kind)): seconds for name, stats in _shared_pool_stats().items()
+    for kind, seconds in stats["latency"].items()
+})
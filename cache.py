@@ -0,0 +1,138 @@
+"""
+通用缓存
+
+TTLCache 是带过期时间的 LRU 内存缓存，可选使用 SQLite 作为持久化后端，
+进程重启后仍能命中。缓存值需要能被 JSON 序列化。
+"""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from typing import Any, Dict, Optional
+
+from metrics import record_cache
+
+_TRAILING_PUNCTUATION = re.compile(r"[\s。？！，、；：.?!,;:~～…]+$")
+_WHITESPACE = re.compile(r"\s+")
+
+
+def normalize_prompt(text: str) -> str:
+    """
+    规范化问题文本，使写法略有差异的同一问题得到相同的缓存键
+
+    统一全角/半角字符和大小写，去掉多余空白和结尾标点。
+    """
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    text = _WHITESPACE.sub(" ", text).strip()
+    return _TRAILING_PUNCTUATION.sub("", text)
+
+
+def make_cache_key(*parts: Any) -> str:
+    """将若干参数组合为稳定的缓存键"""
+    raw = json.dumps(parts, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+
+class TTLCache:
+    """
+    线程安全的 LRU + TTL 缓存
+
+    Args:
+        max_entries: 内存中最多保存的条目数
+        ttl: 条目有效期（秒）
+        db_path: SQLite 数据库路径，提供时启用磁盘持久化
+        name: 缓存名称，提供时命中与未命中次数计入指标
+    """
+
+    def __init__(self, max_entries: int = 1000, ttl: float = 3600, db_path: Optional[str] = None,
+                 name: Optional[str] = None):
+        self.max_entries = max_entries
+        self.name = name
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._db = None
+        if db_path:
+            self._open_db(db_path)
+
+    def _open_db(self, db_path: str):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._db = sqlite3.connect(db_path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._db.execute("DELETE FROM cache WHERE expires_at < ?", (time.time(),))
+        self._db.commit()
+
+    def get(self, key: str) -> Optional[Any]:
+        """读取缓存，未命中或已过期时返回 None"""
+        value = self._get(key)
+        if self.name is not None:
+            record_cache(self.name, value is not None)
+        return value
+
+    def _get(self, key: str) -> Optional[Any]:
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, value = entry
+                if expires_at >= now:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self._entries[key]
+
+            if self._db is not None:
+                row = self._db.execute(
+                    "SELECT value, expires_at FROM cache WHERE key = ? AND expires_at >= ?", (key, now)
+                ).fetchone()
+                if row is not None:
+                    value = json.loads(row[0])
+                    self._store_locked(key, value, row[1])
+                    self.hits += 1
+                    return value
+
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: Any, ttl: Optional[float] = None):
+        """写入缓存"""
+        expires_at = time.time() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._store_locked(key, value, expires_at)
+            if self._db is not None:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires_at) VALUES (?, ?, ?)",
+                    (key, json.dumps(value, ensure_ascii=False), expires_at)
+                )
+                self._db.commit()
+
+    def _store_locked(self, key: str, value: Any, expires_at: float):
+        self._entries[key] = (expires_at, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """清空内存和磁盘中的缓存"""
+        with self._lock:
+            self._entries.clear()
+            if self._db is not None:
+                self._db.execute("DELETE FROM cache")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, int]:
+        """返回命中、未命中次数和当前条目数"""
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "entries": len(self._entries)}
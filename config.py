@@ -3,15 +3,148 @@ SYSTEM_TITLE = "大连理工大学未来技术学院智慧医疗系统"
 
 # 文件路径配置
 TEMP_DIR = "temp"
+CACHE_DIR = "cache"
 FONT_PATH = "fonts/simhei.ttf"
-TEMP_IMAGE_PATH = "captured_avatar.jpg"
-TEMP_RECORD_PATH = "temp_medical_record.png"
+TEMPLATE_RECORD_PATH = f"{CACHE_DIR}/medical_record_template.png"  # 当天的空白病历模板，所有请求共用
+RECORD_PNG_COMPRESS_LEVEL = 1  # 病历PNG压缩级别，级别越低保存越快
+
+# 临时文件配置（病历、语音等按请求生成的文件都放在 TEMP_DIR 下）
+TEMP_MAX_AGE = 30 * 60                # 临时文件最长保留时间（秒）
+TEMP_MAX_BYTES = 500 * 1024 * 1024    # 临时目录总大小上限（字节）
+TEMP_SWEEP_INTERVAL = 60              # 后台清理间隔（秒）
+TEMP_GRACE_PERIOD = 60                # 新文件保护期（秒），保护期内不因目录超限被删除
+
+# 并发配置
+GRADIO_QUEUE_MAX_SIZE = 64        # 界面排队请求数上限，超出时新请求直接提示繁忙
+GRADIO_DEFAULT_CONCURRENCY = 4    # 未单独配置的事件的并发数
+OCR_CONCURRENCY = 4               # 每块开发板对应的OCR识别事件并发数
+AUDIO_CONCURRENCY = 8             # 语音咨询事件的并发数
+RECORD_CONCURRENCY = 4            # 病历生成事件的并发数
+BOARD_WORKERS = 4                 # 每块开发板的通信线程数
+BOARD_QUEUE_SIZE = 16             # 每块开发板最多排队的通信任务数
+LLM_WORKERS = 16                  # 大模型调用线程数
+LLM_QUEUE_SIZE = 64               # 大模型调用最多排队的任务数
+RENDER_WORKERS = 2                # 图像预处理与病历渲染线程数（CPU密集）
+RENDER_QUEUE_SIZE = 16            # 渲染最多排队的任务数
+POOL_WAIT_TIMEOUT = 5             # 线程池已满时等待空位的最长时间（秒）
+
+# 语音合成配置
+TTS_CACHE_DIR = f"{CACHE_DIR}/tts"   # 合成结果按内容寻址缓存的目录
+TTS_LANG = "zh-cn"
+TTS_CACHE_MAX_FILES = 2000           # 缓存目录最多保留的音频文件数
+TTS_SENTENCE_MAX_CHARS = 60          # 逐句合成时每段的最大字数
+TTS_WORKER_THREADS = 4               # 逐句合成的并发数
+TTS_PREWARM = True                   # 启动时是否预先合成固定的语音建议
 
 # OCR服务器配置
 OCR_SERVER_IP = "192.168.137.100"
 OCR_SERVER_PORT = 9999
 OCR_RESULT_PORT = 9998
+BOARD_CONNECT_TIMEOUT = 5    # 连接开发板的超时时间（秒）
+BOARD_REQUEST_TIMEOUT = 30   # 单个识别请求的超时时间（秒）
+BOARD_SEND_TIMEOUT = 10      # 发送或接收一帧时连接停滞的最长时间（秒），超过时断开连接
+
+# OCR图像预处理配置
+IMAGE_MAX_DIMENSION = 1600   # 上传图像的最大边长（像素）
+IMAGE_JPEG_QUALITY = 85      # JPEG 编码质量
+IMAGE_GRAYSCALE = True       # 是否转为灰度图
+IMAGE_BINARIZE = False       # 是否二值化
+IMAGE_DESKEW = False         # 是否进行倾斜校正
 
 # 音频配置
 AUDIO_RECORD_DURATION = 3  # 录音时长（秒）
 AUDIO_SAMPLE_RATE = 16000
+AUDIO_TRIM_SILENCE = True      # 是否裁掉录音首尾的静音
+AUDIO_VAD_THRESHOLD_DB = -35   # 端点检测阈值，相对最响帧的能量（dB）
+AUDIO_VAD_PADDING = 0.2        # 语音段前后保留的余量（秒）
+AUDIO_ENCODING = "pcm16"       # 上传编码："pcm16" 或 "mulaw"（需开发板支持 μ-law WAV）
+
+# 会话配置
+SESSION_MAX_COUNT = 200                      # 最多同时保留的会话数
+SESSION_TTL = 30 * 60                        # 会话空闲超时（秒）
+SESSION_MAX_MEMORY_BYTES = 32 * 1024 * 1024  # 所有会话历史的内存上限（字节）
+
+# 对话历史压缩配置
+HISTORY_MAX_PROMPT_TOKENS = 3000   # 每次请求的提示词 token 预算
+HISTORY_KEEP_RECENT_TURNS = 3      # 原样保留的最近对话轮数
+HISTORY_SUMMARY_MAX_TOKENS = 300   # 早期对话摘要的 token 上限
+
+# 回答缓存配置
+RESPONSE_CACHE_ENABLED = True
+RESPONSE_CACHE_MAX_ENTRIES = 1000
+RESPONSE_CACHE_TTL = 24 * 3600                          # 缓存有效期（秒）
+RESPONSE_CACHE_DB_PATH = f"{CACHE_DIR}/response_cache.sqlite3"  # 为 None 时只使用内存缓存
+
+# 搜索服务配置
+SEARCH_CONNECT_TIMEOUT = 3      # 连接超时（秒）
+SEARCH_READ_TIMEOUT = 8         # 读取超时（秒）
+SEARCH_MAX_RETRIES = 2          # 临时错误重试次数
+SEARCH_BACKOFF_FACTOR = 0.3     # 重试退避系数
+SEARCH_POOL_SIZE = 10           # 连接池大小
+SEARCH_CACHE_MAX_ENTRIES = 500
+SEARCH_CACHE_TTL = 6 * 3600     # 搜索结果缓存有效期（秒）
+SEARCH_CACHE_DB_PATH = f"{CACHE_DIR}/search_cache.sqlite3"  # 为 None 时只使用内存缓存
+SEARCH_TRIGGER_TERMS_PATH = None      # 搜索触发词表文件（格式见 search_trigger.py），为 None 时使用内置词表
+SEARCH_TRIGGER_THRESHOLD = 1.0        # 触发词加权得分达到该值时才搜索
+SEARCH_TRIGGER_NEGATION_WINDOW = 6    # 否定词之后多少个字符内的触发词不计分
+# 等待搜索结果的最长时间（秒），超时后不带搜索上下文直接作答，次数计入 medical_search_deadline_misses_total。
+# 明显短于搜索服务自身的超时（连接 + 读取，且含重试），慢请求仍在后台完成并写入搜索缓存，供之后相同的问题使用
+SEARCH_DEADLINE = 2.0
+SPECULATIVE_GENERATION = False  # 搜索期间是否同时推测性地生成无搜索上下文的回答
+AI_WORKER_THREADS = 8           # 搜索与推测性生成使用的线程数
+
+# 本地医学资料检索配置
+KNOWLEDGE_ENABLED = True                                 # 索引存在时先检索本地资料，再决定是否网络搜索
+KNOWLEDGE_SOURCE_DIR = "knowledge"                       # 医学参考资料目录（.txt / .md）
+KNOWLEDGE_INDEX_DIR = f"{CACHE_DIR}/knowledge_index"     # 索引目录，用 python knowledge_index.py build 生成
+KNOWLEDGE_PASSAGE_CHARS = 300   # 资料切分的段落长度（字）
+KNOWLEDGE_MIN_SCORE = 1.0       # BM25 得分低于该值的段落不作为参考
+BM25_K1 = 1.2
+BM25_B = 0.75
+
+# 批量离线问诊配置
+BATCH_CONCURRENCY = 8       # 同时处理的条目数
+BATCH_RATE_LIMIT = 10.0     # 每秒最多发起的大模型请求数，为 0 时不限速
+
+# 大模型调用容错配置
+LLM_TIMEOUT = 30.0              # 每次调用（含重试）的总时限（秒），流式调用指收到第一段文本之前
+LLM_CONNECT_TIMEOUT = 5.0       # 建立连接的超时（秒）
+LLM_MAX_RETRIES = 2             # 临时错误（超时、连接错误、429、5xx）的重试次数
+LLM_RETRY_BASE_DELAY = 0.5      # 第一次重试前的基准等待时间（秒），之后指数增长并随机抖动
+LLM_RETRY_MAX_DELAY = 4.0       # 单次重试等待时间上限（秒）
+LLM_BREAKER_FAILURES = 5        # 连续失败多少次后熔断
+LLM_BREAKER_RECOVERY = 30.0     # 熔断后多久放行探测请求（秒）
+LLM_HEDGE_ENABLED = True        # 请求耗时超过近期分位数时是否发出对冲请求
+LLM_HEDGE_QUANTILE = 0.95       # 对冲触发延迟取近期耗时的分位数
+LLM_HEDGE_MIN_DELAY = 1.0       # 对冲触发延迟的下限（秒），避免正常波动也产生重复请求
+LLM_HEDGE_MIN_SAMPLES = 20      # 耗时样本达到该数量后才启用对冲
+
+# 指标与追踪配置
+METRICS_ENABLED = True          # 是否启动 /metrics 服务（Prometheus 文本格式）
+METRICS_HOST = "127.0.0.1"
+METRICS_PORT = 9464
+TRACE_EXPORT_PATH = None        # 各阶段追踪记录的 JSON Lines 文件，如 f"{CACHE_DIR}/traces.jsonl"；为 None 时不导出
+TRACE_QUEUE_SIZE = 10000        # 待写出的追踪记录上限，超出时丢弃
+
+# 患者档案配置
+PATIENT_STORE_ENABLED = True            # 是否保存问诊记录，并在复诊时把既往就诊摘要提供给大模型
+PATIENT_DB_PATH = "data/patients.sqlite3"   # 患者档案数据库（SQLite，含全文索引），不会被缓存清理删除
+PATIENT_WRITE_QUEUE_SIZE = 1000         # 等待后台写入的记录上限，超出时丢弃
+PATIENT_WRITE_BATCH = 100               # 每个写入事务最多包含的记录数
+PATIENT_CONTEXT_VISITS = 3              # 放入大模型上下文的既往就诊次数
+PATIENT_CONTEXT_MAX_CHARS = 400         # 既往就诊摘要的最大字数
+
+# 流式语音识别配置
+ASR_STREAMING = False           # 是否边录音边识别（需开发板固件支持流式识别请求 KIND_ASR_STREAM）
+ASR_STREAM_IDLE_TIMEOUT = 60    # 录音流超过该时间（秒）没有新音频时视为中断并放弃
+ASR_STREAM_CONCURRENCY = 32     # 录音分块事件的并发数（每块只做格式转换和发送，耗时很短）
+
+# 开发板集群配置
+BOARD_ADDRESSES = [(OCR_SERVER_IP, OCR_SERVER_PORT)]   # 全部 OCR/ASR 开发板的 (IP, 端口)，增加开发板可按比例提升识别吞吐量
+BOARD_HEALTH_INTERVAL = 5.0     # 健康探测（KIND_PING）间隔（秒）
+BOARD_PING_TIMEOUT = 2.0        # 健康探测超时（秒）
+BOARD_EJECT_FAILURES = 3        # 连续失败（连接断开、超时）多少次后摘除
+BOARD_EJECT_DURATION = 30.0     # 摘除后至少多久才允许恢复（秒）
+BOARD_READMIT_PROBES = 2        # 摘除期满后连续多少次探测成功才恢复
+BOARD_SLOW_FACTOR = 3.0         # 平均耗时超过其他开发板中位数的倍数时视为过慢并摘除，为 0 时不按耗时摘除
+BOARD_LATENCY_ALPHA = 0.2       # 各开发板耗时移动平均的平滑系数
@@ -0,0 +1,466 @@
+"""
+本地替身服务，用于在离线环境下测试和压测
+
+FakeOpenAIServer: 兼容 OpenAI 接口的聊天补全服务（支持流式和非流式）
+FakeSerperServer: Serper 搜索接口替身
+FakeBoardServer: 使用 board_client 帧协议的开发板替身（OCR/ASR，含流式识别）
+"""
+import contextlib
+import json
+import queue
+import random
+import socket
+import socketserver
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from board_client import (
+    recv_frame_with_type, send_frame, KIND_OCR, KIND_ASR, KIND_PING, KIND_ASR_STREAM,
+    STATUS_OK, STATUS_ERROR, STATUS_PARTIAL
+)
+from config import AUDIO_SAMPLE_RATE
+
+DEFAULT_FAKE_OCR_TEXT = "姓名：张三\n性别：男\n年龄：35\n科室：内科"
+DEFAULT_FAKE_ASR_TEXT = "我最近总是头痛怎么办"
+DEFAULT_FAKE_REPLY = "我理解您描述的是头痛的症状。这可能与睡眠不足有关。建议您保证充足的睡眠，如果症状持续，请及时就医。"
+
+
+class _BackgroundServer:
+    """在后台线程中运行的 HTTP 服务基类"""
+
+    handler_class = BaseHTTPRequestHandler
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0):
+        self.httpd = ThreadingHTTPServer((host, port), self.handler_class)
+        self.httpd.daemon_threads = True
+        self.httpd.owner = self
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+
+class _FakeOpenAIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("/chat/completions"):
+            self.send_error(404)
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server.owner
+        server.request_count += 1
+
+        fail, slow = server.draw_faults()
+        if fail:
+            self.send_error(server.fail_status)
+            return
+        if slow:
+            time.sleep(server.slow_delay)
+        if request.get("stream"):
+            try:
+                self._send_stream(server, request)
+            except (BrokenPipeError, ConnectionResetError):
+                # 客户端提前停止接收（如中止推测性生成）
+                server.aborted_streams += 1
+        else:
+            self._send_completion(server, request)
+
+    def _send_completion(self, server, request):
+        time.sleep(server.first_token_delay + server.token_delay * len(server.tokens))
+        body = json.dumps({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": server.reply},
+                "finish_reason": "stop"
+            }],
+            "usage": self._usage(server, request)
+        }, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _send_stream(self, server, request):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Connection", "close")
+        self.end_headers()
+        self.close_connection = True
+
+        time.sleep(server.first_token_delay)
+        for i, token in enumerate(server.tokens):
+            if i:
+                time.sleep(server.token_delay)
+            self._send_event({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [{"index": 0, "delta": {"content": token}, "finish_reason": None}]
+            })
+        self._send_event({
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get("model", "fake"),
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]
+        })
+        if (request.get("stream_options") or {}).get("include_usage"):
+            self._send_event({
+                "id": "chatcmpl-fake",
+                "object": "chat.completion.chunk",
+                "created": int(time.time()),
+                "model": request.get("model", "fake"),
+                "choices": [],
+                "usage": self._usage(server, request)
+            })
+        self.wfile.write(b"data: [DONE]\n\n")
+        self.wfile.flush()
+
+    @staticmethod
+    def _usage(server, request):
+        """按字符数粗略模拟 token 用量"""
+        prompt_tokens = sum(len(m.get("content") or "") for m in request.get("messages", []))
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": len(server.tokens),
+            "total_tokens": prompt_tokens + len(server.tokens)
+        }
+
+    def _send_event(self, payload):
+        data = json.dumps(payload, ensure_ascii=False)
+        self.wfile.write(f"data: {data}\n\n".encode("utf-8"))
+        self.wfile.flush()
+
+
+class FakeOpenAIServer(_BackgroundServer):
+    """
+    兼容 OpenAI 的聊天补全替身服务
+
+    Args:
+        reply: 固定返回的回答文本
+        first_token_delay: 首个 token 之前的延迟（秒），模拟排队和预填充
+        token_delay: 相邻 token 之间的延迟（秒），模拟解码速度
+        chars_per_token: 每个 token 包含的字符数
+        fail_rate: 请求直接返回错误状态码的比例，模拟上游故障
+        fail_status: 故障时返回的状态码
+        slow_rate: 请求额外延迟 slow_delay 秒的比例，模拟长尾
+        slow_delay: 长尾请求的额外延迟（秒）
+        seed: 故障注入使用的随机数种子
+    """
+
+    handler_class = _FakeOpenAIHandler
+
+    def __init__(
+        self,
+        reply: str = DEFAULT_FAKE_REPLY,
+        first_token_delay: float = 0.2,
+        token_delay: float = 0.02,
+        chars_per_token: int = 2,
+        fail_rate: float = 0.0,
+        fail_status: int = 503,
+        slow_rate: float = 0.0,
+        slow_delay: float = 2.0,
+        seed: int = 0,
+        host: str = "127.0.0.1",
+        port: int = 0
+    ):
+        super().__init__(host, port)
+        self.reply = reply
+        self.fail_rate = fail_rate
+        self.fail_status = fail_status
+        self.slow_rate = slow_rate
+        self.slow_delay = slow_delay
+        self._random = random.Random(seed)
+        self._random_lock = threading.Lock()
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+        self.tokens = [reply[i:i + chars_per_token] for i in range(0, len(reply), chars_per_token)]
+        self.request_count = 0
+        self.aborted_streams = 0  # 客户端中途断开的流式请求数
+
+    def draw_faults(self):
+        """为一个请求抽取 (是否失败, 是否长尾)"""
+        with self._random_lock:
+            return self._random.random() < self.fail_rate, self._random.random() < self.slow_rate
+
+
+class _FakeSerperHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def setup(self):
+        # 每条新连接计数，并模拟公网上 TCP 和 TLS 握手的耗时；复用的连接不再付出这部分时间
+        super().setup()
+        server = self.server.owner
+        with server.lock:
+            server.connection_count += 1
+        time.sleep(server.connect_delay)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        server = self.server.owner
+        with server.lock:
+            server.request_count += 1
+            fail = server.random.random() < server.fail_rate
+        time.sleep(server.delay)
+        if fail:
+            # 保持连接的 503，模拟上游的临时错误
+            body = b'{"message": "service unavailable"}'
+            self.send_response(503)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+            return
+
+        query = request.get("q", "")
+        body = json.dumps({
+            "searchParameters": {"q": query},
+            "organic": [
+                {
+                    "title": f"{query} 相关资料 {i}",
+                    "snippet": f"关于“{query}”的第 {i} 条参考摘要。",
+                    "link": f"https://example.com/article/{i}"
+                }
+                for i in range(1, server.result_count + 1)
+            ]
+        }, ensure_ascii=False).encode("utf-8")
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class FakeSerperServer(_BackgroundServer):
+    """
+    Serper 搜索接口替身
+
+    Args:
+        delay: 每次搜索的处理延迟（秒）
+        result_count: 返回的搜索结果条数
+        connect_delay: 每条新连接的握手耗时（秒），模拟公网上的 TCP 和 TLS 握手
+        fail_rate: 返回 503 临时错误的请求比例
+        seed: 抽取失败请求的随机数种子
+    """
+
+    handler_class = _FakeSerperHandler
+
+    def __init__(self, delay: float = 0.3, result_count: int = 5, connect_delay: float = 0.0,
+                 fail_rate: float = 0.0, seed: int = 0, host: str = "127.0.0.1", port: int = 0):
+        super().__init__(host, port)
+        self.delay = delay
+        self.result_count = result_count
+        self.connect_delay = connect_delay
+        self.fail_rate = fail_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.request_count = 0
+        self.connection_count = 0
+
+    @property
+    def search_url(self) -> str:
+        return f"{self.url}/search"
+
+
+def _pcm_seconds(size: int) -> float:
+    """16 位单声道 PCM 数据的时长（WAV 文件头忽略不计）"""
+    return size / (2 * AUDIO_SAMPLE_RATE)
+
+
+class _FakeBoardHandler(socketserver.BaseRequestHandler):
+    """
+    处理一条开发板连接，每个请求在独立线程中处理以便乱序回复
+
+    流式识别请求的各帧交给该请求专属的线程按顺序处理，每收到一块音频回复一次中间结果。
+    """
+
+    def handle(self):
+        server = self.server.owner
+        write_lock = threading.Lock()
+        workers = []
+        streams = {}
+        server.connections.add(self.request)
+        try:
+            while True:
+                kind, status, _, request_id, payload = recv_frame_with_type(self.request)
+                if kind == KIND_ASR_STREAM:
+                    frames = streams.get(request_id)
+                    if frames is None:
+                        frames = streams[request_id] = queue.Queue()
+                        worker = threading.Thread(
+                            target=self._stream, args=(server, write_lock, request_id, frames), daemon=True
+                        )
+                        worker.start()
+                        workers.append(worker)
+                    frames.put((status, payload))
+                    if not payload:
+                        del streams[request_id]
+                    continue
+                worker = threading.Thread(
+                    target=self._reply,
+                    args=(server, write_lock, kind, request_id, payload),
+                    daemon=True
+                )
+                worker.start()
+                workers.append(worker)
+        except (OSError, ConnectionError):
+            pass
+        server.connections.discard(self.request)
+        for frames in streams.values():
+            frames.put((STATUS_ERROR, b""))
+        for worker in workers:
+            worker.join()
+
+    def _send(self, write_lock, kind, request_id, result, status):
+        try:
+            with write_lock:
+                send_frame(self.request, kind, request_id, result, status)
+        except OSError:
+            pass
+
+    def _reply(self, server, write_lock, kind, request_id, payload):
+        server.request_count += 1
+        try:
+            if kind == KIND_PING:
+                result, status = b"pong", STATUS_OK
+            else:
+                processing = server.asr_rtf * _pcm_seconds(len(payload)) if kind == KIND_ASR else 0
+                with server.slots:
+                    time.sleep(server.delay + processing)
+                    text = server.handler(kind, payload) if server.handler else server.results.get(kind, "")
+                result, status = text.encode("utf-8"), STATUS_OK
+        except Exception as e:
+            result, status = str(e).encode("utf-8"), STATUS_ERROR
+        self._send(write_lock, kind, request_id, result, status)
+
+    def _stream(self, server, write_lock, request_id, frames):
+        """按顺序解码流式请求的音频块，每块之后回复中间结果，结束帧之后回复最终结果"""
+        server.request_count += 1
+        audio = bytearray()
+        final_text = server.results.get(KIND_ASR, "")
+        while True:
+            status, payload = frames.get()
+            if status == STATUS_ERROR:
+                return  # 客户端放弃
+            if not payload:
+                break
+            audio += payload
+            time.sleep(server.asr_rtf * _pcm_seconds(len(payload)))
+            partial = final_text[:int(_pcm_seconds(len(audio)) * server.stream_chars_per_second)]
+            if partial:
+                self._send(write_lock, KIND_ASR_STREAM, request_id, partial.encode("utf-8"), STATUS_PARTIAL)
+        try:
+            with server.slots:
+                time.sleep(server.delay)
+                text = server.handler(KIND_ASR_STREAM, bytes(audio)) if server.handler else final_text
+            result, status = text.encode("utf-8"), STATUS_OK
+        except Exception as e:
+            result, status = str(e).encode("utf-8"), STATUS_ERROR
+        server.streams_completed += 1
+        self._send(write_lock, KIND_ASR_STREAM, request_id, result, status)
+
+
+class _ThreadingTCPServer(socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+
+class FakeBoardServer:
+    """
+    开发板替身服务
+
+    Args:
+        delay: 每个识别请求的处理延迟（秒），流式识别时为结束帧之后给出最终结果的延迟
+        handler: 可选的回调 handler(kind, payload) -> str，用于自定义识别结果
+        ocr_text: 默认的OCR识别结果
+        asr_text: 默认的语音识别结果（流式识别的中间结果为其前缀）
+        asr_rtf: 语音识别每秒音频额外需要的处理时间（秒），流式识别时在收到每块音频后逐块计入
+        stream_chars_per_second: 流式识别时每秒音频对应的中间结果字数
+        capacity: 同时处理的识别请求数上限（模拟开发板的算力），为 None 时不限
+    """
+
+    def __init__(
+        self,
+        delay: float = 0.1,
+        handler=None,
+        ocr_text: str = DEFAULT_FAKE_OCR_TEXT,
+        asr_text: str = DEFAULT_FAKE_ASR_TEXT,
+        asr_rtf: float = 0.0,
+        stream_chars_per_second: float = 4.0,
+        capacity=None,
+        host: str = "127.0.0.1",
+        port: int = 0
+    ):
+        self.server = _ThreadingTCPServer((host, port), _FakeBoardHandler)
+        self.server.owner = self
+        self.delay = delay
+        self.handler = handler
+        self.results = {KIND_OCR: ocr_text, KIND_ASR: asr_text}
+        self.asr_rtf = asr_rtf
+        self.stream_chars_per_second = stream_chars_per_second
+        self.slots = threading.BoundedSemaphore(capacity) if capacity else contextlib.nullcontext()
+        self.request_count = 0
+        self.streams_completed = 0
+        self.connections = set()
+        self._thread = None
+
+    @property
+    def address(self):
+        return self.server.server_address[:2]
+
+    def start(self):
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """停止服务并断开所有连接（模拟开发板宕机）"""
+        self.server.shutdown()
+        self.server.server_close()
+        for connection in list(self.connections):
+            try:
+                connection.shutdown(socket.SHUT_RDWR)
+            except OSError:
+                pass
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
@@ -0,0 +1,143 @@
+"""
+对话历史管理
+
+在每次调用大模型前压缩对话历史，使提示词保持在配置的 token 预算之内：
+1. 保留系统提示和最近几轮对话
+2. 去掉较早用户消息中已经过时的搜索结果
+3. 将更早的对话压缩为一条摘要，仍然超出预算时直接丢弃
+"""
+import re
+from typing import Dict, List
+
+from config import HISTORY_MAX_PROMPT_TOKENS, HISTORY_KEEP_RECENT_TURNS, HISTORY_SUMMARY_MAX_TOKENS
+from prompts import SEARCH_CONTEXT_INSTRUCTION
+
+SUMMARY_PREFIX = "此前对话摘要：\n"
+MESSAGE_OVERHEAD_TOKENS = 4  # 每条消息的角色和分隔符开销
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uff00-\uffef]")
+_SENTENCE_END = re.compile(r"(?<=[。！？!?])")
+
+
+def estimate_tokens(text: str) -> int:
+    """
+    估算文本的 token 数
+
+    采用 DeepSeek 官方给出的经验换算：1 个中文字符约 0.6 个 token，
+    1 个英文字符约 0.3 个 token。
+    """
+    if not text:
+        return 0
+    cjk = len(_CJK_PATTERN.findall(text))
+    return int(cjk * 0.6 + (len(text) - cjk) * 0.3) + 1
+
+
+def count_message_tokens(messages: List[Dict[str, str]]) -> int:
+    """估算整个消息列表的 token 数"""
+    return sum(estimate_tokens(message.get("content") or "") + MESSAGE_OVERHEAD_TOKENS for message in messages)
+
+
+def strip_search_context(content: str) -> str:
+    """去掉搜索增强提示词中的搜索结果，只保留患者原始问题"""
+    marker = SEARCH_CONTEXT_INSTRUCTION + "\n"
+    if marker in content:
+        return content.split(marker, 1)[1]
+    return content
+
+
+def _first_sentence(text: str, max_chars: int) -> str:
+    sentence = _SENTENCE_END.split(text.strip(), 1)[0].replace("\n", " ")
+    return sentence[:max_chars]
+
+
+class HistoryManager:
+    """
+    按 token 预算压缩对话历史
+
+    Args:
+        max_prompt_tokens: 发送给模型的提示词 token 上限
+        keep_recent_turns: 始终原样保留的最近对话轮数
+        summary_max_tokens: 早期对话摘要的 token 上限
+    """
+
+    def __init__(
+        self,
+        max_prompt_tokens: int = HISTORY_MAX_PROMPT_TOKENS,
+        keep_recent_turns: int = HISTORY_KEEP_RECENT_TURNS,
+        summary_max_tokens: int = HISTORY_SUMMARY_MAX_TOKENS
+    ):
+        self.max_prompt_tokens = max_prompt_tokens
+        self.keep_recent_turns = keep_recent_turns
+        self.summary_max_tokens = summary_max_tokens
+
+    def compact(self, messages: List[Dict[str, str]]) -> int:
+        """
+        原地压缩消息列表，最后一条消息应为本轮用户问题
+
+        Returns:
+            压缩后提示词的估算 token 数
+        """
+        # 旧问题的搜索结果对后续回答价值很低，只保留最新一条用户消息的搜索上下文
+        last_user = max((i for i, m in enumerate(messages) if m["role"] == "user"), default=-1)
+        for i, message in enumerate(messages):
+            if message["role"] == "user" and i != last_user:
+                message["content"] = strip_search_context(message["content"])
+
+        total = count_message_tokens(messages)
+        if total <= self.max_prompt_tokens:
+            return total
+
+        system, summary_lines, turns = self._split(messages)
+
+        # 将超出保留轮数的早期对话压缩为摘要
+        while len(turns) > self.keep_recent_turns:
+            summary_lines.append(self._summarize_turn(turns.pop(0)))
+        while summary_lines and estimate_tokens("\n".join(summary_lines)) > self.summary_max_tokens:
+            summary_lines.pop(0)
+
+        rebuilt = self._assemble(system, summary_lines, turns)
+        # 仍然超出预算时，先丢弃摘要，再从最早的对话开始丢弃，至少保留本轮问题
+        while count_message_tokens(rebuilt) > self.max_prompt_tokens and (summary_lines or len(turns) > 1):
+            if summary_lines:
+                summary_lines = []
+            else:
+                turns.pop(0)
+            rebuilt = self._assemble(system, summary_lines, turns)
+
+        messages[:] = rebuilt
+        return count_message_tokens(messages)
+
+    @staticmethod
+    def _split(messages: List[Dict[str, str]]):
+        """拆分为系统提示、已有摘要行和按用户消息划分的对话轮"""
+        system, summary_lines, turns = [], [], []
+        for message in messages:
+            if message["role"] == "system" and not turns:
+                if message["content"].startswith(SUMMARY_PREFIX):
+                    summary_lines = message["content"][len(SUMMARY_PREFIX):].split("\n")
+                else:
+                    system.append(message)
+            elif message["role"] == "user" or not turns:
+                turns.append([message])
+            else:
+                turns[-1].append(message)
+        return system, summary_lines, turns
+
+    @staticmethod
+    def _summarize_turn(turn: List[Dict[str, str]]) -> str:
+        """用问题和回答的第一句话概括一轮对话"""
+        question = " ".join(m["content"] for m in turn if m["role"] == "user")
+        answer = " ".join(m["content"] for m in turn if m["role"] == "assistant")
+        line = f"患者：{_first_sentence(strip_search_context(question), 60)}"
+        if answer:
+            line += f" 医生：{_first_sentence(answer, 80)}"
+        return line
+
+    @staticmethod
+    def _assemble(system, summary_lines, turns) -> List[Dict[str, str]]:
+        messages = list(system)
+        if summary_lines:
+            messages.append({"role": "system", "content": SUMMARY_PREFIX + "\n".join(summary_lines)})
+        for turn in turns:
+            messages.extend(turn)
+        return messages
@@ -0,0 +1,159 @@
+"""
+OCR 上传前的图像预处理
+
+全部在内存中完成：镜像翻转、灰度化、按最大边长缩放、可选的二值化和倾斜校正，
+最后编码为 JPEG 字节直接交给开发板传输层，不再经过磁盘中转。
+"""
+import io
+import time
+from typing import Dict, Optional
+
+from PIL import Image, ImageOps
+
+from board_client import CONTENT_TYPE_JPEG
+from config import (
+    IMAGE_MAX_DIMENSION, IMAGE_JPEG_QUALITY, IMAGE_GRAYSCALE,
+    IMAGE_BINARIZE, IMAGE_DESKEW
+)
+
+DESKEW_MAX_ANGLE = 10      # 倾斜校正搜索的最大角度（度）
+DESKEW_ANGLE_STEP = 0.5    # 倾斜校正搜索步长（度）
+DESKEW_SAMPLE_SIZE = 600   # 估计倾斜角时使用的缩略图边长
+
+
+class PreprocessResult:
+    """预处理结果及各阶段统计"""
+
+    def __init__(self, data: bytes, content_type: int, size: tuple, original_size: tuple,
+                 stage_times: Dict[str, float]):
+        self.data = data
+        self.content_type = content_type
+        self.size = size
+        self.original_size = original_size
+        self.stage_times = stage_times
+
+    def report(self) -> str:
+        """生成一行预处理报告：尺寸、发送字节数和各阶段耗时"""
+        stages = "，".join(f"{name} {seconds * 1000:.1f} ms" for name, seconds in self.stage_times.items())
+        return (f"图像预处理: {self.original_size[0]}x{self.original_size[1]} -> "
+                f"{self.size[0]}x{self.size[1]}，发送 {len(self.data) / 1024:.1f} KB（{stages}）")
+
+
+def _otsu_threshold(image: Image.Image) -> int:
+    """用大津法根据灰度直方图计算二值化阈值"""
+    histogram = image.histogram()[:256]
+    total = sum(histogram)
+    sum_all = sum(i * count for i, count in enumerate(histogram))
+    sum_background = weight_background = 0
+    best_threshold, best_variance = 127, -1.0
+    for threshold, count in enumerate(histogram):
+        weight_background += count
+        if weight_background == 0:
+            continue
+        weight_foreground = total - weight_background
+        if weight_foreground == 0:
+            break
+        sum_background += threshold * count
+        mean_background = sum_background / weight_background
+        mean_foreground = (sum_all - sum_background) / weight_foreground
+        variance = weight_background * weight_foreground * (mean_background - mean_foreground) ** 2
+        if variance > best_variance:
+            best_threshold, best_variance = threshold, variance
+    return best_threshold
+
+
+def binarize(image: Image.Image) -> Image.Image:
+    """将灰度图按大津阈值二值化"""
+    threshold = _otsu_threshold(image)
+    return image.point(lambda value: 255 if value > threshold else 0)
+
+
+def estimate_skew(image: Image.Image) -> float:
+    """
+    估计文字行的倾斜角度（度）
+
+    在缩略图上尝试一系列旋转角度，取水平投影方差最大（文字行最整齐）的角度。
+    """
+    sample = image.copy()
+    sample.thumbnail((DESKEW_SAMPLE_SIZE, DESKEW_SAMPLE_SIZE))
+    sample = ImageOps.invert(binarize(sample))  # 文字为白色，便于按行求和
+
+    best_angle, best_score = 0.0, -1.0
+    steps = int(DESKEW_MAX_ANGLE / DESKEW_ANGLE_STEP)
+    for i in range(-steps, steps + 1):
+        angle = i * DESKEW_ANGLE_STEP
+        rotated = sample.rotate(angle, resample=Image.NEAREST, fillcolor=0)
+        height = rotated.size[1]
+        # 每行像素和：将图像缩为 1 像素宽后读取
+        row_sums = list(rotated.resize((1, height), Image.BOX).getdata())
+        mean = sum(row_sums) / height
+        score = sum((value - mean) ** 2 for value in row_sums)
+        if score > best_score:
+            best_angle, best_score = angle, score
+    return best_angle
+
+
+def preprocess_image(
+    image: Image.Image,
+    mirror: bool = False,
+    grayscale: bool = IMAGE_GRAYSCALE,
+    max_dimension: Optional[int] = IMAGE_MAX_DIMENSION,
+    binarize_image: bool = IMAGE_BINARIZE,
+    deskew: bool = IMAGE_DESKEW,
+    jpeg_quality: int = IMAGE_JPEG_QUALITY
+) -> PreprocessResult:
+    """
+    预处理待识别图像
+
+    Args:
+        image: PIL 图像
+        mirror: 是否左右翻转（摄像头实时拍摄的画面是镜像的）
+        grayscale: 是否转为灰度图
+        max_dimension: 最大边长，超出时等比例缩小，为 None 时不缩放
+        binarize_image: 是否二值化
+        deskew: 是否进行倾斜校正
+        jpeg_quality: JPEG 编码质量（1-95）
+
+    Returns:
+        PreprocessResult，data 为编码后的 JPEG 字节
+    """
+    stage_times = {}
+    original_size = image.size
+
+    def stage(name, func, current):
+        start = time.perf_counter()
+        result = func(current)
+        stage_times[name] = time.perf_counter() - start
+        return result
+
+    if grayscale or binarize_image or deskew:
+        image = stage("灰度化", lambda img: img.convert("L"), image)
+    elif image.mode not in ("RGB", "L"):
+        image = stage("转换", lambda img: img.convert("RGB"), image)
+    if max_dimension and max(image.size) > max_dimension:
+        def downscale(img):
+            scale = max_dimension / max(img.size)
+            size = (max(1, round(img.width * scale)), max(1, round(img.height * scale)))
+            # reducing_gap 先用整数倍快速缩小，再做双三次重采样
+            return img.resize(size, Image.BICUBIC, reducing_gap=2.0)
+        image = stage("缩放", downscale, image)
+    if mirror:
+        # 翻转与颜色、缩放操作可交换，放在缩小之后处理的像素更少
+        image = stage("翻转", ImageOps.mirror, image)
+    if deskew:
+        def rotate(img):
+            angle = estimate_skew(img)
+            if not angle:
+                return img
+            return img.rotate(angle, resample=Image.BICUBIC, expand=True, fillcolor=255)
+        image = stage("倾斜校正", rotate, image)
+    if binarize_image:
+        image = stage("二值化", binarize, image)
+
+    def encode(img):
+        buffer = io.BytesIO()
+        img.save(buffer, format="JPEG", quality=jpeg_quality)
+        return buffer.getvalue()
+    data = stage("编码", encode, image)
+
+    return PreprocessResult(data, CONTENT_TYPE_JPEG, image.size, original_size, stage_times)
@@ -0,0 +1,426 @@
+"""
+本地医学资料检索
+
+把一个目录下的医学参考资料（.txt / .md）切分为段落，建立 BM25 倒排索引并保存到磁盘。
+中文按相邻两字（二元组）切词，去掉"怎么""什么"等提问用的虚词二元组，英文单词和数字整体作为一个词。
+加载索引时词表、倒排表、文档长度和段落正文都以内存映射方式打开，启动时几乎不读取数据，
+查询时在有序词表中二分查找，通常只需几毫秒，不产生网络请求和费用。
+
+KnowledgeIndex 提供与 SearchService 相同的 search / format_search_results 接口，
+可以直接替代网络搜索；LocalFirstSearch 先查本地资料，问题满足搜索触发条件时再进行网络搜索，
+两者的结果合并作为参考。本地检索没有费用，每个问题都会查询。
+
+建立索引：
+    python knowledge_index.py build knowledge/
+查询：
+    python knowledge_index.py query "偏头痛怎么治疗"
+"""
+import argparse
+import bisect
+import json
+import math
+import mmap
+import os
+import re
+import shutil
+import time
+import unicodedata
+from collections import Counter
+from typing import Any, Dict, Iterator, List, Tuple
+
+import numpy as np
+
+from config import (
+    KNOWLEDGE_SOURCE_DIR, KNOWLEDGE_INDEX_DIR, KNOWLEDGE_PASSAGE_CHARS,
+    KNOWLEDGE_MIN_SCORE, BM25_K1, BM25_B
+)
+
+INDEX_VERSION = 1
+SOURCE_EXTENSIONS = (".txt", ".md")
+SNIPPET_CHARS = 160
+
+# 倒排表每一项：文档编号和词频
+POSTING_DTYPE = np.dtype([("doc", "<u4"), ("tf", "<u4")])
+
+_CJK_RUN = re.compile(r"[㐀-䶿一-鿿豈-﫿]+")
+_WORD = re.compile(r"[a-z0-9]+(?:[.\-][a-z0-9]+)*")
+_HEADING = re.compile(r"^#+\s*")
+
+# 提问句式中的虚词二元组，不区分疾病和症状，计入得分会让"头痛怎么办"命中"感冒怎么办"
+STOPWORDS = frozenset([
+    "怎么", "么办", "么样", "怎样", "什么", "如何", "为什", "为何", "么会", "哪些",
+    "是否", "能否", "可以", "是不", "不是", "有没", "没有", "有什", "需要", "应该",
+    "请问", "一下", "一些", "这个", "那个", "还是", "的话", "时候", "有点", "我的",
+])
+
+
+def tokenize(text: str) -> List[str]:
+    """切词：中文连续片段取相邻二元组（单字片段保留单字，去掉虚词二元组），英文单词和数字整体保留"""
+    text = unicodedata.normalize("NFKC", text or "").lower()
+    tokens = []
+    for run in _CJK_RUN.findall(text):
+        if len(run) == 1:
+            tokens.append(run)
+        else:
+            bigrams = (run[i:i + 2] for i in range(len(run) - 1))
+            tokens.extend(bigram for bigram in bigrams if bigram not in STOPWORDS)
+    tokens.extend(_WORD.findall(text))
+    return tokens
+
+
+def split_passages(text: str, max_chars: int = KNOWLEDGE_PASSAGE_CHARS) -> List[str]:
+    """按空行分段，过长的段落在句号处切开，过短的相邻段落合并"""
+    passages, current = [], ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        paragraph = paragraph.strip()
+        if not paragraph:
+            continue
+        while len(paragraph) > max_chars:
+            cut = max(paragraph.rfind(mark, 0, max_chars) for mark in "。！？.!?\n")
+            cut = cut + 1 if cut > 0 else max_chars
+            if current:
+                passages.append(current)
+                current = ""
+            passages.append(paragraph[:cut].strip())
+            paragraph = paragraph[cut:].strip()
+        if current and len(current) + len(paragraph) + 1 > max_chars:
+            passages.append(current)
+            current = ""
+        current = f"{current}\n{paragraph}" if current else paragraph
+    if current:
+        passages.append(current)
+    return passages
+
+
+def iter_documents(source_dir: str) -> Iterator[Tuple[str, str, str]]:
+    """遍历资料目录，逐段产出 (标题, 正文, 来源)"""
+    for root, _, files in os.walk(source_dir):
+        for name in sorted(files):
+            if not name.lower().endswith(SOURCE_EXTENSIONS):
+                continue
+            path = os.path.join(root, name)
+            with open(path, encoding="utf-8", errors="replace") as f:
+                text = f.read()
+            relative = os.path.relpath(path, source_dir).replace(os.sep, "/")
+            title = os.path.splitext(name)[0]
+            first_line, _, rest = text.lstrip().partition("\n")
+            if first_line.startswith("#"):
+                # 首行标题作为段落标题，不再计入正文
+                title = _HEADING.sub("", first_line).strip() or title
+                text = rest
+            for number, passage in enumerate(split_passages(text), 1):
+                yield title, passage, f"{relative}#{number}"
+
+
+def build_index(source_dir: str = KNOWLEDGE_SOURCE_DIR, index_dir: str = KNOWLEDGE_INDEX_DIR) -> Dict[str, Any]:
+    """
+    为资料目录建立索引并写入 index_dir
+
+    先写入临时目录再整体替换，正在运行的进程不会读到写了一半的索引。
+
+    Returns:
+        索引的元信息（段落数、词表大小等）
+    """
+    start = time.perf_counter()
+    postings: Dict[str, List[Tuple[int, int]]] = {}
+    doc_lengths = []
+    partial_dir = f"{index_dir}.building"
+    if os.path.exists(partial_dir):
+        shutil.rmtree(partial_dir)
+    os.makedirs(partial_dir)
+
+    offsets = [0]
+    with open(os.path.join(partial_dir, "docs.jsonl"), "wb") as docs:
+        for doc_id, (title, text, link) in enumerate(iter_documents(source_dir)):
+            counts = Counter(tokenize(f"{title}\n{text}"))
+            for term, tf in counts.items():
+                postings.setdefault(term, []).append((doc_id, tf))
+            doc_lengths.append(sum(counts.values()))
+            docs.write(json.dumps({"title": title, "text": text, "link": link}, ensure_ascii=False).encode("utf-8"))
+            docs.write(b"\n")
+            offsets.append(docs.tell())
+
+    # 词表按字典序排列：terms.bin 为拼接的 UTF-8 词条，term_offsets.bin 为各词条的字节偏移，
+    # term_postings.bin 为各词条倒排表在 postings.bin 中的起始位置（相邻两项之差即文档频率）
+    terms = sorted(postings)
+    term_offsets, posting_starts = [0], [0]
+    with open(os.path.join(partial_dir, "postings.bin"), "wb") as f, \
+            open(os.path.join(partial_dir, "terms.bin"), "wb") as term_file:
+        for term in terms:
+            f.write(np.array(postings[term], dtype=POSTING_DTYPE).tobytes())
+            posting_starts.append(posting_starts[-1] + len(postings[term]))
+            term_file.write(term.encode("utf-8"))
+            term_offsets.append(term_file.tell())
+
+    np.array(doc_lengths, dtype="<u4").tofile(os.path.join(partial_dir, "doc_lengths.bin"))
+    np.array(offsets, dtype="<u8").tofile(os.path.join(partial_dir, "doc_offsets.bin"))
+    np.array(term_offsets, dtype="<u8").tofile(os.path.join(partial_dir, "term_offsets.bin"))
+    np.array(posting_starts, dtype="<u8").tofile(os.path.join(partial_dir, "term_postings.bin"))
+
+    meta = {
+        "version": INDEX_VERSION,
+        "documents": len(doc_lengths),
+        "terms": len(terms),
+        "postings": posting_starts[-1],
+        "average_length": (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0,
+        "source_dir": os.path.abspath(source_dir),
+        "built_at": time.time(),
+    }
+    with open(os.path.join(partial_dir, "meta.json"), "w", encoding="utf-8") as f:
+        json.dump(meta, f, ensure_ascii=False, indent=2)
+
+    if os.path.exists(index_dir):
+        shutil.rmtree(index_dir)
+    os.replace(partial_dir, index_dir)
+    meta["build_seconds"] = time.perf_counter() - start
+    return meta
+
+
+def index_exists(index_dir: str = KNOWLEDGE_INDEX_DIR) -> bool:
+    """判断索引目录是否已建立"""
+    return os.path.exists(os.path.join(index_dir, "meta.json"))
+
+
+class _TermTable:
+    """内存映射的有序词表，按下标读取词条，供二分查找使用"""
+
+    def __init__(self, data, offsets: np.ndarray):
+        self.data = data
+        self.offsets = offsets
+
+    def __len__(self):
+        return max(0, len(self.offsets) - 1)
+
+    def __getitem__(self, index: int) -> str:
+        return self.data[int(self.offsets[index]):int(self.offsets[index + 1])].decode("utf-8")
+
+    def find(self, term: str):
+        """返回词条编号，不存在时返回 None"""
+        index = bisect.bisect_left(self, term)
+        if index < len(self) and self[index] == term:
+            return index
+        return None
+
+
+class KnowledgeIndex:
+    """
+    磁盘上的 BM25 索引
+
+    Args:
+        index_dir: build_index 生成的索引目录
+        k1: BM25 词频饱和参数
+        b: BM25 文档长度归一化参数
+        min_score: 低于该得分的结果不返回
+    """
+
+    def __init__(
+        self,
+        index_dir: str = KNOWLEDGE_INDEX_DIR,
+        k1: float = BM25_K1,
+        b: float = BM25_B,
+        min_score: float = KNOWLEDGE_MIN_SCORE
+    ):
+        self.index_dir = index_dir
+        self.always_search = True  # 本地检索没有网络开销，不需要搜索触发词
+        self.k1 = k1
+        self.b = b
+        self.min_score = min_score
+        with open(os.path.join(index_dir, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != INDEX_VERSION:
+            raise ValueError(f"Unsupported knowledge index version: {self.meta.get('version')}")
+        self.document_count = self.meta["documents"]
+        self.average_length = self.meta["average_length"] or 1.0
+        self._postings = self._memmap("postings.bin", POSTING_DTYPE)
+        self._doc_lengths = self._memmap("doc_lengths.bin", np.dtype("<u4"))
+        self._doc_offsets = self._memmap("doc_offsets.bin", np.dtype("<u8"))
+        self._term_offsets = self._memmap("term_offsets.bin", np.dtype("<u8"))
+        self._term_postings = self._memmap("term_postings.bin", np.dtype("<u8"))
+        self._files = []
+        self._docs = self._mmap_file("docs.jsonl")
+        self._terms = _TermTable(self._mmap_file("terms.bin"), self._term_offsets)
+
+    def _mmap_file(self, name: str):
+        f = open(os.path.join(self.index_dir, name), "rb")
+        self._files.append(f)
+        if os.fstat(f.fileno()).st_size == 0:
+            return b""
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def _memmap(self, name: str, dtype: np.dtype) -> np.ndarray:
+        path = os.path.join(self.index_dir, name)
+        if os.path.getsize(path) == 0:
+            return np.zeros(0, dtype=dtype)
+        return np.memmap(path, dtype=dtype, mode="r")
+
+    def _document(self, doc_id: int) -> Dict[str, str]:
+        start, end = int(self._doc_offsets[doc_id]), int(self._doc_offsets[doc_id + 1])
+        return json.loads(self._docs[start:end])
+
+    def _idf(self, df: int) -> float:
+        return math.log(1 + (self.document_count - df + 0.5) / (df + 0.5))
+
+    def score(self, query: str) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        计算查询与所有段落的 BM25 得分
+
+        Returns:
+            (命中段落编号, 对应得分)
+        """
+        terms = set(tokenize(query))
+        doc_ids, weights = [], []
+        for term in terms:
+            term_id = self._terms.find(term)
+            if term_id is None:
+                continue
+            start, end = int(self._term_postings[term_id]), int(self._term_postings[term_id + 1])
+            df = end - start
+            postings = self._postings[start:end]
+            tf = postings["tf"].astype(np.float32)
+            lengths = self._doc_lengths[postings["doc"]].astype(np.float32)
+            norm = self.k1 * (1 - self.b + self.b * lengths / self.average_length)
+            doc_ids.append(postings["doc"])
+            weights.append(self._idf(df) * tf * (self.k1 + 1) / (tf + norm))
+        if not doc_ids:
+            return np.zeros(0, dtype=np.uint32), np.zeros(0, dtype=np.float32)
+
+        # 同一段落在多个词的倒排表中出现时得分相加
+        doc_ids = np.concatenate(doc_ids)
+        weights = np.concatenate(weights)
+        unique_ids, inverse = np.unique(doc_ids, return_inverse=True)
+        return unique_ids, np.bincount(inverse, weights=weights).astype(np.float32)
+
+    def _snippet(self, text: str, query_terms: List[str]) -> str:
+        """截取正文中第一个命中词附近的片段"""
+        positions = [text.find(term) for term in query_terms]
+        positions = [p for p in positions if p >= 0]
+        start = max(0, min(positions) - SNIPPET_CHARS // 4) if positions else 0
+        snippet = text[start:start + SNIPPET_CHARS].replace("\n", " ")
+        return ("…" if start else "") + snippet + ("…" if start + SNIPPET_CHARS < len(text) else "")
+
+    def search(self, query: str, limit: int = 3) -> List[Dict[str, Any]]:
+        """
+        检索与问题最相关的资料段落
+
+        Returns:
+            与 SearchService.search 相同格式的结果列表（title、snippet、link），另含 score
+        """
+        doc_ids, scores = self.score(query)
+        if len(doc_ids) == 0:
+            return []
+        if len(doc_ids) > limit:
+            top = np.argpartition(-scores, limit)[:limit]
+        else:
+            top = np.arange(len(doc_ids))
+        top = top[np.argsort(-scores[top])]
+
+        query_terms = tokenize(query)
+        results = []
+        for index in top:
+            score = float(scores[index])
+            if score < self.min_score:
+                break
+            document = self._document(int(doc_ids[index]))
+            results.append({
+                "title": document["title"],
+                "snippet": self._snippet(document["text"], query_terms),
+                "link": document["link"],
+                "score": round(score, 3)
+            })
+        return results
+
+    def format_search_results(self, results: List[Dict[str, Any]]) -> str:
+        """将检索结果格式化为文本"""
+        if not results:
+            return "未找到相关资料。"
+
+        formatted_text = "本地医学资料参考信息：\n\n"
+        for i, result in enumerate(results, 1):
+            formatted_text += f"{i}. {result['title']}\n"
+            formatted_text += f"摘要: {result['snippet']}\n"
+            formatted_text += f"来源: {result['link']}\n\n"
+        return formatted_text
+
+    def close(self):
+        """释放内存映射"""
+        for data in (self._docs, self._terms.data):
+            if isinstance(data, mmap.mmap):
+                data.close()
+        for f in self._files:
+            f.close()
+
+
+class LocalFirstSearch:
+    """
+    先检索本地资料，需要时再进行网络搜索，结果按本地在前、网络在后合并
+
+    Args:
+        local: 本地资料索引
+        web: 网络搜索服务，为空时只使用本地资料
+        trigger: 网络搜索的触发器（search_trigger.SearchTrigger）：满足触发条件时即使本地有结果也进行网络搜索，
+            以获取本地资料没有的最新信息；为空时仅在本地无结果时进行网络搜索
+    """
+
+    def __init__(self, local: KnowledgeIndex, web=None, trigger=None):
+        self.local = local
+        self.web = web
+        self.trigger = trigger
+        self.always_search = True
+
+    def search(self, query: str, limit: int = 3) -> List[Dict[str, Any]]:
+        results = self.local.search(query, limit)
+        if self.web is None:
+            return results
+        if self.trigger is not None:
+            use_web = self.trigger.evaluate(query).should_search
+        else:
+            use_web = not results
+        if use_web:
+            results = results + self.web.search(query, limit)
+        return results
+
+    def format_search_results(self, results: List[Dict[str, Any]]) -> str:
+        # 本地结果带有得分字段，据此把两部分分别按各自的格式输出
+        local = [result for result in results if "score" in result]
+        web = [result for result in results if "score" not in result]
+        if not web or self.web is None:
+            return self.local.format_search_results(results)
+        if not local:
+            return self.web.format_search_results(web)
+        return self.local.format_search_results(local) + self.web.format_search_results(web)
+
+    def close(self):
+        self.local.close()
+        if self.web is not None:
+            self.web.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="本地医学资料索引")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="为资料目录建立索引")
+    build.add_argument("source_dir", nargs="?", default=KNOWLEDGE_SOURCE_DIR)
+    build.add_argument("--index-dir", default=KNOWLEDGE_INDEX_DIR)
+
+    query = subparsers.add_parser("query", help="检索资料")
+    query.add_argument("text")
+    query.add_argument("--index-dir", default=KNOWLEDGE_INDEX_DIR)
+    query.add_argument("--limit", type=int, default=3)
+
+    args = parser.parse_args()
+    if args.command == "build":
+        meta = build_index(args.source_dir, args.index_dir)
+        print(f"已建立索引: {meta['documents']} 个段落，{meta['terms']} 个词，"
+              f"耗时 {meta['build_seconds']:.2f} s -> {args.index_dir}")
+    elif args.command == "query":
+        index = KnowledgeIndex(args.index_dir)
+        start = time.perf_counter()
+        results = index.search(args.text, args.limit)
+        elapsed = time.perf_counter() - start
+        print(index.format_search_results(results))
+        print(f"检索耗时 {elapsed * 1000:.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,10 +1,59 @@
 from abc import ABC, abstractmethod
+import asyncio
+import contextvars
+import itertools
+import threading
+import time
 import openai
-from typing import Optional, Dict, Any, List
+from concurrent.futures import Future, ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional, Dict, Any, List, Iterator, Tuple
 import os
-from openai import OpenAI
-from prompts import MEDICAL_ADVICE_PROMPT
+from openai import OpenAI, AsyncOpenAI
+from prompts import MEDICAL_ADVICE_PROMPT, SEARCH_CONTEXT_INSTRUCTION, REFERENCES_HEADER
 from search_service import SearchService
+from search_trigger import SearchTrigger, get_search_trigger
+from history_manager import HistoryManager
+from cache import TTLCache, normalize_prompt, make_cache_key
+from resilience import CircuitBreaker, ResilientCaller
+from metrics import REGISTRY, span, begin_span, observe_stage
+from config import (
+    RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL,
+    SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL,
+    SEARCH_DEADLINE, SPECULATIVE_GENERATION, AI_WORKER_THREADS,
+    LLM_TIMEOUT, LLM_CONNECT_TIMEOUT, LLM_HEDGE_ENABLED
+)
+
+ERROR_RESPONSE_PREFIX = "Error generating response"
+
+class FailedResponse(str):
+    """
+    生成失败时返回的错误说明
+
+    仍是字符串，可以直接展示；调用方用 isinstance 判断失败，不依赖文本内容。
+    """
+
+class ResponseStreamError(Exception):
+    """
+    流式生成中途失败
+
+    Args:
+        message: 错误说明
+        partial: 失败前已经产出的回答文本
+    """
+
+    def __init__(self, message: str, partial: str = ""):
+        super().__init__(message)
+        self.partial = partial
+
+def is_failed_response(response: Optional[str]) -> bool:
+    """回答是否为生成失败时返回的错误说明"""
+    return isinstance(response, FailedResponse)
+
+# 搜索未在截止时间内返回的次数：次数偏高说明 SEARCH_DEADLINE 相对搜索服务的实际耗时过短
+SEARCH_DEADLINE_MISSES = REGISTRY.counter("medical_search_deadline_misses_total", "搜索超过截止时间未返回的次数")
+
+# 并发执行搜索和推测性生成的线程池
+_executor = ThreadPoolExecutor(max_workers=AI_WORKER_THREADS, thread_name_prefix="medical-ai")
 
 class AIProvider(ABC):
     """AI服务提供者的抽象基类"""
@@ -14,49 +63,223 @@ class AIProvider(ABC):
         """生成AI回复的抽象方法"""
         pass
 
+    def generate_response_stream(self, prompt: str, conversation_history: Optional[List] = None) -> Iterator[str]:
+        """
+        流式生成AI回复，逐段产出新增的文本片段
+
+        默认实现退化为一次性返回完整回复，支持流式输出的提供者应覆盖此方法。
+
+        Raises:
+            ResponseStreamError: 生成失败
+        """
+        response = self.generate_response(prompt, conversation_history)
+        if is_failed_response(response):
+            raise ResponseStreamError(response)
+        yield response
+
+    async def agenerate_response(self, prompt: str, conversation_history: Optional[List] = None) -> str:
+        """
+        生成AI回复的 asyncio 版本
+
+        默认实现在线程池中执行同步的 generate_response，提供原生异步客户端的提供者应覆盖此方法。
+        """
+        return await asyncio.to_thread(self.generate_response, prompt, conversation_history)
+
+    def cache_identity(self) -> Dict[str, Any]:
+        """返回影响回答内容的参数，用于构造响应缓存键"""
+        return {"provider": type(self).__name__}
+
+    def record_exchange(self, prompt: str, response: str, conversation_history: Optional[List] = None):
+        """不调用模型，直接将一轮问答写入对话历史（例如命中缓存时）"""
+        if conversation_history is not None:
+            conversation_history.append({"role": "user", "content": prompt})
+            conversation_history.append({"role": "assistant", "content": response})
+
 class DeepSeekProvider(AIProvider):
-    """DeepSeek服务实现，支持多轮对话"""
+    """
+    DeepSeek服务实现，支持多轮对话
+
+    接口调用经过 ResilientCaller：有总时限，临时错误带抖动重试，连续失败后熔断，
+    耗时超过近期 p95 时发出对冲请求。客户端自身的重试关闭，避免与之叠加。
+    """
     
-    def __init__(self, api_key: Optional[str] = None, base_url: str = "https://api.deepseek.com"):
+    def __init__(
+        self,
+        api_key: Optional[str] = None,
+        base_url: str = "https://api.deepseek.com",
+        model: str = "deepseek-chat",
+        temperature: float = 0.7,
+        max_tokens: int = 400,
+        history_manager: Optional[HistoryManager] = None,
+        timeout: float = LLM_TIMEOUT,
+        hedge: bool = LLM_HEDGE_ENABLED
+    ):
         self.api_key = api_key or os.getenv("DEEPSEEK_API_KEY")
         if not self.api_key:
             raise ValueError("DeepSeek API key is required")
-        self.client = OpenAI(api_key=self.api_key, base_url=base_url)
+        client_timeout = openai.Timeout(timeout, connect=LLM_CONNECT_TIMEOUT)
+        self.client = OpenAI(api_key=self.api_key, base_url=base_url, timeout=client_timeout, max_retries=0)
+        self.async_client = AsyncOpenAI(api_key=self.api_key, base_url=base_url, timeout=client_timeout, max_retries=0)
+        # 非流式与流式调用的耗时分布不同，分别统计对冲延迟，共用一个熔断器
+        self.breaker = CircuitBreaker()
+        self.caller = ResilientCaller("deepseek", timeout, breaker=self.breaker, hedge=hedge)
+        self.stream_caller = ResilientCaller("deepseek-stream", timeout, breaker=self.breaker, hedge=hedge)
+        self.model = model
+        self.temperature = temperature  # 控制回答的创造性
+        self.max_tokens = max_tokens    # 限制回答长度
+        self.history_manager = history_manager or HistoryManager()
         self.conversation_history = []
 
+    def _prepare_messages(self, prompt: str, conversation_history: Optional[List] = None) -> List:
+        """取得本次请求使用的对话历史，并追加用户的新问题"""
+        # 如果提供了外部对话历史，使用它；否则使用内部历史
+        messages = conversation_history if conversation_history is not None else self.conversation_history
+        
+        # 如果是新对话，添加系统提示（原地修改，保证调用方的历史同步更新）
+        if not messages:
+            messages.append({"role": "system", "content": MEDICAL_ADVICE_PROMPT})
+        
+        # 添加用户的新问题
+        messages.append({"role": "user", "content": prompt})
+        
+        # 按 token 预算压缩历史，避免请求体随问诊轮数线性增长
+        prompt_tokens = self.history_manager.compact(messages)
+        print(f"本次请求提示词约 {prompt_tokens} tokens（{len(messages)} 条消息）")
+        return messages
+
+    @staticmethod
+    def _request_timeout(timeout: float) -> "openai.Timeout":
+        """单次请求的超时不超过调用剩余的时间"""
+        return openai.Timeout(timeout, connect=min(LLM_CONNECT_TIMEOUT, timeout))
+
+    @staticmethod
+    def _report_usage(usage):
+        """打印接口返回的实际 token 用量"""
+        if usage is not None:
+            print(f"实际用量: 提示词 {usage.prompt_tokens} tokens，回答 {usage.completion_tokens} tokens")
+
     def generate_response(self, prompt: str, conversation_history: Optional[List] = None) -> str:
         try:
-            # 如果提供了外部对话历史，使用它；否则使用内部历史
-            messages = conversation_history if conversation_history is not None else self.conversation_history
+            messages = self._prepare_messages(prompt, conversation_history)
             
-            # 如果是新对话，添加系统提示
-            if not messages:
-                messages = [{"role": "system", "content": MEDICAL_ADVICE_PROMPT}]
-            
-            # 添加用户的新问题
-            messages.append({"role": "user", "content": prompt})
-            
-            # 调用API
-            response = self.client.chat.completions.create(
-                model="deepseek-chat",
-                messages=messages,
-                temperature=0.7,  # 添加温度参数以控制回答的创造性
-                max_tokens=400,   # 限制回答长度
-                stream=False
-            )
+            # 调用API（请求本身不修改 messages，可以安全地重试和对冲）
+            with span("llm_total", model=self.model):
+                response = self.caller.call(lambda timeout: self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens,
+                    stream=False,
+                    timeout=self._request_timeout(timeout)
+                ))
+            self._report_usage(response.usage)
             
             # 保存AI的回复到对话历史
             ai_message = response.choices[0].message
             messages.append({"role": ai_message.role, "content": ai_message.content})
             
-            # 更新内部对话历史
-            if conversation_history is None:
-                self.conversation_history = messages
+            return ai_message.content
+        except Exception as e:
+            return FailedResponse(f"{ERROR_RESPONSE_PREFIX}: {str(e)}")
+
+    async def agenerate_response(self, prompt: str, conversation_history: Optional[List] = None) -> str:
+        try:
+            messages = self._prepare_messages(prompt, conversation_history)
+            
+            with span("llm_total", model=self.model):
+                response = await self.caller.acall(lambda timeout: self.async_client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens,
+                    stream=False,
+                    timeout=self._request_timeout(timeout)
+                ))
+            self._report_usage(response.usage)
+            
+            ai_message = response.choices[0].message
+            messages.append({"role": ai_message.role, "content": ai_message.content})
             
             return ai_message.content
         except Exception as e:
-            return f"Error generating response: {str(e)}"
+            return FailedResponse(f"{ERROR_RESPONSE_PREFIX}: {str(e)}")
+
+    def generate_response_stream(self, prompt: str, conversation_history: Optional[List] = None) -> Iterator[str]:
+        """
+        流式调用API，逐段产出模型返回的文本增量，结束后将完整回复写入对话历史
+
+        Raises:
+            ResponseStreamError: 请求失败或中途断开，partial 为已产出的文本，不写入对话历史
+        """
+        # 阶段跨越多次 yield，不设为当前阶段，只记录耗时
+        llm_span = begin_span("llm_total", model=self.model, stream=True)
+        stream = None
+        try:
+            chunks = []
+            messages = self._prepare_messages(prompt, conversation_history)
+            
+            def open_stream(timeout):
+                """建立流式请求并取得第一个分片，截止时间、重试和对冲都作用于首字延迟"""
+                stream = self.client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=self.temperature,
+                    max_tokens=self.max_tokens,
+                    stream=True,
+                    stream_options={"include_usage": True},
+                    timeout=self._request_timeout(timeout)
+                )
+                try:
+                    return stream, next(iter(stream), None)
+                except BaseException:
+                    stream.close()
+                    raise
+            
+            # 收到第一段文本之后不再重试，否则已产出的内容会重复
+            stream, first = self.stream_caller.call(open_stream, discard=lambda opened: opened[0].close())
+            observe_stage("llm_ttft", time.perf_counter() - llm_span.start)
+            
+            for chunk in itertools.chain([first] if first is not None else [], stream):
+                if not chunk.choices:
+                    # 最后一个分片只携带用量统计
+                    self._report_usage(chunk.usage)
+                    continue
+                delta = chunk.choices[0].delta.content
+                if delta:
+                    chunks.append(delta)
+                    yield delta
+            
+            # 保存拼接后的完整回复到对话历史
+            messages.append({"role": "assistant", "content": "".join(chunks)})
+        except Exception as e:
+            llm_span.fail(str(e))
+            raise ResponseStreamError(f"{ERROR_RESPONSE_PREFIX}: {str(e)}", "".join(chunks)) from e
+        finally:
+            # 调用方提前停止迭代时关闭连接，模型不再继续生成
+            if stream is not None:
+                stream.close()
+            llm_span.end()
     
+    def resilience_stats(self) -> Dict[str, Dict[str, Any]]:
+        """返回非流式与流式调用的重试、对冲和熔断统计"""
+        return {"blocking": self.caller.stats(), "stream": self.stream_caller.stats()}
+
+    def cache_identity(self) -> Dict[str, Any]:
+        return {
+            "provider": type(self).__name__,
+            "model": self.model,
+            "temperature": self.temperature,
+            "max_tokens": self.max_tokens,
+            "system_prompt": MEDICAL_ADVICE_PROMPT
+        }
+
+    def record_exchange(self, prompt: str, response: str, conversation_history: Optional[List] = None):
+        messages = conversation_history if conversation_history is not None else self.conversation_history
+        if not messages:
+            messages.append({"role": "system", "content": MEDICAL_ADVICE_PROMPT})
+        messages.append({"role": "user", "content": prompt})
+        messages.append({"role": "assistant", "content": response})
+
     def clear_history(self):
         """清除对话历史"""
         self.conversation_history = []
@@ -64,60 +287,282 @@ class DeepSeekProvider(AIProvider):
 class MedicalAI:
     """医疗AI服务的主类"""
     
-    def __init__(self, provider: AIProvider, search_service: Optional[SearchService] = None):
+    def __init__(
+        self,
+        provider: AIProvider,
+        search_service: Optional[SearchService] = None,
+        response_cache: Optional[TTLCache] = None,
+        search_deadline: Optional[float] = SEARCH_DEADLINE,
+        speculative_generation: bool = SPECULATIVE_GENERATION,
+        search_trigger: Optional[SearchTrigger] = None
+    ):
         self.provider = provider
         self.search_service = search_service
+        self.response_cache = response_cache  # 仅缓存无历史的首轮问题
+        self.search_deadline = search_deadline  # 等待搜索结果的最长时间（秒），None 表示一直等待
+        self.speculative_generation = speculative_generation  # 搜索期间是否同时生成无搜索上下文的回答
+        self.search_trigger = search_trigger or get_search_trigger()
         self.conversation_history = []
 
     def should_use_search(self, prompt: str) -> bool:
-        """判断是否需要使用搜索功能"""
-        # 包含特定关键词的问题可能需要最新信息
-        search_keywords = [
-            "最新", "研究", "进展", "新闻", "最近",
-            "数据", "统计", "报告", "新型", "新药",
-            "临床试验", "治疗方法"
-        ]
-        
-        return any(keyword in prompt for keyword in search_keywords)
-
-    def get_medical_advice(self, prompt: str) -> str:
-        """获取医疗建议"""
+        """判断是否需要使用搜索功能：触发词加权得分达到阈值的问题可能需要最新信息"""
+        return self.search_trigger.evaluate(prompt).should_search
+
+    @staticmethod
+    def _normalize_question(prompt: str) -> str:
+        """补全问题结尾的标点"""
         if not prompt.strip().endswith(('。', '？', '！', '.', '?', '!')):
             prompt = prompt.strip() + '。'
-        
+        return prompt
+
+    def _needs_search(self, prompt: str) -> bool:
+        if self.search_service is None:
+            return False
+        if getattr(self.search_service, "always_search", False):
+            # 本地资料检索没有网络开销，每个问题都检索；网络搜索是否进行由检索服务自行判断
+            return True
+        trigger = self.search_trigger.evaluate(prompt)
         # 添加调试信息
-        should_search = self.should_use_search(prompt)
-        print(f"问题包含搜索关键词: {should_search}")
-        print(f"搜索服务是否可用: {self.search_service is not None}")
+        print(f"搜索触发: 得分 {trigger.score:.2f}/{trigger.threshold:.2f}，命中 {trigger.matched}"
+              + (f"，被否定 {trigger.negated}" if trigger.negated else ""))
+        return trigger.should_search
+
+    def _start_search(self, prompt: str) -> Optional[Future]:
+        """需要搜索时立即在后台线程中发起搜索，返回 Future"""
+        if not self._needs_search(prompt):
+            return None
+        print("正在执行搜索...")
+        return _executor.submit(contextvars.copy_context().run, self._search, prompt)
+
+    def _search(self, prompt: str) -> List[Dict[str, Any]]:
+        with span("search") as search_span:
+            results = self.search_service.search(prompt)
+            search_span.set(results=len(results))
+            return results
+
+    def _wait_search(self, search_future: Optional[Future]) -> List[Dict[str, Any]]:
+        """在截止时间内等待搜索结果，超时则放弃本次搜索上下文（搜索仍在后台完成并写入缓存）"""
+        if search_future is None:
+            return []
+        try:
+            search_results = search_future.result(timeout=self.search_deadline)
+        except FutureTimeoutError:
+            SEARCH_DEADLINE_MISSES.inc()
+            print(f"搜索超过 {self.search_deadline} 秒未返回，不使用搜索结果直接作答")
+            return []
+        if not search_results:
+            print("未找到搜索结果")
+        return search_results
+
+    def _speculate(self, prompt: str, conversation_history: List, cancelled: threading.Event) -> Optional[str]:
+        """
+        推测性生成无搜索上下文的回答
+
+        以流式方式接收，cancelled 被设置（搜索结果及时返回）后停止接收并关闭请求，返回 None。
+        """
+        if cancelled.is_set():
+            return None
+        stream = self.provider.generate_response_stream(prompt, conversation_history)
+        chunks = []
+        try:
+            for delta in stream:
+                if cancelled.is_set():
+                    return None
+                chunks.append(delta)
+        except ResponseStreamError as e:
+            return FailedResponse(str(e))
+        finally:
+            stream.close()
+        return "".join(chunks)
+
+    def _augment_prompt(self, prompt: str, search_results: List[Dict[str, Any]]) -> Tuple[str, List[str]]:
+        """将搜索结果作为上下文拼接到问题前，返回增强后的提示词和参考链接"""
+        if not search_results:
+            return prompt, []
+        
+        print(f"找到 {len(search_results)} 条搜索结果")
+        search_context = self.search_service.format_search_results(search_results)
+        reference_links = [result['link'] for result in search_results]
+        enhanced_prompt = f"{search_context}\n\n{SEARCH_CONTEXT_INSTRUCTION}\n{prompt}"
+        return enhanced_prompt, reference_links
+
+    def _build_prompt(self, prompt: str) -> Tuple[str, List[str]]:
+        """规范化问题并按需拼接搜索上下文，返回增强后的提示词和参考链接"""
+        prompt = self._normalize_question(prompt)
+        search_results = self._wait_search(self._start_search(prompt))
+        return self._augment_prompt(prompt, search_results)
+
+    @staticmethod
+    def _format_references(reference_links: List[str]) -> str:
+        """将参考链接格式化为附加在回答末尾的文本"""
+        if not reference_links:
+            return ""
+        references = f"\n\n{REFERENCES_HEADER}\n"
+        for i, link in enumerate(reference_links, 1):
+            references += f"{i}. {link}\n"
+        return references
+
+    def _cache_key(self, prompt: str, conversation_history: List) -> Optional[str]:
+        """首轮问题返回缓存键，已有对话上下文、附加了既往就诊等上下文或未启用缓存时返回 None"""
+        if self.response_cache is None:
+            return None
+        if any(message["role"] != "system" or message["content"] != MEDICAL_ADVICE_PROMPT
+               for message in conversation_history):
+            return None
+        return make_cache_key(normalize_prompt(prompt), self.provider.cache_identity())
+
+    def _lookup_cache(self, cache_key: Optional[str], prompt: str, conversation_history: List) -> Optional[str]:
+        """命中缓存时将问答写入对话历史，并返回带参考链接的完整回答"""
+        if cache_key is None:
+            return None
+        cached = self.response_cache.get(cache_key)
+        if cached is None:
+            return None
+        print("命中回答缓存")
+        self.provider.record_exchange(prompt, cached["answer"], conversation_history)
+        return cached["answer"] + self._format_references(cached["references"])
+
+    def _store_cache(self, cache_key: Optional[str], answer: str, reference_links: List[str]):
+        if cache_key is not None and answer and not is_failed_response(answer):
+            self.response_cache.set(cache_key, {"answer": answer, "references": reference_links})
+
+    def get_medical_advice(self, prompt: str, conversation_history: Optional[List] = None) -> str:
+        """
+        获取医疗建议
+        
+        Args:
+            prompt: 患者的问题
+            conversation_history: 会话独立的对话历史，未提供时使用实例共享的历史
+        """
+        if conversation_history is None:
+            conversation_history = self.conversation_history
+        cache_key = self._cache_key(prompt, conversation_history)
+        cached = self._lookup_cache(cache_key, prompt, conversation_history)
+        if cached is not None:
+            return cached
         
-        search_context = ""
-        reference_links = []
+        prompt = self._normalize_question(prompt)
+        search_future = self._start_search(prompt)
         
-        if self.search_service and should_search:
+        speculative_future = None
+        speculation_cancelled = threading.Event()
+        if search_future is not None and self.speculative_generation:
+            # 搜索的同时用历史副本推测性地生成无搜索上下文的回答，搜索超时时直接采用
+            speculative_history = [dict(message) for message in conversation_history]
+            speculative_future = _executor.submit(
+                contextvars.copy_context().run,
+                self._speculate, prompt, speculative_history, speculation_cancelled
+            )
+        
+        search_results = self._wait_search(search_future)
+        if speculative_future is not None and not search_results:
+            response = speculative_future.result()
+            if not is_failed_response(response):
+                # 失败的推测性回答不写回对话历史
+                conversation_history[:] = speculative_history
+            reference_links = []
+        else:
+            if speculative_future is not None:
+                # 搜索结果及时返回，中止推测性请求以节省 token
+                speculation_cancelled.set()
+                speculative_future.cancel()
+            enhanced_prompt, reference_links = self._augment_prompt(prompt, search_results)
+            response = self.provider.generate_response(enhanced_prompt, conversation_history)
+        self._store_cache(cache_key, response, reference_links)
+        if is_failed_response(response):
+            return response
+        
+        # 如果有搜索结果，在回答末尾添加参考链接
+        return response + self._format_references(reference_links)
+
+    async def aget_medical_advice(self, prompt: str, conversation_history: Optional[List] = None) -> str:
+        """
+        获取医疗建议的 asyncio 版本，搜索与推测性生成在同一事件循环中并发执行
+        
+        Args:
+            prompt: 患者的问题
+            conversation_history: 会话独立的对话历史，未提供时使用实例共享的历史
+        """
+        if conversation_history is None:
+            conversation_history = self.conversation_history
+        cache_key = self._cache_key(prompt, conversation_history)
+        cached = self._lookup_cache(cache_key, prompt, conversation_history)
+        if cached is not None:
+            return cached
+        
+        prompt = self._normalize_question(prompt)
+        search_task = None
+        if self._needs_search(prompt):
             print("正在执行搜索...")
-            search_results = self.search_service.search(prompt)
-            if search_results:
-                print(f"找到 {len(search_results)} 条搜索结果")
-                search_context = self.search_service.format_search_results(search_results)
-                reference_links = [result['link'] for result in search_results]
-            else:
-                print("未找到搜索结果")
-        
-        # 将搜索结果作为上下文添加到提示中
-        if search_context:
-            enhanced_prompt = f"{search_context}\n\n基于以上参考信息，请回答以下问题。在回答的最后，请列出参考来源：\n{prompt}"
+            search_task = asyncio.ensure_future(asyncio.to_thread(self._search, prompt))
+        
+        speculative_task = None
+        if search_task is not None and self.speculative_generation:
+            speculative_history = [dict(message) for message in conversation_history]
+            speculative_task = asyncio.ensure_future(
+                self.provider.agenerate_response(prompt, speculative_history)
+            )
+        
+        search_results = []
+        if search_task is not None:
+            try:
+                search_results = await asyncio.wait_for(asyncio.shield(search_task), self.search_deadline)
+                if not search_results:
+                    print("未找到搜索结果")
+            except asyncio.TimeoutError:
+                SEARCH_DEADLINE_MISSES.inc()
+                print(f"搜索超过 {self.search_deadline} 秒未返回，不使用搜索结果直接作答")
+        
+        if speculative_task is not None and not search_results:
+            response = await speculative_task
+            if not is_failed_response(response):
+                conversation_history[:] = speculative_history
+            reference_links = []
         else:
-            enhanced_prompt = prompt
+            if speculative_task is not None:
+                # 搜索结果及时返回，取消推测性请求以节省 token
+                speculative_task.cancel()
+            enhanced_prompt, reference_links = self._augment_prompt(prompt, search_results)
+            response = await self.provider.agenerate_response(enhanced_prompt, conversation_history)
+        self._store_cache(cache_key, response, reference_links)
+        if is_failed_response(response):
+            return response
+        
+        return response + self._format_references(reference_links)
+
+    def get_medical_advice_stream(self, prompt: str, conversation_history: Optional[List] = None) -> Iterator[str]:
+        """
+        流式获取医疗建议
+        
+        Args:
+            prompt: 患者的问题
+            conversation_history: 会话独立的对话历史，未提供时使用实例共享的历史
             
-        response = self.provider.generate_response(enhanced_prompt, self.conversation_history)
+        Yields:
+            截至目前已生成的完整回答文本，最后一次产出包含参考链接
+
+        Raises:
+            ResponseStreamError: 生成中途失败，不完整的回答不写入缓存和对话历史
+        """
+        if conversation_history is None:
+            conversation_history = self.conversation_history
+        cache_key = self._cache_key(prompt, conversation_history)
+        cached = self._lookup_cache(cache_key, prompt, conversation_history)
+        if cached is not None:
+            yield cached
+            return
+        
+        enhanced_prompt, reference_links = self._build_prompt(prompt)
+        
+        # 生成中途失败时 ResponseStreamError 直接抛给调用方，不会执行到写入缓存
+        response = ""
+        for delta in self.provider.generate_response_stream(enhanced_prompt, conversation_history):
+            response += delta
+            yield response
+        self._store_cache(cache_key, response, reference_links)
         
-        # 如果有搜索结果，在回答末尾添加参考链接
         if reference_links:
-            response += "\n\n参考来源：\n"
-            for i, link in enumerate(reference_links, 1):
-                response += f"{i}. {link}\n"
-            
-        return response
+            yield response + self._format_references(reference_links)
     
     def clear_conversation(self):
         """清除当前对话历史"""
@@ -129,6 +574,10 @@ def create_medical_ai(
     provider_type: str = "deepseek",
     enable_search: bool = False,
     serper_api_key: Optional[str] = None,
+    enable_cache: bool = False,
+    cache_db_path: Optional[str] = None,
+    search_cache_db_path: Optional[str] = None,
+    knowledge_index_dir: Optional[str] = None,
     **kwargs
 ) -> MedicalAI:
     """
@@ -138,6 +587,10 @@ def create_medical_ai(
         provider_type: AI提供者类型 ("deepseek")
         enable_search: 是否启用搜索功能
         serper_api_key: Serper API密钥
+        enable_cache: 是否缓存首轮问题的回答和搜索结果
+        cache_db_path: 回答缓存持久化的SQLite路径，为空时只使用内存缓存
+        search_cache_db_path: 搜索结果缓存持久化的SQLite路径，为空时只使用内存缓存
+        knowledge_index_dir: 本地医学资料索引目录，索引存在时先检索本地资料再进行网络搜索
         **kwargs: 提供者特定的配置参数
     """
     providers = {
@@ -151,6 +604,20 @@ def create_medical_ai(
     if enable_search:
         if not serper_api_key:
             raise ValueError("Serper API key is required when search is enabled")
-        search_service = SearchService(serper_api_key)
+        search_cache = None
+        if enable_cache:
+            search_cache = TTLCache(SEARCH_CACHE_MAX_ENTRIES, SEARCH_CACHE_TTL, search_cache_db_path, name="search")
+        search_service = SearchService(serper_api_key, cache=search_cache)
+    
+    if knowledge_index_dir:
+        from knowledge_index import KnowledgeIndex, LocalFirstSearch, index_exists
+        if index_exists(knowledge_index_dir):
+            search_service = LocalFirstSearch(KnowledgeIndex(knowledge_index_dir), search_service, get_search_trigger())
+        else:
+            print(f"未找到本地资料索引 {knowledge_index_dir}，可运行 python knowledge_index.py build 建立")
+    
+    response_cache = None
+    if enable_cache:
+        response_cache = TTLCache(RESPONSE_CACHE_MAX_ENTRIES, RESPONSE_CACHE_TTL, cache_db_path, name="response")
     
-    return MedicalAI(providers[provider_type](), search_service)
+    return MedicalAI(providers[provider_type](), search_service, response_cache)
@@ -1,27 +1,22 @@
 from PIL import Image, ImageDraw, ImageFont
 import datetime
 import os
-from config import FONT_PATH, TEMP_RECORD_PATH
-import textwrap
+import threading
+from functools import lru_cache
+from config import FONT_PATH, TEMPLATE_RECORD_PATH, RECORD_PNG_COMPRESS_LEVEL
+from text_layout import TextLayout
+from temp_manager import get_temp_manager
+from metrics import span
+from prompts import REFERENCES_HEADER
 
-def wrap_text(text, width=40):
-    """将长文本按指定宽度换行"""
-    return '\n'.join(textwrap.wrap(text, width=width))
+@lru_cache(maxsize=8)
+def load_font(font_path, size):
+    """加载字体，同一字体和字号只从磁盘读取一次；font_path 为 None 时使用 Pillow 内置字体（不含中文字形，仅供测试）"""
+    if font_path is None:
+        return ImageFont.load_default(size)
+    return ImageFont.truetype(font_path, size)
 
-def create_template_record():
-    """创建空白的病历模板"""
-    try:
-        width = 800
-        height = 1000  # 增加高度
-        margin = 80    # 页面边距
-        image = Image.new('RGB', (width, height), 'white')
-        draw = ImageDraw.Draw(image)
-        
-        font = ImageFont.truetype(FONT_PATH, 20)
-        
-        current_time = datetime.datetime.now().strftime("%Y-%m-%d")
-        
-        template_content = f"""
+TEMPLATE_CONTENT = """
 电子病历
 ==================
 就诊日期：{current_time}
@@ -38,61 +33,14 @@ def create_template_record():
 ==================
 注：本病历由AI辅助生成，仅供参考。
         """
-        
-        # 绘制文字，使用统一的左边距
-        y_position = margin
-        for line in template_content.split('\n'):
-            draw.text((margin, y_position), line.strip(), font=font, fill='black')
-            y_position += 30  # 行间距
-        
-        image.save(TEMP_RECORD_PATH)
-        return TEMP_RECORD_PATH
-    except Exception as e:
-        print(f"创建模板出错：{str(e)}")
-        return None
 
-def generate_medical_record(info, answer):
-    """生成带有内容的病历"""
-    try:
-        width = 800
-        height = 1000  # 增加高度
-        margin = 80    # 页面边距
-        content_width = width - (margin * 2)  # 内容区域宽度
-        char_width = 20  # 估计的单个字符宽度
-        max_chars_per_line = int(content_width / char_width)  # 每行最大字符数
-        
-        image = Image.new('RGB', (width, height), 'white')
-        draw = ImageDraw.Draw(image)
-        
-        font = ImageFont.truetype(FONT_PATH, 20)
-        
-        current_time = datetime.datetime.now().strftime("%Y-%m-%d")
-        
-        # 处理患者信息
-        info = info if info and info.strip() else "未提供患者信息"
-        info = wrap_text(info, width=max_chars_per_line - 4)
-        
-        # 处理AI回答，移除参考链接部分
-        answer = answer if answer and answer.strip() else "未提供诊断信息"
-        # 如果回答中包含"参考："，只保留之前的内容
-        if "参考：" in answer:
-            answer = answer.split("参考：")[0].strip()
-        answer = wrap_text(answer, width=max_chars_per_line - 4)
-        
-        # 构建内容
-        header = f"""
+HEADER_CONTENT = """
 电子病历
 ==================
 就诊日期：{current_time}
 """
-        
-        body = f"""
-患者信息：
-{info}
-
-主诉：
-{answer}
 
+FOOTER_CONTENT = """
 医生建议：
 请遵医嘱用药，保持良好作息。
 如有不适请及时就医。
@@ -100,24 +48,224 @@ def generate_medical_record(info, answer):
 ==================
 注：本病历由AI辅助生成，仅供参考。
 """
-        
-        # 绘制文字
-        y_position = margin
-        
-        # 绘制头部
-        for line in header.strip().split('\n'):
-            draw.text((margin, y_position), line.strip(), font=font, fill='black')
-            y_position += 30
-        
-        y_position += 10  # 添加额外间距
-        
-        # 绘制主体内容
-        for line in body.strip().split('\n'):
-            draw.text((margin, y_position), line.strip(), font=font, fill='black')
-            y_position += 30
-        
-        image.save(TEMP_RECORD_PATH)
-        return TEMP_RECORD_PATH
+
+# 病历只有黑白文字，使用灰度图像，复制和PNG编码的数据量只有RGB的三分之一
+IMAGE_MODE = 'L'
+
+class RecordRenderer:
+    """
+    电子病历渲染器
+
+    字体只加载一次；页头（含当天日期）、页脚和空白模板预先渲染并缓存，
+    生成病历时只在页头图像的副本上绘制患者信息和诊断内容，再贴上页脚。
+    正文按字形的实际像素宽度换行，内容超出一页时PNG自动加长，PDF则分页输出。
+    """
+
+    def __init__(
+        self,
+        font_path=FONT_PATH,
+        font_size=20,
+        width=800,
+        height=1000,
+        margin=80,
+        line_height=30,
+        png_compress_level=RECORD_PNG_COMPRESS_LEVEL
+    ):
+        self.font = load_font(font_path, font_size)
+        self.width = width
+        self.height = height
+        self.margin = margin                  # 页面边距
+        self.line_height = line_height        # 行间距
+        self.png_compress_level = png_compress_level
+        self.layout = TextLayout(self.font)   # 字宽和换行结果都会缓存
+        self._lock = threading.Lock()
+        self._cache_date = None
+        self._header = None                   # 已绘制页头的空白页
+        self._body_top = 0                    # 页头之后正文的起始纵坐标
+        self._footer = None                   # 页脚图像
+        self._template_path = None            # 当天模板的输出路径
+
+    def _draw_lines(self, draw, lines, y_position):
+        """按统一的左边距逐行绘制文字，返回下一行的纵坐标"""
+        for line in lines:
+            draw.text((self.margin, y_position), line.strip(), font=self.font, fill='black')
+            y_position += self.line_height
+        return y_position
+
+    def _ensure_cache(self):
+        """日期变化时重新渲染页头和页脚，调用方需持有锁"""
+        current_time = datetime.datetime.now().strftime("%Y-%m-%d")
+        if self._cache_date == current_time:
+            return
+
+        header = Image.new(IMAGE_MODE, (self.width, self.height), 'white')
+        draw = ImageDraw.Draw(header)
+        y_position = self._draw_lines(draw, HEADER_CONTENT.format(current_time=current_time).strip().split('\n'), self.margin)
+        self._header = header
+        self._body_top = y_position + 10  # 添加额外间距
+
+        footer_lines = FOOTER_CONTENT.strip().split('\n')
+        footer = Image.new(IMAGE_MODE, (self.width, len(footer_lines) * self.line_height), 'white')
+        self._draw_lines(ImageDraw.Draw(footer), footer_lines, 0)
+        self._footer = footer
+
+        self._template_path = None  # 模板在首次需要时再渲染
+        self._cache_date = current_time
+
+    def render_template(self):
+        """返回当天空白病历模板的路径，模板每天只渲染一次"""
+        with self._lock:
+            self._ensure_cache()
+            if self._template_path is None or not os.path.exists(self._template_path):
+                template = Image.new(IMAGE_MODE, (self.width, self.height), 'white')
+                self._draw_lines(ImageDraw.Draw(template), TEMPLATE_CONTENT.format(current_time=self._cache_date).split('\n'), self.margin)
+                # 先写入临时文件再替换，其他请求不会读到写了一半的模板
+                os.makedirs(os.path.dirname(TEMPLATE_RECORD_PATH) or ".", exist_ok=True)
+                partial_path = f"{TEMPLATE_RECORD_PATH}.{os.getpid()}.tmp"
+                template.save(partial_path, format="PNG", compress_level=self.png_compress_level)
+                os.replace(partial_path, TEMPLATE_RECORD_PATH)
+                self._template_path = TEMPLATE_RECORD_PATH
+            return self._template_path
+
+    def _body_lines(self, info, answer):
+        """将患者信息和诊断内容按正文宽度排版为行列表"""
+        max_width = self.width - self.margin * 2
+
+        # 处理患者信息，保留OCR结果原有的换行
+        info = info if info and info.strip() else "未提供患者信息"
+
+        # 处理AI回答，移除参考链接部分
+        answer = answer if answer and answer.strip() else "未提供诊断信息"
+        # 如果回答中包含参考链接列表或"参考："，只保留之前的内容
+        for marker in (REFERENCES_HEADER, "参考："):
+            answer = answer.split(marker)[0].strip()
+
+        return (["患者信息："] + self.layout.wrap(info.strip(), max_width) + ["", "主诉："]
+                + self.layout.wrap(answer.strip(), max_width))
+
+    def _prepare(self, info, answer):
+        lines = self._body_lines(info, answer)
+        with self._lock:
+            self._ensure_cache()
+            return lines, self._header, self._footer, self._body_top
+
+    def render(self, info, answer, output_path=None, session_id=None):
+        """
+        在缓存的页头上绘制患者信息和诊断内容，贴上页脚后保存，内容较长时加长画布
+
+        未指定 output_path 时为本次请求分配唯一的临时文件，并记在 session_id 名下
+        """
+        with span("record_render"):
+            lines, header, footer, body_top = self._prepare(info, answer)
+
+            # 正文、正文与页脚之间的空行、页脚和下边距所需的总高度
+            footer_top = body_top + (len(lines) + 1) * self.line_height
+            height = footer_top + footer.height + self.margin
+            if height <= self.height:
+                image = header.copy()
+            else:
+                image = Image.new(IMAGE_MODE, (self.width, height), 'white')
+                image.paste(header.crop((0, 0, self.width, body_top)), (0, 0))
+
+            draw = ImageDraw.Draw(image)
+            self._draw_lines(draw, lines, body_top)
+            image.paste(footer, (0, footer_top))
+
+            output_path = output_path or get_temp_manager().new_path(".png", session_id, prefix="record")
+            image.save(output_path, compress_level=self.png_compress_level)
+            return output_path
+
+    def render_pages(self, info, answer):
+        """
+        按固定页高分页排版病历
+
+        Returns:
+            页面图像列表；页头只出现在第一页，页脚放在最后一页，放不下时另起一页
+        """
+        lines, header, footer, body_top = self._prepare(info, answer)
+        bottom = self.height - self.margin
+        pages = [header.copy()]
+        y_position = body_top
+
+        def new_page():
+            pages.append(Image.new(IMAGE_MODE, (self.width, self.height), 'white'))
+            return self.margin
+
+        draw = ImageDraw.Draw(pages[-1])
+        for line in lines:
+            if y_position + self.line_height > bottom:
+                y_position = new_page()
+                draw = ImageDraw.Draw(pages[-1])
+            y_position = self._draw_lines(draw, [line], y_position)
+
+        y_position += self.line_height  # 正文与页脚之间的空行
+        if y_position + footer.height > bottom:
+            y_position = new_page()
+        pages[-1].paste(footer, (0, y_position))
+        return pages
+
+    def render_pdf(self, info, answer, output_path=None, session_id=None):
+        """将分页后的病历保存为多页PDF"""
+        with span("record_pdf"):
+            pages = self.render_pages(info, answer)
+            output_path = output_path or get_temp_manager().new_path(".pdf", session_id, prefix="record")
+            pages[0].save(output_path, format="PDF", save_all=True, append_images=pages[1:])
+            return output_path
+
+_default_renderer = None
+_default_renderer_lock = threading.Lock()
+
+def get_record_renderer():
+    """获取进程内共享的病历渲染器"""
+    global _default_renderer
+    with _default_renderer_lock:
+        if _default_renderer is None:
+            _default_renderer = RecordRenderer()
+        return _default_renderer
+
+def create_template_record():
+    """创建空白的病历模板"""
+    try:
+        return get_record_renderer().render_template()
+    except Exception as e:
+        print(f"创建模板出错：{str(e)}")
+        return None
+
+def generate_medical_record(info, answer, session_id=None):
+    """生成带有内容的病历，每次请求写入独立的临时文件"""
+    try:
+        return get_record_renderer().render(info, answer, session_id=session_id)
     except Exception as e:
         print(f"病历生成出错：{str(e)}")
         return create_template_record()
+
+def generate_record_files(info, answer, session_id=None):
+    """
+    在渲染线程池中同时生成病历图片和PDF
+
+    Returns:
+        (图片路径, PDF路径)
+
+    Raises:
+        PoolBusyError: 渲染线程池已满
+    """
+    from worker_pools import get_pool
+    pool = get_pool("render")
+    record_path = pool.submit(generate_medical_record, info, answer, session_id)
+    pdf_path = pool.submit(generate_medical_record_pdf, info, answer, session_id)
+    return record_path.result(), pdf_path.result()
+
+def set_record_renderer(renderer):
+    """替换共享的病历渲染器（如使用其他字体），返回原来的渲染器"""
+    global _default_renderer
+    with _default_renderer_lock:
+        previous, _default_renderer = _default_renderer, renderer
+        return previous
+
+def generate_medical_record_pdf(info, answer, session_id=None):
+    """生成可打印的多页PDF病历，失败时返回 None"""
+    try:
+        return get_record_renderer().render_pdf(info, answer, session_id=session_id)
+    except Exception as e:
+        print(f"PDF病历生成出错：{str(e)}")
+        return None
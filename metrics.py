@@ -0,0 +1,460 @@
+"""
+耗时与计数指标
+
+轻量的进程内指标，不依赖第三方库：
+    - Counter / Histogram：按标签分组的计数器和直方图，直方图可估算分位数
+    - span()：统计一个处理阶段的耗时，出错时计入错误数；同一请求内的阶段共享 trace_id，
+      配置了 TRACE_EXPORT_PATH 时每个阶段写一行 JSON 到追踪文件（由后台线程写出）
+    - start_metrics_server()：以 Prometheus 文本格式在 /metrics 提供全部指标
+
+各阶段名称：upload（图像/音频预处理）、board_ocr、board_asr、search、llm_ttft、llm_total、
+record_render、record_pdf、tts，以及整条流程 ocr、consultation。
+"""
+import bisect
+import contextvars
+import itertools
+import json
+import os
+import queue
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+from config import METRICS_HOST, METRICS_PORT, TRACE_EXPORT_PATH, TRACE_QUEUE_SIZE
+
+# 覆盖从毫秒级缓存命中到数十秒的大模型调用
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.075, 0.1, 0.15, 0.2, 0.3, 0.4, 0.5, 0.75,
+                   1.0, 1.5, 2.0, 3.0, 5.0, 7.5, 10.0, 15.0, 30.0, 60.0)
+
+
+def _label_key(labelnames: Sequence[str], labels: Dict[str, str]) -> Tuple[str, ...]:
+    return tuple(str(labels.get(name, "")) for name in labelnames)
+
+
+def _format_labels(labelnames: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """按标签分组的累计计数"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = _label_key(self.labelnames, labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(_label_key(self.labelnames, labels), 0)
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            items = sorted(self._values.items())
+        for key, value in items:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """按标签分组的直方图（累计桶计数、总和与次数）"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签：[各桶计数（不累计，最后一个为 +Inf）, 总和, 次数]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = _label_key(self.labelnames, labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = [[0] * (len(self.buckets) + 1), 0.0, 0]
+                self._series[key] = series
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    def clear(self):
+        with self._lock:
+            self._series.clear()
+
+    def count(self, **labels) -> int:
+        with self._lock:
+            series = self._series.get(_label_key(self.labelnames, labels))
+            return series[2] if series else 0
+
+    def quantile(self, q: float, **labels) -> Optional[float]:
+        """按桶内线性插值估算分位数，没有样本时返回 None"""
+        with self._lock:
+            series = self._series.get(_label_key(self.labelnames, labels))
+            if not series or not series[2]:
+                return None
+            counts, total = list(series[0]), series[2]
+        rank = q * total
+        cumulative = 0
+        for index, bucket_count in enumerate(counts):
+            if cumulative + bucket_count >= rank and bucket_count:
+                lower = self.buckets[index - 1] if index else 0.0
+                if index == len(self.buckets):
+                    return lower  # 落在 +Inf 桶内，只能给出下界
+                upper = self.buckets[index]
+                return lower + (upper - lower) * (rank - cumulative) / bucket_count
+            cumulative += bucket_count
+        return self.buckets[-1]
+
+    def label_sets(self) -> List[Dict[str, str]]:
+        with self._lock:
+            keys = sorted(self._series)
+        return [dict(zip(self.labelnames, key)) for key in keys]
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            items = sorted((key, (list(series[0]), series[1], series[2])) for key, series in self._series.items())
+        for key, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                le = f'le="{_format_value(float(bound))}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {count}")
+        return lines
+
+
+class _GaugeCallback:
+    """读取时才计算的瞬时值，回调返回 {标签值元组: 数值}"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str],
+                 callback: Callable[[], Dict[Tuple[str, ...], float]]):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.callback = callback
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        try:
+            values = self.callback()
+        except Exception as e:
+            print(f"指标 {self.name} 读取失败: {str(e)}")
+            return lines
+        for key, value in sorted(values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Registry:
+    """指标注册表，同名指标只创建一次"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+
+    def _get_or_create(self, name: str, factory):
+        with self._lock:
+            metric = self._metrics.get(name)
+            if metric is None:
+                metric = factory()
+                self._metrics[name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._get_or_create(name, lambda: Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(name, lambda: Histogram(name, documentation, labelnames, buckets))
+
+    def gauge_callback(self, name: str, documentation: str, labelnames: Sequence[str],
+                       callback: Callable[[], Dict[Tuple[str, ...], float]]):
+        """注册读取时计算的瞬时值（如线程池排队数），重复注册时替换回调"""
+        with self._lock:
+            self._metrics[name] = _GaugeCallback(name, documentation, labelnames, callback)
+
+    def reset(self):
+        """清零所有计数器和直方图（用于分段压测），瞬时值不受影响"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            if hasattr(metric, "clear"):
+                metric.clear()
+
+    def render(self) -> str:
+        """Prometheus 文本格式"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+STAGE_SECONDS = REGISTRY.histogram("medical_stage_seconds", "各处理阶段耗时（秒）", ["stage"])
+STAGE_ERRORS = REGISTRY.counter("medical_stage_errors_total", "各处理阶段出错次数", ["stage"])
+CACHE_EVENTS = REGISTRY.counter("medical_cache_events_total", "缓存命中与未命中次数", ["cache", "result"])
+
+
+class TraceExporter:
+    """
+    追踪记录导出
+
+    阶段结束时只把记录放入有界队列，由后台线程写入 JSON Lines 文件；队列满时丢弃并计数，
+    不让磁盘写入拖慢请求。
+
+    Args:
+        path: 追踪文件路径
+        queue_size: 队列容量
+    """
+
+    def __init__(self, path: str, queue_size: int = TRACE_QUEUE_SIZE):
+        self.path = path
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self.dropped = 0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="trace-export", daemon=True)
+        self._thread.start()
+
+    def export(self, record: Dict):
+        try:
+            self._queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+    def _run(self):
+        with open(self.path, "a", encoding="utf-8") as f:
+            while True:
+                record = self._queue.get()
+                if record is None:
+                    break
+                f.write(json.dumps(record, ensure_ascii=False) + "\n")
+                # 队列暂时为空时刷盘，连续写入时合并为一次
+                if self._queue.empty():
+                    f.flush()
+
+    def close(self, timeout: float = 5.0):
+        """写完队列中剩余的记录后停止后台线程"""
+        self._queue.put(None)
+        self._thread.join(timeout)
+
+
+_exporter: Optional[TraceExporter] = None
+_exporter_configured = False
+_exporter_lock = threading.Lock()
+
+
+def configure_tracing(path: Optional[str] = TRACE_EXPORT_PATH) -> Optional[TraceExporter]:
+    """设置追踪文件路径，为 None 时关闭追踪导出"""
+    global _exporter, _exporter_configured
+    with _exporter_lock:
+        if _exporter is not None:
+            _exporter.close()
+        _exporter = TraceExporter(path) if path else None
+        _exporter_configured = True
+        return _exporter
+
+
+def _get_exporter() -> Optional[TraceExporter]:
+    """第一次记录阶段时按配置创建导出线程，模块导入时不产生任何副作用"""
+    global _exporter, _exporter_configured
+    if not _exporter_configured:
+        with _exporter_lock:
+            if not _exporter_configured:
+                _exporter = TraceExporter(TRACE_EXPORT_PATH) if TRACE_EXPORT_PATH else None
+                _exporter_configured = True
+    return _exporter
+
+
+# 当前所在阶段 (trace_id, span_id)，线程池提交任务时随上下文复制
+_current_span: contextvars.ContextVar = contextvars.ContextVar("current_span", default=None)
+
+
+class Span:
+    """
+    一个处理阶段，可在阶段内补充属性或标记失败
+
+    作为上下文管理器使用时在 with 块内成为当前阶段，退出时结束并记录耗时。
+    """
+
+    __slots__ = ("stage", "trace_id", "span_id", "parent_id", "attributes", "error", "start", "ended", "_token")
+
+    def __init__(self, stage: str, attributes: Dict):
+        parent = _current_span.get()
+        if parent is None:
+            self.trace_id, self.parent_id = _random.getrandbits(64), None
+        else:
+            self.trace_id, self.parent_id = parent
+        self.stage = stage
+        self.span_id = next(_span_ids)
+        self.attributes = attributes
+        self.error = None
+        self.ended = False
+        self._token = None
+        self.start = time.perf_counter()
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def fail(self, message: str):
+        """标记失败（用于不抛异常、只返回错误文本的调用）"""
+        self.error = message
+
+    @contextmanager
+    def activate(self):
+        """在 with 块内把本阶段设为当前阶段，其间开始的阶段（含提交到线程池的任务）成为子阶段"""
+        token = _current_span.set((self.trace_id, self.span_id))
+        try:
+            yield self
+        finally:
+            _current_span.reset(token)
+
+    def end(self):
+        """结束阶段并记录耗时，重复调用无效"""
+        if self.ended:
+            return
+        self.ended = True
+        _finish(self, time.perf_counter() - self.start)
+
+    def __enter__(self):
+        self._token = _current_span.set((self.trace_id, self.span_id))
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        _current_span.reset(self._token)
+        if exc is not None:
+            self.error = f"{exc_type.__name__}: {str(exc)}"
+        self.end()
+        return False
+
+
+_random = random.Random()
+_span_ids = itertools.count(1)  # 进程内唯一即可，next() 在 CPython 中是原子的
+
+
+def begin_span(stage: str, **attributes) -> Span:
+    """
+    开始一个阶段但不设为当前阶段，需要手动调用 end()
+
+    用于跨越多次 yield 的生成器：上下文变量不能跨 yield 保持，只在同步的片段内用 activate()。
+    """
+    return Span(stage, attributes)
+
+
+def span(stage: str, **attributes) -> Span:
+    """
+    统计一个处理阶段的耗时
+
+    with span("search", query=query) as s:
+        ...
+
+    在已有阶段内调用时成为其子阶段，共享同一个 trace_id；抛出异常或调用 fail() 时计入错误数。
+    """
+    return Span(stage, attributes)
+
+
+def _finish(current: Span, seconds: float):
+    STAGE_SECONDS.observe(seconds, stage=current.stage)
+    if current.error is not None:
+        STAGE_ERRORS.inc(stage=current.stage)
+    exporter = _get_exporter()
+    if exporter is not None:
+        record = {
+            "trace_id": f"{current.trace_id:016x}",
+            "span_id": f"{current.span_id:x}",
+            "parent_id": None if current.parent_id is None else f"{current.parent_id:x}",
+            "stage": current.stage,
+            "start": time.time() - seconds,
+            "duration_ms": round(seconds * 1000, 3),
+            "error": current.error,
+        }
+        if current.attributes:
+            record["attributes"] = current.attributes
+        exporter.export(record)
+
+
+def observe_stage(stage: str, seconds: float, error: bool = False):
+    """直接记录一个阶段的耗时（如首字延迟这类无法用 with 包住的时间段）"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    if error:
+        STAGE_ERRORS.inc(stage=stage)
+
+
+def record_cache(cache: str, hit: bool):
+    CACHE_EVENTS.inc(cache=cache, result="hit" if hit else "miss")
+
+
+def stage_summary() -> Dict[str, Dict[str, float]]:
+    """各阶段的次数、错误数和 p50/p95/p99 估算值（秒）"""
+    summary = {}
+    for labels in STAGE_SECONDS.label_sets():
+        stage = labels["stage"]
+        summary[stage] = {
+            "count": STAGE_SECONDS.count(stage=stage),
+            "errors": STAGE_ERRORS.value(stage=stage),
+            "p50": STAGE_SECONDS.quantile(0.5, stage=stage),
+            "p95": STAGE_SECONDS.quantile(0.95, stage=stage),
+            "p99": STAGE_SECONDS.quantile(0.99, stage=stage),
+        }
+    return summary
+
+
+def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    """在后台线程中启动 /metrics 服务，返回服务对象（port 为 0 时自动分配端口）"""
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def log_message(self, format, *args):
+            pass
+
+        def do_GET(self):
+            if self.path.split("?")[0].rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = REGISTRY.render().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+    server = ThreadingHTTPServer((host, port), MetricsHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics-server", daemon=True).start()
+    print(f"指标服务已启动: http://{host}:{server.server_address[1]}/metrics")
+    return server
@@ -1,35 +1,84 @@
 import socket
 import os
+from board_client import get_board_client, KIND_OCR, CONTENT_TYPE_JPEG
+from worker_pools import get_pool, PoolBusyError
+from metrics import span
+from config import OCR_SERVER_IP, OCR_SERVER_PORT, OCR_RESULT_PORT
+
+OCR_BUSY_MESSAGE = "当前识别人数较多，请稍后再试"
+
+def recognize_image(file_path, timeout=None):
+    """通过共享的长连接将图像发送到开发板，并返回OCR识别结果"""
+    return get_board_client().request_file(KIND_OCR, file_path, timeout)
+
+def recognize_image_bytes(data, content_type=CONTENT_TYPE_JPEG, timeout=None):
+    """将内存中已编码的图像发送到开发板，并返回OCR识别结果"""
+    return get_board_client().request(KIND_OCR, data, timeout, content_type=content_type)
+
+def ocr_process(image, source="手动上传", session_id=None):
+    """
+    识别就诊信息图像，返回识别文本或提示信息
+
+    Args:
+        image: PIL 图像
+        source: 图像来源，"实时拍摄" 的图像需要水平翻转
+        session_id: 会话ID，提供时识别结果记为该会话的就诊信息，用于查找和保存患者档案
+    """
+    try:
+        if image is None:
+            return "请先上传或拍摄就诊信息"
+        
+        from image_preprocess import preprocess_image
+
+        with span("ocr", source=source):
+            # 在内存中完成翻转、灰度化、缩放和编码，直接发送到开发板
+            with span("upload", kind="image"):
+                processed = get_pool("render").run(preprocess_image, image, mirror=(source == "实时拍摄"))
+            print(processed.report())
+            text = get_pool("board").run(recognize_image_bytes, processed.data, processed.content_type)
+        if session_id is not None and text:
+            from audio_module import remember_patient_info
+            remember_patient_info(session_id, text)
+        return text
+    except PoolBusyError as e:
+        print(f"请求被拒绝: {str(e)}")
+        return OCR_BUSY_MESSAGE
+    except Exception as e:
+        return f"图像处理出错：{str(e)}"
 
 def send_file(file_path):
+    """旧版协议：每次新建连接发送图像，仅用于兼容未升级固件的开发板"""
 
     # 连接到开发板的服务器
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect(("192.168.137.100", 9999))  # 开发板的IP和端口
+    sock.connect((OCR_SERVER_IP, OCR_SERVER_PORT))  # 开发板的IP和端口
 
-    # 读取图像文件并发送
+    # 分块发送图像文件（支持时由内核零拷贝）
     with open(file_path, 'rb') as f:
-        sock.sendall(f.read())
+        sock.sendfile(f)
 
     # 关闭连接
     sock.close()
 
 def receive_result():
+    """旧版协议：监听结果端口等待开发板回连，同一时间只能服务一个请求"""
     # 连接到开发板的结果返回端口
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.bind(("0.0.0.0", 9998))  # 本机的IP和端口
+    sock.bind(("0.0.0.0", OCR_RESULT_PORT))  # 本机的IP和端口
     sock.listen(1)
 
     print("Waiting for result from the development board...")
     conn, addr = sock.accept()
     print("Connection from:", addr)
 
-    result_data = b''
+    # 复用固定缓冲区接收，并追加到 bytearray，避免 bytes 拼接的重复复制
+    result_data = bytearray()
+    buffer = bytearray(65536)
     while True:
-        packet = conn.recv(4096)
-        if not packet:
+        n = conn.recv_into(buffer)
+        if not n:
             break
-        result_data += packet
+        result_data += memoryview(buffer)[:n]
 
     conn.close()
     ocr_result = result_data.decode('utf-8')
@@ -0,0 +1,440 @@
+"""
+患者档案存储
+
+把每次问诊的就诊信息（OCR 识别文本）、问题和回答保存到 SQLite（WAL 模式），
+并用 FTS5 建立全文索引。写入由后台线程批量提交，不占用请求处理时间；
+查询使用各线程独立的只读连接，与写入互不阻塞。
+
+同一患者按就诊信息中的病历号、身份证号识别，没有时按姓名和性别归档。
+复诊时可以在几毫秒内查到既往就诊记录，把摘要放入大模型上下文，不必重复询问病史；
+姓名和性别可能重名，按它们归档的记录只供查询，不作为既往就诊放入上下文。
+病历图片不再长期保存，需要时根据记录重新生成。
+
+FTS5 自带的分词器会把连续的中文当作一个词，因此写入和查询前都先用
+knowledge_index.tokenize 切成相邻二元组，索引中只保存切好的词。
+
+查询：
+    python patient_store.py visits "姓名：张三 性别：男"
+    python patient_store.py search "头痛 失眠"
+重新生成病历图片：
+    python patient_store.py record 42 record_42.png
+"""
+import argparse
+import os
+import queue
+import re
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from config import (
+    PATIENT_DB_PATH, PATIENT_WRITE_QUEUE_SIZE, PATIENT_WRITE_BATCH,
+    PATIENT_CONTEXT_VISITS, PATIENT_CONTEXT_MAX_CHARS
+)
+from knowledge_index import tokenize
+from metrics import REGISTRY, span
+from prompts import PRIOR_VISITS_INSTRUCTION
+
+PATIENT_WRITES = REGISTRY.counter("medical_patient_writes_total", "患者档案写入次数", ["result"])
+
+# 就诊信息中的字段，如"姓名：张三 性别：男 年龄：45"
+_INFO_FIELD = re.compile(r"(姓名|性别|年龄|科室|病历号|门诊号|住院号|身份证号?)\s*[:：]\s*([^\s,，;；:：]+)")
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS patients (
+    id INTEGER PRIMARY KEY,
+    patient_key TEXT NOT NULL UNIQUE,
+    name TEXT,
+    gender TEXT,
+    age TEXT,
+    info TEXT NOT NULL,
+    first_visit REAL NOT NULL,
+    last_visit REAL NOT NULL,
+    visit_count INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS visits (
+    id INTEGER PRIMARY KEY,
+    patient_id INTEGER REFERENCES patients(id),
+    session_id TEXT,
+    info TEXT NOT NULL,
+    question TEXT NOT NULL,
+    answer TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS visits_by_patient ON visits (patient_id, created_at);
+CREATE VIRTUAL TABLE IF NOT EXISTS visits_fts USING fts5(info, question, answer, content='');
+"""
+
+_STOP = object()  # 写入队列中的结束标记
+
+
+def parse_patient_info(info: str) -> Dict[str, str]:
+    """从就诊信息文本中提取姓名、性别、年龄、病历号等字段"""
+    fields = {}
+    for name, value in _INFO_FIELD.findall(info or ""):
+        fields.setdefault("身份证号" if name.startswith("身份证") else name, value)
+    return fields
+
+
+def patient_key(info: str) -> Optional[str]:
+    """
+    识别患者的键：优先使用病历号（门诊号、住院号）和身份证号，其次使用姓名和性别
+
+    姓名和性别不能唯一确定患者，见 is_unique_key。
+
+    Returns:
+        无法识别患者（如没有就诊信息）时返回 None
+    """
+    fields = parse_patient_info(info)
+    for name in ("病历号", "门诊号", "住院号"):
+        if name in fields:
+            return f"mrn:{fields[name]}"
+    if "身份证号" in fields:
+        return f"id:{fields['身份证号'].upper()}"
+    if "姓名" in fields:
+        return f"name:{fields['姓名']}|{fields.get('性别', '')}"
+    return None
+
+
+def is_unique_key(key: Optional[str]) -> bool:
+    """键是否能唯一确定患者（病历号或身份证号），按姓名和性别生成的键可能对应多位重名患者"""
+    return key is not None and key.startswith(("mrn:", "id:"))
+
+
+def _index_text(text: str) -> str:
+    """切词后以空格连接，供 FTS5 按空白分词"""
+    return " ".join(tokenize(text))
+
+
+def _match_expression(query: str) -> Optional[str]:
+    """把查询文本转为 FTS5 查询：任一词命中即可，按 bm25 排序"""
+    terms = list(dict.fromkeys(tokenize(query)))
+    if not terms:
+        return None
+    return " OR ".join('"' + term.replace('"', '""') + '"' for term in terms)
+
+
+class PatientStore:
+    """
+    患者档案存储
+
+    Args:
+        db_path: SQLite 数据库路径
+        queue_size: 等待写入的记录上限，写入跟不上时新的记录被丢弃并计入指标
+        batch_size: 后台线程每个事务最多提交的记录数
+    """
+
+    def __init__(self, db_path: str = PATIENT_DB_PATH, queue_size: int = PATIENT_WRITE_QUEUE_SIZE,
+                 batch_size: int = PATIENT_WRITE_BATCH):
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self._queue: "queue.Queue" = queue.Queue(maxsize=queue_size)
+        self._local = threading.local()
+        self._readers: List[sqlite3.Connection] = []
+        self._readers_lock = threading.Lock()
+        self.written = 0
+        self.dropped = 0
+        self.failed = 0
+
+        self._writer_db = sqlite3.connect(db_path, check_same_thread=False)
+        self._writer_db.execute("PRAGMA journal_mode=WAL")
+        self._writer_db.execute("PRAGMA synchronous=NORMAL")
+        self._writer_db.executescript(_SCHEMA)
+        self._writer_db.commit()
+
+        self._writer = threading.Thread(target=self._write_loop, name="patient-store", daemon=True)
+        self._writer.start()
+
+    # ---------- 写入 ----------
+
+    def record_visit(self, info: str, question: str, answer: str, session_id: Optional[str] = None,
+                     created_at: Optional[float] = None) -> bool:
+        """
+        记录一次问诊，立即返回，由后台线程写入
+
+        Returns:
+            是否进入写入队列；队列已满时丢弃并返回 False
+        """
+        item = (info or "", question, answer, session_id, created_at or time.time())
+        try:
+            self._queue.put_nowait(item)
+            return True
+        except queue.Full:
+            self.dropped += 1
+            PATIENT_WRITES.inc(result="dropped")
+            if self.dropped % 100 == 1:
+                print(f"患者档案写入队列已满，已丢弃 {self.dropped} 条问诊记录")
+            return False
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """等待已提交的记录全部写入，返回是否在时限内完成"""
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while self._queue.unfinished_tasks:
+            if deadline is not None and time.monotonic() >= deadline:
+                return False
+            time.sleep(0.005)
+        return True
+
+    def _write_loop(self):
+        while True:
+            batch = [self._queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+            stop = any(item is _STOP for item in batch)
+            visits = [item for item in batch if item is not _STOP]
+            try:
+                if visits:
+                    self._write_batch(visits)
+                    self.written += len(visits)
+                    PATIENT_WRITES.inc(len(visits), result="ok")
+            except Exception as e:
+                self._writer_db.rollback()
+                self.failed += len(visits)
+                PATIENT_WRITES.inc(len(visits), result="error")
+                print(f"患者档案写入出错：{str(e)}")
+            finally:
+                for _ in batch:
+                    self._queue.task_done()
+            if stop:
+                return
+
+    def _write_batch(self, visits: List[Tuple]):
+        """在一个事务中写入一批问诊记录，同时更新患者信息和全文索引"""
+        db = self._writer_db
+        for info, question, answer, session_id, created_at in visits:
+            patient_id = None
+            key = patient_key(info)
+            if key is not None:
+                fields = parse_patient_info(info)
+                patient_id = db.execute(
+                    "INSERT INTO patients (patient_key, name, gender, age, info, first_visit, last_visit, visit_count) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, 1) "
+                    "ON CONFLICT(patient_key) DO UPDATE SET "
+                    "name = COALESCE(excluded.name, name), gender = COALESCE(excluded.gender, gender), "
+                    "age = COALESCE(excluded.age, age), info = excluded.info, "
+                    "last_visit = MAX(last_visit, excluded.last_visit), visit_count = visit_count + 1 "
+                    "RETURNING id",
+                    (key, fields.get("姓名"), fields.get("性别"), fields.get("年龄"), info, created_at, created_at)
+                ).fetchone()[0]
+            visit_id = db.execute(
+                "INSERT INTO visits (patient_id, session_id, info, question, answer, created_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (patient_id, session_id, info, question, answer, created_at)
+            ).lastrowid
+            db.execute(
+                "INSERT INTO visits_fts (rowid, info, question, answer) VALUES (?, ?, ?, ?)",
+                (visit_id, _index_text(info), _index_text(question), _index_text(answer))
+            )
+        db.commit()
+
+    # ---------- 查询 ----------
+
+    def _reader(self) -> sqlite3.Connection:
+        """当前线程的只读连接，WAL 模式下读取不会被后台写入阻塞"""
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.db_path, check_same_thread=False)
+            db.row_factory = sqlite3.Row
+            db.execute("PRAGMA query_only=ON")
+            self._local.db = db
+            with self._readers_lock:
+                self._readers.append(db)
+        return db
+
+    def find_patient(self, info: str) -> Optional[Dict[str, Any]]:
+        """按就诊信息查找已建档的患者，未找到时返回 None"""
+        key = patient_key(info)
+        if key is None:
+            return None
+        row = self._reader().execute("SELECT * FROM patients WHERE patient_key = ?", (key,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def recent_visits(self, info: str, limit: int = 10,
+                      exclude_session: Optional[str] = None) -> List[Dict[str, Any]]:
+        """按就诊信息识别患者，返回其最近的就诊记录（新的在前）"""
+        key = patient_key(info)
+        if key is None:
+            return []
+        rows = self._reader().execute(
+            "SELECT visits.* FROM visits JOIN patients ON visits.patient_id = patients.id "
+            "WHERE patients.patient_key = ? AND visits.session_id IS NOT ? "
+            "ORDER BY visits.created_at DESC LIMIT ?",
+            (key, exclude_session, limit)
+        ).fetchall()
+        return [dict(row) for row in rows]
+
+    def get_visit(self, visit_id: int) -> Optional[Dict[str, Any]]:
+        row = self._reader().execute("SELECT * FROM visits WHERE id = ?", (visit_id,)).fetchone()
+        return dict(row) if row is not None else None
+
+    def search(self, query: str, limit: int = 10, info: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        全文检索就诊信息、问题和回答
+
+        Args:
+            query: 查询文本
+            limit: 最多返回的记录数
+            info: 提供时只检索该患者的记录
+
+        Returns:
+            按相关度排序的就诊记录，score 越小越相关（bm25）
+        """
+        expression = _match_expression(query)
+        if expression is None:
+            return []
+        sql = ("SELECT visits.*, bm25(visits_fts) AS score FROM visits_fts "
+               "JOIN visits ON visits.id = visits_fts.rowid ")
+        params: List[Any] = [expression]
+        if info is not None:
+            key = patient_key(info)
+            if key is None:
+                return []
+            sql += "JOIN patients ON visits.patient_id = patients.id WHERE visits_fts MATCH ? AND patients.patient_key = ? "
+            params.append(key)
+        else:
+            sql += "WHERE visits_fts MATCH ? "
+        sql += "ORDER BY score LIMIT ?"
+        params.append(limit)
+        return [dict(row) for row in self._reader().execute(sql, params).fetchall()]
+
+    def prior_visit_summary(self, info: str, limit: int = PATIENT_CONTEXT_VISITS,
+                            max_chars: int = PATIENT_CONTEXT_MAX_CHARS,
+                            exclude_session: Optional[str] = None) -> Optional[str]:
+        """
+        生成既往就诊摘要，作为大模型的附加上下文
+
+        每次就诊只保留日期、问题和回答的第一句，总长度不超过 max_chars；
+        没有既往就诊，或就诊信息中没有病历号和身份证号（只按姓名无法确认是同一患者）时返回 None。
+        """
+        if not is_unique_key(patient_key(info)):
+            return None
+        with span("patient_lookup"):
+            visits = self.recent_visits(info, limit, exclude_session)
+        if not visits:
+            return None
+        lines = []
+        length = len(PRIOR_VISITS_INSTRUCTION)
+        for visit in visits:
+            date = time.strftime("%Y-%m-%d", time.localtime(visit["created_at"]))
+            answer = re.split(r"(?<=[。！？!?\n])", visit["answer"].strip(), maxsplit=1)[0].strip()
+            line = f"{date} 问：{_truncate(visit['question'], 60)} 答：{_truncate(answer, 80)}"
+            if length + len(line) + 1 > max_chars:
+                break
+            lines.append(line)
+            length += len(line) + 1
+        if not lines:
+            return None
+        return PRIOR_VISITS_INSTRUCTION + "\n" + "\n".join(lines)
+
+    def regenerate_record(self, visit_id: int, output_path: Optional[str] = None,
+                          session_id: Optional[str] = None, renderer=None) -> Optional[str]:
+        """
+        根据保存的就诊记录重新生成病历图片
+
+        Returns:
+            图片路径，记录不存在时返回 None
+        """
+        visit = self.get_visit(visit_id)
+        if visit is None:
+            return None
+        if renderer is None:
+            from medical_record_module import get_record_renderer
+            renderer = get_record_renderer()
+        return renderer.render(visit["info"], visit["answer"], output_path, session_id=session_id)
+
+    def stats(self) -> Dict[str, int]:
+        """返回已写入、排队中、丢弃和写入失败的记录数"""
+        return {
+            "written": self.written,
+            "pending": self._queue.unfinished_tasks,
+            "dropped": self.dropped,
+            "failed": self.failed
+        }
+
+    def close(self, timeout: Optional[float] = 10.0):
+        """写完队列中的记录后关闭数据库"""
+        if self._writer.is_alive():
+            self._queue.put(_STOP)
+            self._writer.join(timeout)
+        self._writer_db.close()
+        with self._readers_lock:
+            for db in self._readers:
+                db.close()
+            self._readers.clear()
+
+
+def _truncate(text: str, max_chars: int) -> str:
+    text = " ".join(text.split())
+    return text if len(text) <= max_chars else text[:max_chars - 1] + "…"
+
+
+_default_store = None
+_default_store_lock = threading.Lock()
+
+
+def get_patient_store() -> PatientStore:
+    """获取共享的患者档案存储，首次调用时打开数据库并启动写入线程"""
+    global _default_store
+    with _default_store_lock:
+        if _default_store is None:
+            _default_store = PatientStore()
+        return _default_store
+
+
+def set_patient_store(store: Optional[PatientStore]) -> Optional[PatientStore]:
+    """替换共享的患者档案存储（如使用临时数据库），返回原来的存储"""
+    global _default_store
+    with _default_store_lock:
+        previous, _default_store = _default_store, store
+        return previous
+
+
+def main():
+    parser = argparse.ArgumentParser(description="患者档案查询")
+    parser.add_argument("--db", default=PATIENT_DB_PATH)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    visits = subparsers.add_parser("visits", help="按就诊信息查询患者的既往就诊")
+    visits.add_argument("info")
+    visits.add_argument("--limit", type=int, default=10)
+
+    search = subparsers.add_parser("search", help="全文检索问诊记录")
+    search.add_argument("text")
+    search.add_argument("--limit", type=int, default=10)
+
+    record = subparsers.add_parser("record", help="重新生成某次就诊的病历图片")
+    record.add_argument("visit_id", type=int)
+    record.add_argument("output")
+
+    args = parser.parse_args()
+    store = PatientStore(args.db)
+    try:
+        start = time.perf_counter()
+        if args.command == "visits":
+            results = store.recent_visits(args.info, args.limit)
+        elif args.command == "search":
+            results = store.search(args.text, args.limit)
+        else:
+            path = store.regenerate_record(args.visit_id, args.output)
+            print(f"已生成: {path}" if path else f"没有编号为 {args.visit_id} 的就诊记录")
+            return
+        elapsed = time.perf_counter() - start
+        for visit in results:
+            date = time.strftime("%Y-%m-%d %H:%M", time.localtime(visit["created_at"]))
+            print(f"[{visit['id']}] {date} {_truncate(visit['info'], 40)}")
+            print(f"    问：{_truncate(visit['question'], 80)}")
+            print(f"    答：{_truncate(visit['answer'], 80)}")
+        print(f"共 {len(results)} 条，查询耗时 {elapsed * 1000:.2f} ms")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -23,6 +23,15 @@ MEDICAL_ADVICE_PROMPT = """你现在是一位经验丰富的医生，请根据
 - 每条建议之间使用换行符
 """
 
+# 搜索增强提示词中，搜索结果与患者问题之间的分隔说明
+SEARCH_CONTEXT_INSTRUCTION = "基于以上参考信息，请回答以下问题。在回答的最后，请列出参考来源："
+
+# 回答末尾附加的参考链接列表的标题，语音合成和生成病历时从这里截断
+REFERENCES_HEADER = "参考来源："
+
+# 复诊患者的既往就诊摘要之前的说明，摘要作为一条系统消息放在对话开头
+PRIOR_VISITS_INSTRUCTION = "该患者的既往就诊记录如下（仅供参考，回答时可结合病史，不必重复询问）："
+
 # 如果需要在medical_ai.py中使用，可以这样导入：
 # from prompts import MEDICAL_ADVICE_PROMPT
 
@@ -0,0 +1,452 @@
+"""
+外部调用容错
+
+为大模型等上游接口提供统一的容错包装：
+    - 截止时间：每次调用（含重试）有总时限，单次请求的超时不超过剩余时间
+    - 重试：仅对超时、连接错误、限流和 5xx 等临时错误重试，退避时间带随机抖动
+    - 熔断：连续失败达到阈值后直接拒绝调用，冷却期过后放行少量探测请求
+    - 对冲请求：请求耗时超过近期 p95 仍未返回时再发一个相同请求，取先返回的结果
+"""
+import asyncio
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Callable, Dict, Optional
+
+import openai
+
+from config import (
+    LLM_TIMEOUT, LLM_MAX_RETRIES, LLM_RETRY_BASE_DELAY, LLM_RETRY_MAX_DELAY,
+    LLM_BREAKER_FAILURES, LLM_BREAKER_RECOVERY, LLM_HEDGE_ENABLED, LLM_HEDGE_QUANTILE,
+    LLM_HEDGE_MIN_DELAY, LLM_HEDGE_MIN_SAMPLES, LLM_WORKERS
+)
+from metrics import REGISTRY
+
+CALL_EVENTS = REGISTRY.counter("medical_upstream_events_total", "上游调用的重试、对冲、失败和熔断拒绝次数",
+                               ["caller", "event"])
+
+# 可以重试的临时错误
+TRANSIENT_ERRORS = (
+    openai.APITimeoutError,       # APIConnectionError 的子类，单独列出便于阅读
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+    TimeoutError,
+    ConnectionError,
+)
+
+
+# 所有调用方共享的请求线程池，按需创建；对冲时每个调用最多占用两个线程
+_shared_executor = None
+_shared_executor_lock = threading.Lock()
+
+
+def _get_shared_executor() -> ThreadPoolExecutor:
+    global _shared_executor
+    with _shared_executor_lock:
+        if _shared_executor is None:
+            _shared_executor = ThreadPoolExecutor(max_workers=LLM_WORKERS * 2, thread_name_prefix="upstream-call")
+        return _shared_executor
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，调用被直接拒绝"""
+
+
+class DeadlineExceededError(TimeoutError):
+    """调用超过总时限"""
+
+
+def is_transient(error: BaseException) -> bool:
+    """判断错误是否为可重试的临时错误"""
+    if isinstance(error, openai.APIStatusError):
+        return error.status_code == 429 or error.status_code >= 500
+    return isinstance(error, TRANSIENT_ERRORS)
+
+
+class RetryPolicy:
+    """
+    带随机抖动的指数退避重试策略
+
+    Args:
+        max_retries: 首次调用之后最多重试的次数
+        base_delay: 第一次重试前的基准等待时间（秒）
+        max_delay: 单次等待时间上限（秒）
+    """
+
+    def __init__(self, max_retries: int = LLM_MAX_RETRIES, base_delay: float = LLM_RETRY_BASE_DELAY,
+                 max_delay: float = LLM_RETRY_MAX_DELAY):
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+    def backoff(self, retry: int) -> float:
+        """第 retry 次重试（从 1 开始）前的等待时间，在 [0, 上限] 内均匀随机，避免多个客户端同时重试"""
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** (retry - 1)))
+
+
+class CircuitBreaker:
+    """
+    熔断器
+
+    连续失败 failure_threshold 次后打开，recovery_timeout 秒内的调用直接拒绝；
+    之后进入半开状态，只放行一个探测请求，成功则关闭，失败则重新打开。
+
+    Args:
+        failure_threshold: 触发熔断的连续失败次数
+        recovery_timeout: 熔断后等待多久放行探测请求（秒）
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = LLM_BREAKER_FAILURES, recovery_timeout: float = LLM_BREAKER_RECOVERY):
+        self.failure_threshold = failure_threshold
+        self.recovery_timeout = recovery_timeout
+        self._state = self.CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probing = False
+        self._lock = threading.Lock()
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            return self._current_state()
+
+    def _current_state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.recovery_timeout:
+            self._state = self.HALF_OPEN
+            self._probing = False
+        return self._state
+
+    def allow(self):
+        """
+        检查是否允许发起调用
+
+        Raises:
+            CircuitOpenError: 熔断器打开，或半开状态下已有探测请求在进行
+        """
+        with self._lock:
+            state = self._current_state()
+            if state == self.CLOSED:
+                return
+            if state == self.HALF_OPEN and not self._probing:
+                self._probing = True
+                return
+            self.rejected += 1
+            retry_in = max(0.0, self.recovery_timeout - (time.monotonic() - self._opened_at))
+        raise CircuitOpenError(f"上游服务暂时不可用，约 {retry_in:.0f} 秒后重试")
+
+    def record_success(self):
+        with self._lock:
+            self._state = self.CLOSED
+            self._failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == self.HALF_OPEN or self._failures >= self.failure_threshold:
+                if self._state != self.OPEN:
+                    print(f"连续失败 {self._failures} 次，熔断 {self.recovery_timeout} 秒")
+                self._state = self.OPEN
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class LatencyTracker:
+    """
+    记录最近若干次调用的耗时，用于计算对冲请求的触发延迟
+
+    Args:
+        window: 保留的样本数
+    """
+
+    def __init__(self, window: int = 200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def add(self, seconds: float):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def quantile(self, q: float, min_samples: int = 1) -> Optional[float]:
+        """样本数不足 min_samples 时返回 None"""
+        with self._lock:
+            if len(self._samples) < max(1, min_samples):
+                return None
+            ordered = sorted(self._samples)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class ResilientCaller:
+    """
+    带截止时间、重试、熔断和对冲请求的调用包装
+
+    被包装的函数接收一个参数 timeout（本次请求可用的秒数），应把它传给底层客户端。
+    对冲会让同一请求执行两次，只能用于没有副作用的调用。
+
+    Args:
+        name: 名称，用于日志
+        timeout: 每次调用（含重试）的总时限（秒）
+        retry: 重试策略
+        breaker: 熔断器，可在多个调用方之间共享
+        hedge: 是否启用对冲请求
+        hedge_quantile: 以近期耗时的哪个分位数作为对冲触发延迟
+        hedge_min_delay: 对冲触发延迟的下限（秒）
+        hedge_min_samples: 样本数达到多少后才启用对冲
+        max_workers: 执行请求的线程数（对冲时每个调用最多占用两个），为 None 时使用所有调用方共享的线程池；
+            指定时创建独立的线程池，用完后调用 close() 释放
+    """
+
+    def __init__(
+        self,
+        name: str,
+        timeout: float = LLM_TIMEOUT,
+        retry: Optional[RetryPolicy] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        hedge: bool = LLM_HEDGE_ENABLED,
+        hedge_quantile: float = LLM_HEDGE_QUANTILE,
+        hedge_min_delay: float = LLM_HEDGE_MIN_DELAY,
+        hedge_min_samples: int = LLM_HEDGE_MIN_SAMPLES,
+        max_workers: Optional[int] = None
+    ):
+        self.name = name
+        self.timeout = timeout
+        self.retry = retry or RetryPolicy()
+        self.breaker = breaker or CircuitBreaker()
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.hedge_min_delay = hedge_min_delay
+        self.hedge_min_samples = hedge_min_samples
+        self.latency = LatencyTracker()
+        self._executor = None
+        self._max_workers = max_workers
+        self._executor_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.failures = 0
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        if self._max_workers is None:
+            return _get_shared_executor()
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self._max_workers,
+                                                    thread_name_prefix=f"{self.name}-call")
+            return self._executor
+
+    def close(self):
+        """关闭独立的线程池（使用共享线程池时不做任何事）"""
+        with self._executor_lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=False)
+
+    def _count(self, field: str):
+        with self._stats_lock:
+            setattr(self, field, getattr(self, field) + 1)
+        CALL_EVENTS.inc(caller=self.name, event=field)
+
+    def _allow(self):
+        try:
+            self.breaker.allow()
+        except CircuitOpenError:
+            CALL_EVENTS.inc(caller=self.name, event="rejected")
+            raise
+
+    def hedge_delay(self) -> Optional[float]:
+        """当前的对冲触发延迟，未启用或样本不足时为 None"""
+        if not self.hedge:
+            return None
+        delay = self.latency.quantile(self.hedge_quantile, self.hedge_min_samples)
+        return None if delay is None else max(delay, self.hedge_min_delay)
+
+    def call(self, fn: Callable[[float], Any], timeout: Optional[float] = None,
+             discard: Optional[Callable[[Any], None]] = None) -> Any:
+        """
+        执行调用
+
+        Args:
+            fn: 被包装的函数，参数为本次请求可用的秒数
+            timeout: 总时限（秒），默认使用构造时的设置
+            discard: 对冲请求中落败一方的结果的清理函数（如关闭流）
+
+        Raises:
+            CircuitOpenError: 熔断器打开
+            DeadlineExceededError: 超过总时限
+            Exception: 不可重试的错误，或重试次数用尽后的最后一个错误
+        """
+        self._count("calls")
+        deadline = time.monotonic() + (timeout or self.timeout)
+        retry = 0
+        while True:
+            self._allow()
+            try:
+                result = self._attempt(fn, deadline, discard)
+            except Exception as e:
+                transient = is_transient(e)
+                if transient:
+                    self.breaker.record_failure()
+                else:
+                    # 参数错误、鉴权失败等说明上游是正常的，不计入熔断
+                    self.breaker.record_success()
+                remaining = deadline - time.monotonic()
+                if not transient or retry >= self.retry.max_retries or remaining <= 0:
+                    self._count("failures")
+                    raise
+                retry += 1
+                self._count("retries")
+                delay = min(self.retry.backoff(retry), remaining)
+                print(f"{self.name} 调用失败（{type(e).__name__}），{delay:.2f} 秒后第 {retry} 次重试")
+                time.sleep(delay)
+                continue
+            self.breaker.record_success()
+            return result
+
+    def _attempt(self, fn, deadline: float, discard):
+        """发起一次请求，超过对冲延迟仍未返回时再发一个，返回先成功的结果"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceededError(f"{self.name} 调用超过时限")
+        executor = self._get_executor()
+        start = time.monotonic()
+        primary = executor.submit(self._run, fn, deadline)
+        futures = {primary}
+
+        hedge_delay = self.hedge_delay()
+        if hedge_delay is not None and hedge_delay < remaining:
+            done, _ = wait(futures, timeout=hedge_delay)
+            if not done:
+                self._count("hedges")
+                futures.add(executor.submit(self._run, fn, deadline))
+
+        error = None
+        while futures:
+            done, futures = wait(futures, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+            if not done:
+                break
+            for future in done:
+                if future.exception() is None:
+                    if future is not primary:
+                        self._count("hedge_wins")
+                    self.latency.add(time.monotonic() - start)
+                    self._discard_later(futures, discard)
+                    return future.result()
+                error = future.exception()
+        if error is not None:
+            raise error
+        self._discard_later(futures, discard)
+        raise DeadlineExceededError(f"{self.name} 调用超过时限")
+
+    def _run(self, fn, deadline: float):
+        """在线程池中执行请求：可用时间从开始执行时算起，排队期间已超过时限则不再发起"""
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceededError(f"{self.name} 调用超过时限")
+        return fn(remaining)
+
+    @staticmethod
+    def _discard_later(futures, discard):
+        """仍在进行的请求完成后清理其结果"""
+        if discard is None:
+            return
+
+        def cleanup(future):
+            if not future.cancelled() and future.exception() is None:
+                try:
+                    discard(future.result())
+                except Exception:
+                    pass
+
+        for future in futures:
+            future.add_done_callback(cleanup)
+
+    async def acall(self, fn: Callable[[float], Any], timeout: Optional[float] = None) -> Any:
+        """
+        call 的异步版本，fn 返回协程
+
+        Raises:
+            与 call 相同
+        """
+        self._count("calls")
+        deadline = time.monotonic() + (timeout or self.timeout)
+        retry = 0
+        while True:
+            self._allow()
+            try:
+                result = await self._aattempt(fn, deadline)
+            except Exception as e:
+                transient = is_transient(e)
+                if transient:
+                    self.breaker.record_failure()
+                else:
+                    self.breaker.record_success()
+                remaining = deadline - time.monotonic()
+                if not transient or retry >= self.retry.max_retries or remaining <= 0:
+                    self._count("failures")
+                    raise
+                retry += 1
+                self._count("retries")
+                await asyncio.sleep(min(self.retry.backoff(retry), remaining))
+                continue
+            self.breaker.record_success()
+            return result
+
+    async def _aattempt(self, fn, deadline: float):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise DeadlineExceededError(f"{self.name} 调用超过时限")
+        start = time.monotonic()
+        primary = asyncio.ensure_future(fn(remaining))
+        tasks = {primary}
+        try:
+            hedge_delay = self.hedge_delay()
+            if hedge_delay is not None and hedge_delay < remaining:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+                if not done:
+                    self._count("hedges")
+                    tasks.add(asyncio.ensure_future(fn(deadline - time.monotonic())))
+
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, timeout=max(0.0, deadline - time.monotonic()),
+                                                 return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self._count("hedge_wins")
+                        self.latency.add(time.monotonic() - start)
+                        return task.result()
+                    error = task.exception()
+            if error is not None:
+                raise error
+            raise DeadlineExceededError(f"{self.name} 调用超过时限")
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    def stats(self) -> Dict[str, Any]:
+        """返回调用、重试、对冲次数，熔断器状态和当前对冲延迟"""
+        with self._stats_lock:
+            stats = {
+                "calls": self.calls,
+                "retries": self.retries,
+                "hedges": self.hedges,
+                "hedge_wins": self.hedge_wins,
+                "failures": self.failures,
+            }
+        stats["breaker"] = self.breaker.state
+        stats["breaker_rejected"] = self.breaker.rejected
+        stats["hedge_delay"] = self.hedge_delay()
+        return stats
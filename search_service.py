@@ -1,17 +1,61 @@
 import requests
-from typing import List, Dict, Any
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+from typing import List, Dict, Any, Optional
 import json
+from cache import TTLCache, normalize_prompt, make_cache_key
+from config import (
+    SEARCH_CONNECT_TIMEOUT, SEARCH_READ_TIMEOUT, SEARCH_MAX_RETRIES,
+    SEARCH_BACKOFF_FACTOR, SEARCH_POOL_SIZE
+)
 
 class SearchService:
     """搜索服务类，用于获取网络搜索结果"""
     
-    def __init__(self, api_key: str):
+    def __init__(
+        self,
+        api_key: str,
+        base_url: str = "https://google.serper.dev/search",
+        connect_timeout: float = SEARCH_CONNECT_TIMEOUT,
+        read_timeout: float = SEARCH_READ_TIMEOUT,
+        max_retries: int = SEARCH_MAX_RETRIES,
+        backoff_factor: float = SEARCH_BACKOFF_FACTOR,
+        cache: Optional[TTLCache] = None
+    ):
+        """
+        Args:
+            api_key: Serper API密钥
+            base_url: 搜索接口地址
+            connect_timeout: 建立连接的超时时间（秒）
+            read_timeout: 等待响应的超时时间（秒）
+            max_retries: 连接失败或服务端临时错误时的重试次数
+            backoff_factor: 重试的指数退避系数
+            cache: 搜索结果缓存，为空时不缓存
+        """
         self.api_key = api_key
-        self.base_url = "https://google.serper.dev/search"
+        self.base_url = base_url
         self.headers = {
             'X-API-KEY': self.api_key,
             'Content-Type': 'application/json'
         }
+        self.timeout = (connect_timeout, read_timeout)
+        self.cache = cache
+        
+        # 复用连接池，避免每次搜索都重新进行 TCP 和 TLS 握手
+        retry = Retry(
+            total=max_retries,
+            connect=max_retries,
+            read=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=(429, 500, 502, 503, 504),
+            allowed_methods=frozenset(["POST"]),  # 搜索请求是幂等的，可以安全重试
+            raise_on_status=False
+        )
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=SEARCH_POOL_SIZE, max_retries=retry)
+        self.session = requests.Session()
+        self.session.headers.update(self.headers)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
     
     def search(self, query: str, limit: int = 3) -> List[Dict[str, Any]]:
         """
@@ -24,6 +68,12 @@ class SearchService:
         Returns:
             搜索结果列表
         """
+        cache_key = make_cache_key("search", normalize_prompt(query), limit)
+        if self.cache is not None:
+            cached = self.cache.get(cache_key)
+            if cached is not None:
+                return cached
+        
         try:
             payload = {
                 "q": query,
@@ -31,10 +81,10 @@ class SearchService:
                 "hl": "zh-cn"  # 语言设置为中文
             }
             
-            response = requests.post(
+            response = self.session.post(
                 self.base_url,
-                headers=self.headers,
-                json=payload
+                json=payload,
+                timeout=self.timeout
             )
             response.raise_for_status()
             
@@ -48,6 +98,9 @@ class SearchService:
                     'snippet': result.get('snippet', ''),
                     'link': result.get('link', '')
                 })
+            
+            if self.cache is not None and formatted_results:
+                self.cache.set(cache_key, formatted_results)
                 
             return formatted_results
             
@@ -55,6 +108,10 @@ class SearchService:
             print(f"搜索出错: {str(e)}")
             return []
     
+    def close(self):
+        """关闭连接池"""
+        self.session.close()
+    
     def format_search_results(self, results: List[Dict[str, Any]]) -> str:
         """
         将搜索结果格式化为文本
@@ -0,0 +1,233 @@
+"""
+搜索触发判断
+
+用 Aho–Corasick 自动机一次扫描问题文本，同时匹配全部触发词、同义词和否定词，
+得到加权得分和命中的词条，得分达到阈值时才调用搜索服务。
+匹配耗时只与问题长度有关，与词表大小无关，词表可以扩充到数千个医学术语。
+
+词表文件为 UTF-8 文本，每行一个词条，字段以制表符分隔：
+    词条<TAB>权重[<TAB>同义词1|同义词2...]
+以 # 开头的行为注释；权重省略时为 1.0。
+"""
+import threading
+import unicodedata
+from collections import deque
+from typing import Dict, Iterator, List, Optional, Tuple
+
+from config import SEARCH_TRIGGER_TERMS_PATH, SEARCH_TRIGGER_THRESHOLD, SEARCH_TRIGGER_NEGATION_WINDOW
+
+# 需要时效性信息或外部资料的问题才值得搜索，权重达到阈值（默认 1.0）即触发
+DEFAULT_TRIGGER_TERMS: Dict[str, float] = {
+    "最新": 1.0, "研究": 1.0, "进展": 1.0, "新闻": 1.0, "最近": 1.0,
+    "数据": 1.0, "统计": 1.0, "报告": 1.0, "新型": 1.0, "新药": 1.0,
+    "临床试验": 1.0, "治疗方法": 1.0,
+    "指南": 1.0, "共识": 0.8, "批准": 0.8, "上市": 0.8, "医保": 0.8,
+    "疫苗": 0.5, "发病率": 0.8, "流行": 0.5, "疫情": 1.0, "文献": 1.0,
+    "今年": 0.5, "目前": 0.3, "现在": 0.3, "效果": 0.3, "副作用": 0.3,
+}
+
+# 同义词归并到同一词条，按词条的权重计分
+DEFAULT_SYNONYMS: Dict[str, List[str]] = {
+    "最新": ["最前沿", "新出的", "latest"],
+    "研究": ["论文", "study", "research"],
+    "新药": ["新上市的药"],
+    "临床试验": ["临床实验", "clinical trial"],
+    "治疗方法": ["疗法", "治疗方案"],
+    "指南": ["guideline"],
+    "批准": ["fda", "nmpa", "获批"],
+    "疫情": ["新冠", "covid"],
+}
+
+# 否定词之后、同一分句内一定距离以内的触发词不计分，如"不需要最新研究"
+DEFAULT_NEGATIONS = ["不需要", "不用", "无需", "不必", "别查", "不要查", "不想知道"]
+
+# 分句边界，否定词的作用范围不跨越这些字符
+_CLAUSE_BREAKS = set("，。！？；、,.!?;\n")
+
+_NEGATION = object()  # 自动机输出中否定词的标记
+
+
+def normalize_text(text: str) -> str:
+    """统一全角/半角和大小写"""
+    return unicodedata.normalize("NFKC", text or "").lower()
+
+
+class AhoCorasick:
+    """
+    多模式串匹配自动机
+
+    Args:
+        patterns: (模式串, 负载) 列表，匹配时返回负载
+    """
+
+    def __init__(self, patterns: List[Tuple[str, object]]):
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[Tuple[int, object]]] = [[]]
+        for pattern, payload in patterns:
+            self._add(pattern, payload)
+        self._build()
+
+    def _add(self, pattern: str, payload):
+        if not pattern:
+            return
+        state = 0
+        for char in pattern:
+            next_state = self._goto[state].get(char)
+            if next_state is None:
+                next_state = len(self._goto)
+                self._goto[state][char] = next_state
+                self._goto.append({})
+                self._fail.append(0)
+                self._output.append([])
+            state = next_state
+        self._output[state].append((len(pattern), payload))
+
+    def _build(self):
+        """广度优先计算失配指针，并把失配链上的输出合并到每个状态"""
+        queue = deque(self._goto[0].values())
+        while queue:
+            state = queue.popleft()
+            for char, next_state in self._goto[state].items():
+                queue.append(next_state)
+                fail = self._fail[state]
+                while fail and char not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[next_state] = self._goto[fail].get(char, 0)
+                self._output[next_state] = self._output[next_state] + self._output[self._fail[next_state]]
+
+    def step(self, state: int, char: str) -> int:
+        """读入一个字符后的状态"""
+        goto, fail = self._goto, self._fail
+        while state and char not in goto[state]:
+            state = fail[state]
+        return goto[state].get(char, 0)
+
+    def outputs(self, state: int) -> List[Tuple[int, object]]:
+        """当前状态结束的所有 (模式串长度, 负载)"""
+        return self._output[state]
+
+    def finditer(self, text: str) -> Iterator[Tuple[int, int, object]]:
+        """逐个产出匹配 (起始位置, 结束位置, 负载)，按结束位置排序"""
+        state = 0
+        for index, char in enumerate(text):
+            state = self.step(state, char)
+            for length, payload in self._output[state]:
+                yield index + 1 - length, index + 1, payload
+
+    def __len__(self):
+        return len(self._goto)
+
+
+class TriggerResult:
+    """搜索触发判断结果"""
+
+    def __init__(self, score: float, matched: List[str], negated: List[str], threshold: float):
+        self.score = score
+        self.matched = matched      # 计分的词条
+        self.negated = negated      # 被否定而未计分的词条
+        self.threshold = threshold
+
+    @property
+    def should_search(self) -> bool:
+        return self.score >= self.threshold
+
+    def __bool__(self):
+        return self.should_search
+
+    def __repr__(self):
+        return (f"TriggerResult(score={self.score:.2f}, matched={self.matched}, "
+                f"negated={self.negated}, should_search={self.should_search})")
+
+
+class SearchTrigger:
+    """
+    加权关键词搜索触发器
+
+    Args:
+        terms: 词条到权重的映射
+        synonyms: 词条到同义词列表的映射，同义词按所属词条计分
+        negations: 否定词列表
+        threshold: 触发搜索的得分阈值
+        negation_window: 否定词结束后多少个字符内的词条视为被否定
+    """
+
+    def __init__(
+        self,
+        terms: Optional[Dict[str, float]] = None,
+        synonyms: Optional[Dict[str, List[str]]] = None,
+        negations: Optional[List[str]] = None,
+        threshold: float = SEARCH_TRIGGER_THRESHOLD,
+        negation_window: int = SEARCH_TRIGGER_NEGATION_WINDOW
+    ):
+        self.terms = dict(DEFAULT_TRIGGER_TERMS if terms is None else terms)
+        self.synonyms = dict(DEFAULT_SYNONYMS if synonyms is None else synonyms)
+        self.negations = list(DEFAULT_NEGATIONS if negations is None else negations)
+        self.threshold = threshold
+        self.negation_window = negation_window
+
+        patterns = [(normalize_text(term), term) for term in self.terms]
+        for term, aliases in self.synonyms.items():
+            if term in self.terms:
+                patterns.extend((normalize_text(alias), term) for alias in aliases)
+        patterns.extend((normalize_text(word), _NEGATION) for word in self.negations)
+        self._automaton = AhoCorasick(patterns)
+
+    @classmethod
+    def from_file(cls, path: str, **kwargs) -> "SearchTrigger":
+        """从词表文件加载词条、权重和同义词（格式见模块说明）"""
+        terms, synonyms = {}, {}
+        with open(path, encoding="utf-8") as f:
+            for line in f:
+                line = line.rstrip("\n")
+                if not line.strip() or line.lstrip().startswith("#"):
+                    continue
+                fields = line.split("\t")
+                term = fields[0].strip()
+                terms[term] = float(fields[1]) if len(fields) > 1 and fields[1].strip() else 1.0
+                if len(fields) > 2 and fields[2].strip():
+                    synonyms[term] = [alias.strip() for alias in fields[2].split("|") if alias.strip()]
+        return cls(terms, synonyms, **kwargs)
+
+    def evaluate(self, text: str) -> TriggerResult:
+        """单次扫描问题文本，返回得分、命中词条和被否定的词条"""
+        text = normalize_text(text)
+        automaton = self._automaton
+        matched: Dict[str, None] = {}
+        negated: Dict[str, None] = {}
+        negation_end = None   # 最近一个否定词的结束位置
+        state = 0
+        for index, char in enumerate(text):
+            if char in _CLAUSE_BREAKS:
+                negation_end = None
+            state = automaton.step(state, char)
+            for length, term in automaton.outputs(state):
+                if term is _NEGATION:
+                    negation_end = index + 1
+                    continue
+                start = index + 1 - length
+                if negation_end is not None and 0 <= start - negation_end <= self.negation_window:
+                    negated[term] = None
+                else:
+                    matched[term] = None
+
+        matched_terms = list(matched)
+        negated_terms = [term for term in negated if term not in matched]
+        score = sum(self.terms[term] for term in matched_terms)
+        return TriggerResult(score, matched_terms, negated_terms, self.threshold)
+
+
+_default_trigger = None
+_default_trigger_lock = threading.Lock()
+
+
+def get_search_trigger() -> SearchTrigger:
+    """获取共享的搜索触发器，配置了词表文件时从文件加载"""
+    global _default_trigger
+    with _default_trigger_lock:
+        if _default_trigger is None:
+            if SEARCH_TRIGGER_TERMS_PATH:
+                _default_trigger = SearchTrigger.from_file(SEARCH_TRIGGER_TERMS_PATH)
+            else:
+                _default_trigger = SearchTrigger()
+        return _default_trigger
@@ -0,0 +1,147 @@
+"""
+会话存储
+
+按 Gradio 会话保存每位患者独立的对话历史，支持 LRU 淘汰、空闲超时（TTL）
+和总内存上限，避免不同患者的对话互相混杂，也避免历史无限增长。
+"""
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional
+
+from config import SESSION_MAX_COUNT, SESSION_TTL, SESSION_MAX_MEMORY_BYTES
+
+DEFAULT_SESSION_ID = "default"
+
+
+class ConsultationSession:
+    """单个会话的对话状态"""
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.conversation_history: List[Dict[str, str]] = []
+        self.patient_info: Optional[str] = None  # 本次就诊信息（OCR 识别文本），用于查找和保存患者档案
+        self.lock = threading.Lock()  # 同一会话内的请求按顺序执行
+        self.last_access = time.monotonic()
+        self.size_bytes = 0
+
+    def estimate_size(self) -> int:
+        """估算对话历史占用的字节数"""
+        return sum(len(message.get("content") or "") * 3 + 64 for message in self.conversation_history)
+
+    def clear(self):
+        self.conversation_history = []
+        self.size_bytes = 0
+
+
+class SessionStore:
+    """
+    线程安全的会话存储
+
+    Args:
+        max_sessions: 最多保留的会话数，超出时淘汰最久未使用的会话
+        ttl: 会话空闲超时时间（秒）
+        max_memory_bytes: 所有会话历史的估算内存上限（字节）
+        on_remove: 会话被删除或淘汰时的回调，参数为会话ID；在持有锁时调用，必须足够轻量
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = SESSION_MAX_COUNT,
+        ttl: float = SESSION_TTL,
+        max_memory_bytes: int = SESSION_MAX_MEMORY_BYTES,
+        on_remove: Optional[Callable[[str], None]] = None
+    ):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self.max_memory_bytes = max_memory_bytes
+        self.on_remove = on_remove
+        self._sessions: "OrderedDict[str, ConsultationSession]" = OrderedDict()
+        self._total_bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+
+    def get(self, session_id: Optional[str]) -> ConsultationSession:
+        """获取会话，不存在或已过期时新建"""
+        session_id = session_id or DEFAULT_SESSION_ID
+        now = time.monotonic()
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is not None and now - session.last_access > self.ttl:
+                self._remove_locked(session_id)
+                session = None
+            if session is None:
+                session = ConsultationSession(session_id)
+                self._sessions[session_id] = session
+            else:
+                self._sessions.move_to_end(session_id)
+            session.last_access = now
+            self._evict_locked(now, keep=session_id)
+        return session
+
+    @contextmanager
+    def session(self, session_id: Optional[str]):
+        """
+        独占使用会话，退出时更新内存统计并执行淘汰
+
+        用法：
+            with store.session(session_id) as session:
+                medical_ai.get_medical_advice(question, session.conversation_history)
+        """
+        session = self.get(session_id)
+        with session.lock:
+            try:
+                yield session
+            finally:
+                self._update_size(session)
+
+    def _update_size(self, session: ConsultationSession):
+        size = session.estimate_size()
+        with self._lock:
+            if self._sessions.get(session.session_id) is session:
+                self._total_bytes += size - session.size_bytes
+            session.size_bytes = size
+            session.last_access = time.monotonic()
+            self._evict_locked(session.last_access, keep=session.session_id)
+
+    def remove(self, session_id: str):
+        """删除会话"""
+        with self._lock:
+            self._remove_locked(session_id)
+
+    def _remove_locked(self, session_id: str):
+        session = self._sessions.pop(session_id, None)
+        if session is not None:
+            self._total_bytes -= session.size_bytes
+            if self.on_remove is not None:
+                self.on_remove(session_id)
+
+    def _evict_locked(self, now: float, keep: Optional[str] = None):
+        """按过期时间、会话数量和内存上限依次淘汰最久未使用的会话"""
+        for session_id, session in list(self._sessions.items()):
+            if now - session.last_access <= self.ttl:
+                break
+            if session_id != keep:
+                self._remove_locked(session_id)
+                self.evictions += 1
+
+        while len(self._sessions) > self.max_sessions or self._total_bytes > self.max_memory_bytes:
+            session_id = next(iter(self._sessions))
+            if session_id == keep:
+                # 只剩当前会话超出上限时不淘汰，避免正在进行的问诊丢失上下文
+                if len(self._sessions) == 1:
+                    break
+                self._sessions.move_to_end(session_id)
+                session_id = next(iter(self._sessions))
+            self._remove_locked(session_id)
+            self.evictions += 1
+
+    def stats(self) -> Dict[str, int]:
+        """返回当前会话数、估算内存和累计淘汰数"""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "memory_bytes": self._total_bytes,
+                "evictions": self.evictions
+            }
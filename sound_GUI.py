@@ -1,16 +1,9 @@
 import gradio as gr
-from soundreg_task import send_audiofile, receive_result
-import shutil
+from soundreg_task import recognize_audio
 
 def audioreg(audio_file_path):
-    # 指定保存文件的路径和名称
-    save_path = "saved_audio.wav"
-    # 复制录制的音频文件到目标路径
-    shutil.copy(audio_file_path, save_path)
-
-    # 发送处理后的图像文件
-    send_audiofile(save_path)
-    return receive_result()
+    # Gradio 为每次录音生成独立的文件，直接发送，不再复制到固定文件名
+    return recognize_audio(audio_file_path)
 
 with gr.Blocks() as demo:
     with gr.Tab() as tab1:
@@ -1,33 +1,47 @@
 import socket
+from board_client import get_board_client, KIND_ASR, CONTENT_TYPE_WAV
+from config import OCR_SERVER_IP, OCR_SERVER_PORT, OCR_RESULT_PORT
+
+def recognize_audio(file_path, timeout=None):
+    """通过共享的长连接将音频发送到开发板，并返回语音识别结果"""
+    return get_board_client().request_file(KIND_ASR, file_path, timeout)
+
+def recognize_audio_bytes(data, content_type=CONTENT_TYPE_WAV, timeout=None):
+    """将内存中已编码的音频发送到开发板，并返回语音识别结果"""
+    return get_board_client().request(KIND_ASR, data, timeout, content_type=content_type)
 
 def send_audiofile(file_path):
+    """旧版协议：每次新建连接发送音频，仅用于兼容未升级固件的开发板"""
     # 连接到开发板的服务器
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect(("192.168.137.100", 9999))  # 开发板的IP和端口
+    sock.connect((OCR_SERVER_IP, OCR_SERVER_PORT))  # 开发板的IP和端口
 
-    # 读取文件并发送
+    # 分块发送音频文件（支持时由内核零拷贝）
     with open(file_path, 'rb') as f:
-        sock.sendall(f.read())
+        sock.sendfile(f)
 
     # 关闭连接
     sock.close()
 
 def receive_result():
+    """旧版协议：监听结果端口等待开发板回连，同一时间只能服务一个请求"""
     # 连接到开发板的结果返回端口
     sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.bind(("0.0.0.0", 9998))  # 本机的IP和端口
+    sock.bind(("0.0.0.0", OCR_RESULT_PORT))  # 本机的IP和端口
     sock.listen(1)
 
     print("Waiting for result from the development board...")
     conn, addr = sock.accept()
     print("Connection from:", addr)
 
-    result_data = b''
+    # 复用固定缓冲区接收，并追加到 bytearray，避免 bytes 拼接的重复复制
+    result_data = bytearray()
+    buffer = bytearray(65536)
     while True:
-        packet = conn.recv(4096)
-        if not packet:
+        n = conn.recv_into(buffer)
+        if not n:
             break
-        result_data += packet
+        result_data += memoryview(buffer)[:n]
 
     conn.close()
     audio_result = result_data.decode('utf-8')
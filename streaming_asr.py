@@ -0,0 +1,196 @@
+"""
+流式语音识别
+
+录音过程中，界面每隔一小段时间送来一块音频。每块在内存中混为单声道、重采样到
+AUDIO_SAMPLE_RATE 并转为 16 位 PCM，立即通过开发板长连接的流式请求发送；
+开发板边接收边解码，并回复中间结果供界面实时显示。
+录音结束时只需等待开发板处理最后一块并给出最终结果，不再等待整段录音的上传和识别。
+
+需要开发板固件支持 board_client 中的 KIND_ASR_STREAM 请求，由 config.ASR_STREAMING 开启。
+"""
+import threading
+import time
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from audio_preprocess import to_mono, resample
+from board_client import get_board_client, BoardError, KIND_ASR_STREAM, CONTENT_TYPE_PCM16
+from config import AUDIO_SAMPLE_RATE, ASR_STREAM_IDLE_TIMEOUT
+
+
+def to_float32(samples: np.ndarray) -> np.ndarray:
+    """把整数 PCM 采样（浏览器录音通常为 int16）转为 [-1, 1] 的 float32"""
+    if samples.dtype.kind == "f":
+        return samples.astype(np.float32, copy=False)
+    if samples.dtype.kind == "u":
+        bits = samples.dtype.itemsize * 8
+        return (samples.astype(np.float32) - 2 ** (bits - 1)) / 2 ** (bits - 1)
+    return samples.astype(np.float32) / np.float32(2 ** (samples.dtype.itemsize * 8 - 1))
+
+
+def encode_pcm16(samples: np.ndarray) -> bytes:
+    """单声道 float32 音频编码为无文件头的 16 位小端 PCM"""
+    return (np.clip(samples, -1.0, 1.0) * 32767).astype('<i2').tobytes()
+
+
+class StreamingRecognizer:
+    """
+    一次语音输入的流式识别
+
+    Args:
+        client: 开发板客户端，默认使用共享的长连接
+        target_rate: 发送到开发板的采样率
+    """
+
+    def __init__(self, client=None, target_rate: int = AUDIO_SAMPLE_RATE):
+        self.client = client or get_board_client()
+        self.target_rate = target_rate
+        self.stream = None
+        self.error: Optional[Exception] = None
+        self.seconds = 0.0          # 已发送的音频时长
+        self.finished = False       # 已调用 finish，之后迟到的音频块直接丢弃
+        self.started = False        # 是否已收到本次录音的开始事件（由 StreamingRecognizers 维护）
+        self.last_feed = time.monotonic()
+        self._lock = threading.Lock()  # 音频块按到达顺序发送
+
+    @property
+    def partial(self) -> str:
+        """开发板目前给出的识别结果"""
+        return self.stream.partial if self.stream is not None else ""
+
+    def feed(self, samples: np.ndarray, sample_rate: int) -> str:
+        """
+        发送一块录音
+
+        Args:
+            samples: 采样数组，形状为 (帧数,) 或 (帧数, 声道数)
+            sample_rate: 采样率
+
+        Returns:
+            目前的识别结果（中间结果）
+        """
+        with self._lock:
+            self.last_feed = time.monotonic()
+            if self.finished or self.error is not None or len(samples) == 0:
+                return self.partial
+            mono = resample(to_mono(to_float32(np.asarray(samples))), sample_rate, self.target_rate)
+            try:
+                if self.stream is None:
+                    self.stream = self.client.open_stream(KIND_ASR_STREAM, CONTENT_TYPE_PCM16)
+                self.stream.send(encode_pcm16(mono))
+                self.seconds += len(mono) / self.target_rate
+            except (OSError, BoardError) as e:
+                # 之后的音频块不再发送，错误在 finish 时抛出
+                print(f"流式识别发送失败：{str(e)}")
+                self.error = e
+            return self.partial
+
+    def finish(self, timeout: Optional[float] = None) -> str:
+        """
+        录音结束，等待最终识别结果
+
+        Raises:
+            TimeoutError: 开发板超时未返回结果
+            BoardError: 开发板返回错误或连接断开
+        """
+        # 置位后不会再有音频块发送，等待结果时不持有锁，迟到的音频块和 cancel 不会被阻塞
+        with self._lock:
+            self.finished = True
+            stream, error = self.stream, self.error
+        if stream is None:
+            if error is not None:
+                raise error
+            return ""
+        return stream.finish(timeout)
+
+    def cancel(self):
+        """放弃本次识别"""
+        with self._lock:
+            if self.stream is not None:
+                self.stream.cancel()
+
+    def idle(self, now: Optional[float] = None) -> float:
+        """距离上一块录音的时间（秒）"""
+        return (now or time.monotonic()) - self.last_feed
+
+
+class StreamingRecognizers:
+    """
+    按会话保存正在进行的流式识别
+
+    录音中断（如关闭页面）时没有结束事件，超过 idle_timeout 没有新音频的识别会在
+    下一次调用时被放弃并释放。
+
+    录音结束后界面可能还会送来最后一块音频。pop 取出的识别在下一次开始录音（start）
+    或超时之前仍登记为“结束中”，迟到的音频块交给它（finish 开始后丢弃），不会新开一个无人结束的识别。
+
+    开始录音事件和第一块音频分别处理，先后顺序不确定。第一块音频先到时新开的识别属于本次录音，
+    start 只标记它已开始而不取消；已经标记过的识别才是上一次未结束的录音，由 start 放弃。
+    """
+
+    def __init__(self, idle_timeout: float = ASR_STREAM_IDLE_TIMEOUT, client=None):
+        self.idle_timeout = idle_timeout
+        self.client = client
+        self._recognizers: Dict[str, StreamingRecognizer] = {}
+        self._finishing: Dict[str, StreamingRecognizer] = {}  # 已取出等待最终结果的识别
+        self._lock = threading.Lock()
+
+    def feed(self, session_id: str, samples: np.ndarray, sample_rate: int) -> str:
+        """发送会话的一块录音，没有进行中的识别时新开一个"""
+        with self._lock:
+            expired = self._expire_locked()
+            recognizer = self._recognizers.get(session_id) or self._finishing.get(session_id)
+            if recognizer is None:
+                recognizer = self._recognizers[session_id] = StreamingRecognizer(self.client)
+        # 取消需要与开发板通信，不在锁内进行，以免阻塞其他会话
+        for stale in expired:
+            stale.cancel()
+        return recognizer.feed(samples, sample_rate)
+
+    def start(self, session_id: str):
+        """开始录音：放弃会话上一次未结束的识别，并为本次录音登记识别（第一块音频先到时沿用它）"""
+        with self._lock:
+            self._finishing.pop(session_id, None)
+            stale = self._recognizers.get(session_id)
+            if stale is not None and not stale.started:
+                stale.started = True
+                return
+            recognizer = self._recognizers[session_id] = StreamingRecognizer(self.client)
+            recognizer.started = True
+        if stale is not None:
+            stale.cancel()
+
+    def pop(self, session_id: str) -> Optional[StreamingRecognizer]:
+        """取出会话进行中的识别（录音结束时调用），迟到的音频块仍交给它"""
+        with self._lock:
+            recognizer = self._recognizers.pop(session_id, None)
+            if recognizer is not None:
+                self._finishing[session_id] = recognizer
+            return recognizer
+
+    def cancel(self, session_id: str):
+        """放弃会话进行中的识别（如重新开始录音）"""
+        with self._lock:
+            recognizer = self._recognizers.pop(session_id, None)
+            self._finishing.pop(session_id, None)
+        if recognizer is not None:
+            recognizer.cancel()
+
+    def _expire_locked(self) -> List[StreamingRecognizer]:
+        """移除空闲超时的识别，返回其中需要取消的（由调用方在锁外取消）"""
+        now = time.monotonic()
+        expired = []
+        for session_id, recognizer in list(self._recognizers.items()):
+            if recognizer.idle(now) > self.idle_timeout:
+                del self._recognizers[session_id]
+                expired.append(recognizer)
+        # 结束中的识别已由取出方调用 finish，只需移除登记
+        for session_id, recognizer in list(self._finishing.items()):
+            if recognizer.idle(now) > self.idle_timeout:
+                del self._finishing[session_id]
+        return expired
+
+    def __len__(self):
+        with self._lock:
+            return len(self._recognizers)
@@ -0,0 +1,190 @@
+"""
+临时文件管理
+
+为每个请求分配唯一的输出路径（病历图片、PDF、语音文件等），避免并发用户互相覆盖，
+按会话记录生成的文件，并由后台清理线程按存放时间和目录总大小删除过期文件。
+"""
+import os
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional, Set
+
+from config import TEMP_DIR, TEMP_MAX_AGE, TEMP_MAX_BYTES, TEMP_SWEEP_INTERVAL, TEMP_GRACE_PERIOD
+
+
+class TempFileManager:
+    """
+    临时文件管理器
+
+    Args:
+        root: 临时文件目录
+        max_age: 文件最长保留时间（秒）
+        max_bytes: 目录总大小上限（字节），超出时从最旧的文件开始删除
+        sweep_interval: 后台清理的间隔（秒）
+        grace_period: 新文件的保护期（秒），保护期内不会因目录超限被删除
+    """
+
+    def __init__(
+        self,
+        root: str = TEMP_DIR,
+        max_age: float = TEMP_MAX_AGE,
+        max_bytes: int = TEMP_MAX_BYTES,
+        sweep_interval: float = TEMP_SWEEP_INTERVAL,
+        grace_period: float = TEMP_GRACE_PERIOD
+    ):
+        self.root = root
+        self.max_age = max_age
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.grace_period = grace_period
+        self._sessions: Dict[str, Set[str]] = {}
+        self._pending: List[str] = []       # 会话结束后等待删除的文件
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._stopped = threading.Event()
+        self._janitor: Optional[threading.Thread] = None
+        self.removed_files = 0
+        self.removed_bytes = 0
+        os.makedirs(root, exist_ok=True)
+
+    def new_path(self, suffix: str, session_id: Optional[str] = None, prefix: str = "tmp") -> str:
+        """
+        分配一个唯一的临时文件路径（只生成路径，不创建文件）
+
+        Args:
+            suffix: 文件扩展名，如 ".png"
+            session_id: 所属会话，会话结束时文件随之删除
+            prefix: 文件名前缀，便于排查
+        """
+        path = os.path.join(self.root, f"{prefix}_{uuid.uuid4().hex}{suffix}")
+        if session_id:
+            with self._lock:
+                self._sessions.setdefault(session_id, set()).add(path)
+        return path
+
+    def release_session(self, session_id: str):
+        """会话结束，其文件交给后台线程删除（不在调用方线程做磁盘操作）"""
+        with self._lock:
+            paths = self._sessions.pop(session_id, None)
+            if not paths:
+                return
+            self._pending.extend(paths)
+        self._wakeup.set()
+
+    def _remove(self, path: str, size: Optional[int] = None):
+        try:
+            if size is None:
+                size = os.path.getsize(path)
+            os.remove(path)
+        except OSError:
+            return
+        self.removed_files += 1
+        self.removed_bytes += size
+
+    def sweep(self):
+        """
+        执行一次清理：删除已结束会话的文件、超过保留时间的文件，
+        目录仍超出大小上限时从最旧的文件开始删除
+        """
+        with self._lock:
+            pending, self._pending = self._pending, []
+            tracked = {path: session_id for session_id, paths in self._sessions.items() for path in paths}
+        for path in pending:
+            self._remove(path)
+
+        now = time.time()
+        files = []
+        try:
+            entries = list(os.scandir(self.root))
+        except OSError:
+            return
+        for entry in entries:
+            try:
+                if not entry.is_file():
+                    continue
+                stat = entry.stat()
+            except OSError:
+                continue
+            if now - stat.st_mtime > self.max_age:
+                self._remove(entry.path, stat.st_size)
+                self._forget(tracked.get(entry.path), entry.path)
+            else:
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total = sum(size for _, size, _ in files)
+        for mtime, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            if now - mtime < self.grace_period:
+                break
+            self._remove(path, size)
+            self._forget(tracked.get(path), path)
+            total -= size
+
+    def _forget(self, session_id: Optional[str], path: str):
+        if session_id is None:
+            return
+        with self._lock:
+            paths = self._sessions.get(session_id)
+            if paths is not None:
+                paths.discard(path)
+                if not paths:
+                    del self._sessions[session_id]
+
+    def _janitor_loop(self):
+        while not self._stopped.is_set():
+            self._wakeup.clear()
+            try:
+                self.sweep()
+            except Exception as e:
+                print(f"临时文件清理出错：{str(e)}")
+            self._wakeup.wait(self.sweep_interval)
+
+    def start(self):
+        """启动后台清理线程（首次清理会删除上次运行遗留的过期文件）"""
+        with self._lock:
+            if self._janitor is not None:
+                return
+            self._janitor = threading.Thread(target=self._janitor_loop, name="temp-janitor", daemon=True)
+            self._janitor.start()
+
+    def stop(self):
+        """停止后台清理线程"""
+        self._stopped.set()
+        self._wakeup.set()
+        if self._janitor is not None:
+            self._janitor.join()
+            self._janitor = None
+
+    def stats(self) -> Dict[str, int]:
+        """返回跟踪中的会话数、文件数和累计删除量"""
+        with self._lock:
+            return {
+                "sessions": len(self._sessions),
+                "tracked_files": sum(len(paths) for paths in self._sessions.values()),
+                "removed_files": self.removed_files,
+                "removed_bytes": self.removed_bytes
+            }
+
+
+_default_manager = None
+_default_manager_lock = threading.Lock()
+
+
+def get_temp_manager() -> TempFileManager:
+    """获取进程内共享的临时文件管理器，首次调用时启动后台清理线程"""
+    global _default_manager
+    with _default_manager_lock:
+        if _default_manager is None:
+            _default_manager = TempFileManager()
+            _default_manager.start()
+        return _default_manager
+
+
+def set_temp_manager(manager: Optional[TempFileManager]) -> Optional[TempFileManager]:
+    """替换共享的临时文件管理器（如指向测试用的临时目录），返回原来的管理器"""
+    global _default_manager
+    with _default_manager_lock:
+        previous, _default_manager = _default_manager, manager
+        return previous
@@ -0,0 +1,76 @@
+"""开发板长连接：帧格式、按请求编号分发结果、超时后清理待处理请求"""
+import socket
+import threading
+
+import pytest
+
+from board_client import (
+    BoardClient, BoardError, HEADER, KIND_OCR, KIND_ASR, STATUS_ERROR, CONTENT_TYPE_PNG, CONTENT_TYPE_TEXT,
+    send_frame, send_file_frame, recv_frame_with_type
+)
+from fake_servers import FakeBoardServer
+
+
+def test_frame_round_trip():
+    a, b = socket.socketpair()
+    with a, b:
+        send_frame(a, KIND_OCR, 7, "病历".encode("utf-8"), content_type=CONTENT_TYPE_TEXT)
+        send_frame(a, KIND_ASR, 8, b"", STATUS_ERROR)
+
+        assert recv_frame_with_type(b) == (KIND_OCR, 0, CONTENT_TYPE_TEXT, 7, bytearray("病历".encode("utf-8")))
+        assert recv_frame_with_type(b) == (KIND_ASR, STATUS_ERROR, 0, 8, bytearray())
+
+
+def test_file_frame_round_trip(tmp_path):
+    path = tmp_path / "scan.png"
+    data = bytes(range(256)) * 1000
+    path.write_bytes(data)
+    a, b = socket.socketpair()
+    with a, b, open(path, "rb") as f:
+        sender = threading.Thread(target=send_file_frame, args=(a, KIND_OCR, 3, f, len(data), CONTENT_TYPE_PNG))
+        sender.start()
+        kind, status, content_type, request_id, payload = recv_frame_with_type(b)
+        sender.join()
+
+    assert (kind, status, content_type, request_id) == (KIND_OCR, 0, CONTENT_TYPE_PNG, 3)
+    assert payload == data
+
+
+def test_invalid_header_is_rejected():
+    a, b = socket.socketpair()
+    with a, b:
+        a.sendall(HEADER.pack(b"XX", 1, KIND_OCR, 0, 0, 1, 0))
+        with pytest.raises(BoardError):
+            recv_frame_with_type(b)
+
+
+def test_concurrent_requests_get_their_own_results():
+    with FakeBoardServer(delay=0.05, handler=lambda kind, payload: payload.decode("utf-8")) as board:
+        client = BoardClient(*board.address)
+        results = {}
+
+        def request(i):
+            results[i] = client.request(KIND_OCR, f"第{i}张".encode("utf-8"), timeout=5)
+
+        threads = [threading.Thread(target=request, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        client.close()
+
+    assert results == {i: f"第{i}张" for i in range(8)}
+
+
+def test_timeout_removes_pending_request_and_keeps_connection():
+    with FakeBoardServer(delay=0.3) as board:
+        client = BoardClient(*board.address)
+        with pytest.raises(TimeoutError):
+            client.request(KIND_OCR, b"slow", timeout=0.05)
+        assert client._pending == {}
+
+        # 迟到的结果被丢弃，连接继续可用
+        sock = client._sock
+        assert client.request(KIND_OCR, b"next", timeout=5) == board.results[KIND_OCR]
+        assert client._sock is sock
+        client.close()
@@ -0,0 +1,23 @@
+"""开发板集群：瞬时指标只反映共享集群"""
+import board_client
+from board_pool import BoardPool
+from fake_servers import FakeBoardServer
+from metrics import REGISTRY
+
+
+def _healthy_lines():
+    return [line for line in REGISTRY.render().splitlines() if line.startswith("medical_board_healthy{")]
+
+
+def test_gauges_follow_the_shared_pool():
+    with FakeBoardServer() as shared_board, FakeBoardServer() as other_board:
+        shared = BoardPool([shared_board.address], health_interval=0)
+        previous = board_client.set_board_client(shared)
+        try:
+            # 临时创建的集群不会覆盖共享集群的指标
+            other = BoardPool([other_board.address], health_interval=0)
+            other.close()
+            assert _healthy_lines() == [f'medical_board_healthy{{board="{shared.boards[0].name}"}} 1.0']
+        finally:
+            board_client.set_board_client(previous)
+            shared.close()
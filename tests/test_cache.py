@@ -0,0 +1,66 @@
+"""回答缓存：过期、LRU 淘汰、持久化和问题文本的规范化"""
+import cache
+from cache import TTLCache, make_cache_key, normalize_prompt
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_entries_expire_after_ttl(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cache.time, "time", clock)
+    store = TTLCache(ttl=60)
+    store.set("a", {"answer": "多休息。"})
+    store.set("b", "短期", ttl=5)
+
+    clock.now += 30
+    assert store.get("a") == {"answer": "多休息。"}
+    assert store.get("b") is None
+
+    clock.now += 31
+    assert store.get("a") is None
+    assert store.stats() == {"hits": 1, "misses": 2, "entries": 0}
+
+
+def test_least_recently_used_entry_is_evicted():
+    store = TTLCache(max_entries=2)
+    store.set("a", 1)
+    store.set("b", 2)
+    store.get("a")
+    store.set("c", 3)
+
+    assert store.get("b") is None
+    assert store.get("a") == 1
+    assert store.get("c") == 3
+
+
+def test_persisted_entries_survive_restart(tmp_path, monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(cache.time, "time", clock)
+    path = str(tmp_path / "cache.sqlite3")
+    TTLCache(ttl=60, db_path=path).set("a", {"answer": "多喝水。"})
+
+    assert TTLCache(ttl=60, db_path=path).get("a") == {"answer": "多喝水。"}
+    clock.now += 61
+    assert TTLCache(ttl=60, db_path=path).get("a") is None
+
+
+def test_normalize_prompt_unifies_spelling_variants():
+    assert normalize_prompt("  头痛　怎么办？？ ") == "头痛 怎么办"
+    assert normalize_prompt("ＣＯＶＩＤ症状。") == normalize_prompt("covid症状")
+    assert normalize_prompt("发烧了，怎么办?") == normalize_prompt("发烧了，怎么办。")
+    # 句中标点保留，含义不同的问题不会合并
+    assert normalize_prompt("发烧，不咳嗽") != normalize_prompt("发烧不咳嗽")
+
+
+def test_cache_key_depends_on_prompt_and_identity():
+    identity = {"model": "deepseek-chat", "temperature": 0.7}
+    key = make_cache_key(normalize_prompt("头痛怎么办？"), identity)
+
+    assert key == make_cache_key(normalize_prompt("头痛怎么办"), dict(reversed(list(identity.items()))))
+    assert key != make_cache_key(normalize_prompt("头痛怎么办？"), {**identity, "temperature": 0.2})
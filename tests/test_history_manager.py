@@ -0,0 +1,68 @@
+"""对话历史压缩：保持在 token 预算之内，保留系统提示和最近的对话"""
+from history_manager import HistoryManager, SUMMARY_PREFIX, count_message_tokens, strip_search_context
+from prompts import SEARCH_CONTEXT_INSTRUCTION
+
+
+def _conversation(turns, question="今天还是头痛，需要去医院吗？"):
+    messages = [{"role": "system", "content": "你是一名医生。"}]
+    for i in range(turns):
+        messages.append({"role": "user", "content": f"第{i}次问诊，我最近头痛，晚上睡不好，怎么办？"})
+        messages.append({"role": "assistant", "content": "建议保证充足睡眠。" + "注意休息，避免熬夜，" * 20})
+    messages.append({"role": "user", "content": question})
+    return messages
+
+
+def test_short_history_is_unchanged():
+    messages = _conversation(1)
+    original = [dict(message) for message in messages]
+    tokens = HistoryManager(max_prompt_tokens=2000).compact(messages)
+
+    assert messages == original
+    assert tokens == count_message_tokens(messages)
+
+
+def test_compaction_stays_within_budget():
+    manager = HistoryManager(max_prompt_tokens=400, keep_recent_turns=2, summary_max_tokens=100)
+    messages = _conversation(20)
+    assert count_message_tokens(messages) > 400
+
+    tokens = manager.compact(messages)
+
+    assert tokens <= 400
+    assert count_message_tokens(messages) == tokens
+    assert messages[0] == {"role": "system", "content": "你是一名医生。"}
+    assert messages[-1]["content"] == "今天还是头痛，需要去医院吗？"
+
+
+def test_early_turns_become_a_summary():
+    manager = HistoryManager(max_prompt_tokens=1000, keep_recent_turns=2, summary_max_tokens=200)
+    messages = _conversation(8)
+    manager.compact(messages)
+
+    summaries = [m for m in messages if m["role"] == "system" and m["content"].startswith(SUMMARY_PREFIX)]
+    assert len(summaries) == 1
+    # 保留的两轮包括本轮问题：系统提示、摘要、上一轮问答、本轮问题
+    assert [m["role"] for m in messages] == ["system", "system", "user", "assistant", "user"]
+    assert messages[2]["content"].startswith("第7次问诊")
+
+
+def test_tiny_budget_keeps_the_current_question():
+    messages = _conversation(5)
+    HistoryManager(max_prompt_tokens=10, keep_recent_turns=1).compact(messages)
+
+    assert messages[-1] == {"role": "user", "content": "今天还是头痛，需要去医院吗？"}
+    assert not any(m["role"] == "assistant" for m in messages)
+
+
+def test_old_search_context_is_stripped():
+    enhanced = f"搜索结果参考信息：很长的网页摘要\n\n{SEARCH_CONTEXT_INSTRUCTION}\n头痛怎么办？"
+    messages = [
+        {"role": "user", "content": enhanced},
+        {"role": "assistant", "content": "多休息。"},
+        {"role": "user", "content": enhanced},
+    ]
+    HistoryManager(max_prompt_tokens=2000).compact(messages)
+
+    assert messages[0]["content"] == "头痛怎么办？"
+    assert messages[-1]["content"] == enhanced
+    assert strip_search_context("没有搜索结果的问题") == "没有搜索结果的问题"
@@ -0,0 +1,79 @@
+"""本地资料检索：切词、相关段落排序、不返回无关段落，以及本地优先的网络搜索"""
+import pytest
+
+from knowledge_index import KnowledgeIndex, LocalFirstSearch, build_index, tokenize
+from search_trigger import SearchTrigger
+
+DOCUMENTS = {
+    "感冒.md": "# 感冒\n\n感冒怎么办？多喝水，注意休息，发热时可服用退烧药。\n\n感冒通常一周左右自愈。",
+    "偏头痛.md": "# 偏头痛\n\n偏头痛发作时应在安静、避光的环境中休息，可服用布洛芬等止痛药。",
+    "高血压.md": "# 高血压\n\n高血压患者应低盐饮食，规律服用降压药，定期监测血压。",
+}
+
+
+class _Web:
+    def __init__(self):
+        self.queries = []
+
+    def search(self, query, limit=3):
+        self.queries.append(query)
+        return [{"title": "网络结果", "snippet": "最新研究摘要", "link": "https://example.com/1"}]
+
+    def format_search_results(self, results):
+        return "搜索结果参考信息：\n\n" + "".join(f"来源: {result['link']}\n" for result in results)
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def index(tmp_path):
+    source_dir = tmp_path / "knowledge"
+    source_dir.mkdir()
+    for name, text in DOCUMENTS.items():
+        (source_dir / name).write_text(text, encoding="utf-8")
+    build_index(str(source_dir), str(tmp_path / "index"))
+    index = KnowledgeIndex(str(tmp_path / "index"))
+    yield index
+    index.close()
+
+
+def test_tokenize_drops_question_words():
+    assert tokenize("头痛怎么办？") == ["头痛", "痛怎"]
+    assert tokenize("Ibuprofen 400mg 痛") == ["痛", "ibuprofen", "400mg"]
+
+
+def test_relevant_passage_ranks_first(index):
+    results = index.search("偏头痛吃什么止痛药")
+
+    assert results[0]["title"] == "偏头痛"
+    assert results[0]["link"] == "偏头痛.md#1"
+
+
+def test_unrelated_passage_is_not_returned(index):
+    # 只有"怎么办"与感冒段落相同，不应作为参考
+    assert "感冒" not in [result["title"] for result in index.search("头痛怎么办")]
+    assert index.search("骨折怎么办？") == []
+
+
+def test_web_search_runs_when_trigger_fires(index):
+    web = _Web()
+    search = LocalFirstSearch(index, web, SearchTrigger())
+
+    results = search.search("高血压有什么最新研究")
+    assert [result["title"] for result in results] == ["高血压", "网络结果"]
+    text = search.format_search_results(results)
+    assert "本地医学资料参考信息" in text and "搜索结果参考信息" in text
+
+    assert [result["title"] for result in search.search("高血压饮食")] == ["高血压"]
+    assert search.search("骨折怎么办") == []
+    assert web.queries == ["高血压有什么最新研究"]
+
+
+def test_web_search_without_trigger_only_when_local_is_empty(index):
+    web = _Web()
+    search = LocalFirstSearch(index, web)
+
+    assert [result["title"] for result in search.search("高血压饮食")] == ["高血压"]
+    assert [result["title"] for result in search.search("骨折怎么办")] == ["网络结果"]
+    assert web.queries == ["骨折怎么办"]
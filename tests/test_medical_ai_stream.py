@@ -0,0 +1,108 @@
+"""流式回答中途失败时，不完整的回答不进入缓存和对话历史"""
+import time
+from types import SimpleNamespace
+
+import pytest
+
+from cache import TTLCache
+from medical_ai import (
+    DeepSeekProvider, MedicalAI, ResponseStreamError, SEARCH_DEADLINE_MISSES, is_failed_response
+)
+
+
+def _chunk(text):
+    return SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=text))], usage=None)
+
+
+class _BrokenStream:
+    """产出一个分片后连接断开的流式响应"""
+
+    def __init__(self):
+        self.closed = False
+        self._chunks = self._generate()
+
+    def _generate(self):
+        yield _chunk("建议多休息，")
+        raise ConnectionError("connection reset")
+
+    def __iter__(self):
+        return self._chunks
+
+    def close(self):
+        self.closed = True
+
+
+class _Stream(_BrokenStream):
+    """正常结束的流式响应"""
+
+    def _generate(self):
+        yield _chunk("建议多休息，")
+        yield _chunk("多喝水。")
+
+
+def _provider(stream):
+    provider = DeepSeekProvider(api_key="sk-test", hedge=False)
+    provider.client = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(
+        create=lambda **kwargs: stream
+    )))
+    return provider
+
+
+def test_provider_raises_with_partial_text():
+    history = []
+    received = []
+    with pytest.raises(ResponseStreamError) as excinfo:
+        for delta in _provider(_BrokenStream()).generate_response_stream("头痛怎么办。", history):
+            received.append(delta)
+
+    assert received == ["建议多休息，"]
+    assert excinfo.value.partial == "建议多休息，"
+    assert all(message["role"] != "assistant" for message in history)
+
+
+def test_failed_stream_is_not_cached_or_recorded():
+    cache = TTLCache()
+    medical_ai = MedicalAI(_provider(_BrokenStream()), response_cache=cache)
+    history = []
+    answers = []
+    with pytest.raises(ResponseStreamError):
+        for answer in medical_ai.get_medical_advice_stream("头痛怎么办。", history):
+            answers.append(answer)
+
+    assert answers == ["建议多休息，"]
+    assert cache.stats()["entries"] == 0
+    assert all(message["role"] != "assistant" for message in history)
+
+
+def test_completed_stream_is_cached_and_recorded():
+    cache = TTLCache()
+    medical_ai = MedicalAI(_provider(_Stream()), response_cache=cache)
+    history = []
+    answers = list(medical_ai.get_medical_advice_stream("头痛怎么办。", history))
+
+    assert answers[-1] == "建议多休息，多喝水。"
+    assert cache.stats()["entries"] == 1
+    assert history[-1] == {"role": "assistant", "content": "建议多休息，多喝水。"}
+
+
+class _SlowSearch:
+    """超过截止时间才返回的搜索服务"""
+
+    always_search = True
+
+    def search(self, query):
+        time.sleep(0.2)
+        return []
+
+
+def test_failed_speculative_answer_is_not_recorded():
+    misses = SEARCH_DEADLINE_MISSES.value()
+    medical_ai = MedicalAI(_provider(_BrokenStream()), search_service=_SlowSearch(),
+                           search_deadline=0.01, speculative_generation=True)
+    history = [{"role": "system", "content": "你是一名医生。"}]
+
+    response = medical_ai.get_medical_advice("头痛怎么办。", history)
+
+    assert is_failed_response(response)
+    assert history == [{"role": "system", "content": "你是一名医生。"}]
+    assert SEARCH_DEADLINE_MISSES.value() == misses + 1
@@ -0,0 +1,77 @@
+"""上游调用容错：重试临时错误、排队时间计入截止时间、熔断"""
+import threading
+import time
+
+import pytest
+
+from resilience import CircuitBreaker, CircuitOpenError, DeadlineExceededError, ResilientCaller, RetryPolicy
+
+
+def test_transient_errors_are_retried():
+    attempts = []
+
+    def flaky(timeout):
+        attempts.append(timeout)
+        if len(attempts) < 3:
+            raise ConnectionError("reset")
+        return "ok"
+
+    caller = ResilientCaller("test", timeout=5, retry=RetryPolicy(max_retries=2, base_delay=0), hedge=False)
+    assert caller.call(flaky) == "ok"
+    assert len(attempts) == 3
+    assert caller.stats()["retries"] == 2
+
+    with pytest.raises(ValueError):
+        caller.call(lambda timeout: int("x"))
+    assert caller.stats()["retries"] == 2
+
+
+def test_timeout_is_measured_when_the_attempt_starts():
+    caller = ResilientCaller("test", timeout=1.0, retry=RetryPolicy(max_retries=0), hedge=False, max_workers=1)
+    running, release = threading.Event(), threading.Event()
+    started = []
+
+    def block(timeout):
+        running.set()
+        release.wait()
+
+    def queued(timeout):
+        started.append(timeout)
+        return timeout
+
+    # 唯一的线程被占用，第二个请求排队约 0.3 秒
+    blocker = threading.Thread(target=caller.call, args=(block,))
+    blocker.start()
+    running.wait()
+    threading.Timer(0.3, release.set).start()
+    assert caller.call(queued) <= 0.75
+    blocker.join()
+
+    running.clear()
+    release.clear()
+    blocker = threading.Thread(target=caller.call, args=(block,))
+    blocker.start()
+    running.wait()
+    with pytest.raises(DeadlineExceededError):
+        caller.call(queued, timeout=0.1)
+    release.set()
+    blocker.join()
+    time.sleep(0.05)
+    # 排队期间已超过时限的请求不会再发起
+    assert len(started) == 1
+    caller.close()
+
+
+def test_breaker_opens_after_consecutive_failures():
+    breaker = CircuitBreaker(failure_threshold=2, recovery_timeout=60)
+    caller = ResilientCaller("test", retry=RetryPolicy(max_retries=0), breaker=breaker, hedge=False)
+
+    def down(timeout):
+        raise ConnectionError("refused")
+
+    for _ in range(2):
+        with pytest.raises(ConnectionError):
+            caller.call(down)
+    with pytest.raises(CircuitOpenError):
+        caller.call(lambda timeout: "ok")
+    assert breaker.state == CircuitBreaker.OPEN
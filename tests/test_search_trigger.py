@@ -0,0 +1,61 @@
+"""搜索触发：加权计分、同义词归并、否定词范围和词表文件"""
+from search_trigger import AhoCorasick, SearchTrigger
+
+
+def test_weighted_terms_reach_threshold():
+    trigger = SearchTrigger()
+
+    assert trigger.evaluate("头痛怎么办？").score == 0
+    assert not trigger.evaluate("这个药的副作用大吗？")
+    result = trigger.evaluate("糖尿病有什么最新研究？")
+    assert result.should_search
+    assert result.matched == ["最新", "研究"]
+    assert result.score == 2.0
+
+
+def test_synonyms_score_as_their_term():
+    trigger = SearchTrigger()
+
+    result = trigger.evaluate("有没有 LATEST 的 Clinical Trial 论文")
+    assert result.matched == ["最新", "临床试验", "研究"]
+    assert result.score == 3.0
+    # 同一词条的同义词多次出现只计一次
+    assert trigger.evaluate("论文和研究").matched == ["研究"]
+
+
+def test_negated_terms_do_not_count():
+    trigger = SearchTrigger()
+
+    result = trigger.evaluate("不需要最新研究，说说怎么缓解")
+    assert not result.should_search
+    assert result.matched == []
+    assert result.negated == ["最新", "研究"]
+
+
+def test_negation_stops_at_clause_break_and_window():
+    trigger = SearchTrigger(negation_window=2)
+
+    # 否定词不跨越分句
+    assert trigger.evaluate("不用担心，有什么最新研究？").matched == ["最新", "研究"]
+    # 超出窗口的词条照常计分
+    assert trigger.evaluate("不用吃药吗还有最新指南").matched == ["最新", "指南"]
+    # 同一词条既被否定又在别处命中时按命中计
+    result = trigger.evaluate("不要查新闻。有什么新闻？")
+    assert result.matched == ["新闻"]
+    assert result.negated == []
+
+
+def test_terms_file(tmp_path):
+    path = tmp_path / "terms.tsv"
+    path.write_text("# 词条\t权重\t同义词\n靶向药\t1.0\ttargeted|靶向治疗\n共识\t\n\n", encoding="utf-8")
+    trigger = SearchTrigger.from_file(str(path), threshold=1.0)
+
+    assert trigger.terms == {"靶向药": 1.0, "共识": 1.0}
+    assert trigger.evaluate("肺癌靶向治疗").matched == ["靶向药"]
+    assert trigger.evaluate("专家共识").should_search
+
+
+def test_automaton_finds_overlapping_patterns():
+    automaton = AhoCorasick([("he", 1), ("she", 2), ("hers", 3)])
+
+    assert list(automaton.finditer("ushers")) == [(1, 4, 2), (2, 4, 1), (2, 6, 3)]
@@ -0,0 +1,84 @@
+"""流式识别：录音开始与第一块音频的先后顺序、结束时不阻塞迟到的音频块"""
+import threading
+import time
+
+import numpy as np
+
+from streaming_asr import StreamingRecognizers
+
+
+class _Stream:
+    def __init__(self):
+        self.chunks = []
+        self.cancelled = False
+        self.release = threading.Event()
+        self.partial = ""
+
+    def send(self, data):
+        self.chunks.append(data)
+
+    def finish(self, timeout=None):
+        self.release.wait(timeout)
+        return "头痛怎么办"
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class _Client:
+    def __init__(self):
+        self.streams = []
+
+    def open_stream(self, kind, content_type):
+        self.streams.append(_Stream())
+        return self.streams[-1]
+
+
+CHUNK = np.zeros(1600, dtype=np.int16)
+
+
+def test_first_chunk_before_start_is_kept():
+    client = _Client()
+    streams = StreamingRecognizers(client=client)
+
+    streams.feed("s", CHUNK, 16000)
+    streams.start("s")
+    streams.feed("s", CHUNK, 16000)
+
+    assert len(client.streams) == 1
+    assert not client.streams[0].cancelled
+    assert len(client.streams[0].chunks) == 2
+
+
+def test_start_abandons_unfinished_recording():
+    client = _Client()
+    streams = StreamingRecognizers(client=client)
+
+    streams.start("s")
+    streams.feed("s", CHUNK, 16000)
+    streams.start("s")
+    streams.feed("s", CHUNK, 16000)
+
+    assert [stream.cancelled for stream in client.streams] == [True, False]
+
+
+def test_finish_does_not_block_late_chunks():
+    client = _Client()
+    streams = StreamingRecognizers(client=client)
+    streams.start("s")
+    streams.feed("s", CHUNK, 16000)
+    recognizer = streams.pop("s")
+
+    results = []
+    waiter = threading.Thread(target=lambda: results.append(recognizer.finish(timeout=5)))
+    waiter.start()
+    while not recognizer.finished:
+        time.sleep(0.01)
+    # 等待最终结果期间，迟到的音频块立即返回并被丢弃
+    start = time.monotonic()
+    streams.feed("s", CHUNK, 16000)
+    assert time.monotonic() - start < 1
+    assert len(client.streams) == 1 and len(client.streams[0].chunks) == 1
+    client.streams[0].release.set()
+    waiter.join()
+    assert results == ["头痛怎么办"]
@@ -0,0 +1,14 @@
+"""逐句合成的切分不朗读回答末尾的参考链接"""
+from medical_ai import MedicalAI
+from tts_service import split_sentences
+
+
+def test_split_sentences_drops_formatted_references():
+    answer = "建议多休息。注意补充水分，必要时及时就医。"
+    links = ["https://example.com/a", "https://example.com/b"]
+    text = answer + MedicalAI._format_references(links)
+
+    sentences = split_sentences(text)
+
+    assert "".join(sentences) == answer
+    assert not any("example.com" in sentence for sentence in sentences)
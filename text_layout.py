@@ -0,0 +1,123 @@
+"""
+按像素宽度排版文本
+
+逐字测量字形宽度（每种字体各自缓存），中文可在任意两字之间断行，
+英文单词和数字保持完整，并遵守常见的避头尾规则：
+句号、逗号、右括号等不出现在行首，左括号、左引号不出现在行尾。
+"""
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, List
+
+from PIL import ImageFont
+
+# 不能出现在行首的标点
+NO_LINE_START = set("，。！？；：、）》」』】〕”’…—,.!?;:)]}%")
+# 不能出现在行尾的标点
+NO_LINE_END = set("（《「『【〔“‘([{")
+
+# 英文单词、数字、URL 等连续的非中文字符作为一个整体
+_TOKEN_PATTERN = re.compile(r"[A-Za-z0-9_\-./:@%#&=+?~]+|\s+|.", re.S)
+
+WRAP_CACHE_SIZE = 512
+
+
+class TextLayout:
+    """
+    基于字形宽度的文本换行
+
+    Args:
+        font: PIL 字体
+    """
+
+    def __init__(self, font: ImageFont.FreeTypeFont):
+        self.font = font
+        self._widths: Dict[str, float] = {}
+        self._wrap_cache: "OrderedDict[tuple, List[str]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def char_width(self, char: str) -> float:
+        """返回单个字符的宽度（像素），结果按字符缓存"""
+        width = self._widths.get(char)
+        if width is None:
+            width = self.font.getlength(char)
+            self._widths[char] = width
+        return width
+
+    def text_width(self, text: str) -> float:
+        """返回文本宽度（逐字宽度之和，忽略字距微调）"""
+        char_width = self.char_width
+        return sum(char_width(char) for char in text)
+
+    def _tokens(self, paragraph: str) -> List[str]:
+        """切分为不可再分的排版单元，并按避头尾规则把标点粘到相邻单元上"""
+        tokens = []
+        for token in _TOKEN_PATTERN.findall(paragraph):
+            if tokens and (token[0] in NO_LINE_START or tokens[-1][-1] in NO_LINE_END):
+                tokens[-1] += token
+            else:
+                tokens.append(token)
+        return tokens
+
+    def _split_long_token(self, token: str, max_width: float) -> List[str]:
+        """单个单元比整行还宽时（如很长的网址），只能逐字断开"""
+        pieces, current, width = [], "", 0.0
+        for char in token:
+            w = self.char_width(char)
+            if current and width + w > max_width:
+                pieces.append(current)
+                current, width = "", 0.0
+            current += char
+            width += w
+        if current:
+            pieces.append(current)
+        return pieces
+
+    def _wrap_paragraph(self, paragraph: str, max_width: float) -> List[str]:
+        lines, current, width = [], "", 0.0
+        for token in self._tokens(paragraph):
+            if not current and token.isspace():
+                continue
+            token_width = self.text_width(token)
+            if width + token_width <= max_width:
+                current += token
+                width += token_width
+                continue
+            if current.strip():
+                lines.append(current.rstrip())
+            if token.isspace():
+                current, width = "", 0.0
+                continue
+            if token_width > max_width:
+                *full, token = self._split_long_token(token, max_width)
+                lines.extend(full)
+                token_width = self.text_width(token)
+            current, width = token, token_width
+        if current.strip() or not lines:
+            lines.append(current.rstrip())
+        return lines
+
+    def wrap(self, text: str, max_width: float) -> List[str]:
+        """
+        将文本按像素宽度换行，保留原有的换行
+
+        Returns:
+            行列表，每行宽度不超过 max_width
+        """
+        key = (text, max_width)
+        with self._lock:
+            cached = self._wrap_cache.get(key)
+            if cached is not None:
+                self._wrap_cache.move_to_end(key)
+                return list(cached)
+
+        lines = []
+        for paragraph in text.split("\n"):
+            lines.extend(self._wrap_paragraph(paragraph, max_width))
+
+        with self._lock:
+            self._wrap_cache[key] = lines
+            while len(self._wrap_cache) > WRAP_CACHE_SIZE:
+                self._wrap_cache.popitem(last=False)
+        return list(lines)
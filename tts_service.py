@@ -0,0 +1,228 @@
+"""
+语音合成服务
+
+合成结果按内容寻址缓存：以 (引擎, 音色, 文本) 的哈希作为文件名保存在 TTS_CACHE_DIR，
+同一段文本只合成一次，之后直接返回缓存文件。优先使用 gTTS，失败时退回本地 pyttsx3 引擎，
+本地引擎只初始化一次并在锁内复用。长文本可按句切分逐句合成，第一句完成即可开始播放。
+"""
+import os
+import re
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, Iterator, List, Optional
+
+from cache import make_cache_key
+from prompts import REFERENCES_HEADER
+from metrics import span, record_cache
+from config import TTS_CACHE_DIR, TTS_LANG, TTS_CACHE_MAX_FILES, TTS_SENTENCE_MAX_CHARS, TTS_WORKER_THREADS
+
+_SENTENCE_END = re.compile(r"(?<=[。！？!?；;\n])")
+_PRUNE_EVERY = 50  # 每写入多少个文件检查一次缓存目录大小
+
+
+def split_sentences(text: str, max_chars: int = TTS_SENTENCE_MAX_CHARS) -> List[str]:
+    """
+    将回答切分为适合逐句合成的片段
+
+    去掉参考链接列表（REFERENCES_HEADER 或模型自己写的"参考："之后的部分）；
+    过短的句子与下一句合并，减少合成请求次数；过长的句子在逗号处截断。
+    """
+    for marker in (REFERENCES_HEADER, "参考："):
+        text = text.split(marker)[0]
+    sentences, current = [], ""
+    for piece in _SENTENCE_END.split(text):
+        piece = piece.strip()
+        if not piece:
+            continue
+        while len(piece) > max_chars:
+            cut = max(piece.rfind("，", 0, max_chars), piece.rfind(",", 0, max_chars))
+            cut = cut + 1 if cut > 0 else max_chars
+            sentences.append(piece[:cut])
+            piece = piece[cut:]
+        if current and len(current) + len(piece) > max_chars:
+            sentences.append(current)
+            current = ""
+        current += piece
+        if len(current) >= max_chars // 4:
+            sentences.append(current)
+            current = ""
+    if current:
+        sentences.append(current)
+    return sentences
+
+
+class TTSService:
+    """
+    带缓存的语音合成
+
+    Args:
+        cache_dir: 合成结果缓存目录
+        lang: gTTS 语言
+        max_files: 缓存目录最多保留的文件数，超出时删除最久未使用的文件
+        workers: 逐句合成时的并发线程数
+    """
+
+    def __init__(
+        self,
+        cache_dir: str = TTS_CACHE_DIR,
+        lang: str = TTS_LANG,
+        max_files: int = TTS_CACHE_MAX_FILES,
+        workers: int = TTS_WORKER_THREADS
+    ):
+        self.cache_dir = cache_dir
+        self.lang = lang
+        self.max_files = max_files
+        os.makedirs(cache_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="tts")
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._engine = None                  # 本地 pyttsx3 引擎，首次需要时初始化
+        self._engine_lock = threading.Lock()  # pyttsx3 不是线程安全的
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def _cache_path(self, text: str, engine: str, voice: str, suffix: str) -> str:
+        return os.path.join(self.cache_dir, make_cache_key("tts", engine, voice, text) + suffix)
+
+    def _candidates(self, text: str):
+        """按优先级返回 (引擎名, 缓存路径, 合成函数)"""
+        return [
+            ("gtts", self._cache_path(text, "gtts", self.lang, ".mp3"), self._synthesize_gtts),
+            # espeak 等本地后端输出 WAV，与扩展名无关
+            ("pyttsx3", self._cache_path(text, "pyttsx3", "default", ".wav"), self._synthesize_local),
+        ]
+
+    def _synthesize_gtts(self, text: str, path: str):
+        from gtts import gTTS
+        gTTS(text=text, lang=self.lang).save(path)
+
+    def _synthesize_local(self, text: str, path: str):
+        with self._engine_lock:
+            if self._engine is None:
+                import pyttsx3
+                self._engine = pyttsx3.init()
+            self._engine.save_to_file(text, path)
+            self._engine.runAndWait()
+
+    def _lookup(self, text: str) -> Optional[str]:
+        for _, path, _ in self._candidates(text):
+            if os.path.exists(path):
+                try:
+                    os.utime(path)  # 更新访问时间，用于淘汰最久未使用的文件
+                except OSError:
+                    pass
+                return path
+        return None
+
+    def _synthesize_uncached(self, text: str) -> Optional[str]:
+        for engine, path, synthesize in self._candidates(text):
+            partial_path = f"{path}.{threading.get_ident()}.part"
+            try:
+                with span("tts", engine=engine, chars=len(text)):
+                    synthesize(text, partial_path)
+                if not os.path.getsize(partial_path):
+                    raise RuntimeError("合成结果为空")
+                os.replace(partial_path, path)
+                self._after_write()
+                return path
+            except Exception as e:
+                print(f"{engine} 语音合成失败: {str(e)}")
+                if os.path.exists(partial_path):
+                    os.remove(partial_path)
+        return None
+
+    def _after_write(self):
+        with self._lock:
+            self._writes += 1
+            if self._writes % _PRUNE_EVERY:
+                return
+        self.prune()
+
+    def prune(self):
+        """缓存文件数超出上限时删除最久未使用的文件"""
+        try:
+            entries = [entry for entry in os.scandir(self.cache_dir) if entry.is_file()]
+        except OSError:
+            return
+        excess = len(entries) - self.max_files
+        if excess <= 0:
+            return
+        entries.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in entries[:excess]:
+            try:
+                os.remove(entry.path)
+            except OSError:
+                pass
+
+    def synthesize_async(self, text: str) -> Future:
+        """
+        提交合成任务，返回结果为音频文件路径（失败时为 None）的 Future
+
+        命中缓存时返回已完成的 Future；同一文本正在合成时复用同一个任务。
+        """
+        text = text.strip()
+        path = self._lookup(text)
+        record_cache("tts", path is not None)
+        if path is not None:
+            with self._lock:
+                self.hits += 1
+            future = Future()
+            future.set_result(path)
+            return future
+
+        key = make_cache_key(self.lang, text)
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is not None:
+                return future
+            self.misses += 1
+            future = self._executor.submit(self._synthesize_uncached, text)
+            self._inflight[key] = future
+
+        def done(_):
+            with self._lock:
+                self._inflight.pop(key, None)
+        future.add_done_callback(done)
+        return future
+
+    def synthesize(self, text: str) -> Optional[str]:
+        """合成整段文本，返回音频文件路径，全部引擎失败时返回 None"""
+        if not text or not text.strip():
+            return None
+        return self.synthesize_async(text).result()
+
+    def synthesize_sentences(self, text: str) -> Iterator[str]:
+        """
+        逐句合成并按顺序产出音频文件路径
+
+        所有句子一次性提交，合成并行进行；第一句完成即产出，调用方可以边播放边等待后续句子。
+        """
+        futures = [self.synthesize_async(sentence) for sentence in split_sentences(text or "")]
+        for future in futures:
+            path = future.result()
+            if path is not None:
+                yield path
+
+    def prewarm(self, texts: List[str]):
+        """在后台合成常用文本，之后播放时直接命中缓存"""
+        for text in texts:
+            if text and text.strip():
+                self.synthesize_async(text)
+
+    def stats(self) -> Dict[str, int]:
+        """返回缓存命中与未命中次数"""
+        return {"hits": self.hits, "misses": self.misses}
+
+
+_default_service = None
+_default_service_lock = threading.Lock()
+
+
+def get_tts_service() -> TTSService:
+    """获取进程内共享的语音合成服务"""
+    global _default_service
+    with _default_service_lock:
+        if _default_service is None:
+            _default_service = TTSService()
+        return _default_service
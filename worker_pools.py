@@ -0,0 +1,167 @@
+"""
+阻塞任务的线程池
+
+开发板通信、大模型调用和图像渲染分别使用独立的有界线程池：
+某一类任务变慢（如开发板无响应）只会占满自己的线程池，不会拖住其他类型的请求。
+每个线程池同时容纳的任务数（执行中 + 排队）有上限，超出时等待片刻后拒绝，
+由界面提示用户稍后再试，而不是无限堆积。
+提交的任务在提交方的上下文副本中执行，任务内开始的指标阶段归属于提交方所在的阶段。
+"""
+import contextvars
+import queue
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Callable, Dict, Iterator
+
+from config import (
+    BOARD_WORKERS, BOARD_QUEUE_SIZE, LLM_WORKERS, LLM_QUEUE_SIZE,
+    RENDER_WORKERS, RENDER_QUEUE_SIZE, POOL_WAIT_TIMEOUT, BOARD_ADDRESSES
+)
+from metrics import REGISTRY
+
+
+class PoolBusyError(Exception):
+    """线程池已满，请求被拒绝"""
+
+
+class BoundedExecutor:
+    """
+    容量有限的线程池
+
+    Args:
+        name: 线程池名称（用于线程名和提示信息）
+        max_workers: 工作线程数
+        max_queue: 除执行中的任务外最多排队的任务数
+        wait_timeout: 线程池已满时等待空位的最长时间（秒）
+    """
+
+    def __init__(self, name: str, max_workers: int, max_queue: int, wait_timeout: float = POOL_WAIT_TIMEOUT):
+        self.name = name
+        self.max_workers = max_workers
+        self.capacity = max_workers + max_queue
+        self.wait_timeout = wait_timeout
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"{name}-pool")
+        self._slots = threading.BoundedSemaphore(self.capacity)
+        self._lock = threading.Lock()
+        self._pending = 0
+        self.rejected = 0
+
+    def submit(self, fn: Callable, *args, **kwargs) -> Future:
+        """
+        提交任务
+
+        Raises:
+            PoolBusyError: 等待 wait_timeout 秒后仍没有空位
+        """
+        if not self._slots.acquire(timeout=self.wait_timeout):
+            with self._lock:
+                self.rejected += 1
+            raise PoolBusyError(f"{self.name} 线程池已满（{self.capacity} 个任务）")
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(contextvars.copy_context().run, fn, *args, **kwargs)
+        except BaseException:
+            self._release(None)
+            raise
+        future.add_done_callback(self._release)
+        return future
+
+    def _release(self, _):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def run(self, fn: Callable, *args, **kwargs):
+        """提交任务并等待结果"""
+        return self.submit(fn, *args, **kwargs).result()
+
+    def iterate(self, make_iterator: Callable[[], Iterator]) -> Iterator:
+        """
+        在线程池中运行生成器，逐项转交给调用方
+
+        调用时立即提交（线程池已满时在此抛出 PoolBusyError），生成器的整个生命周期占用一个工作线程；
+        调用方提前停止迭代时，生成器在产出下一项后结束。
+        """
+        items: "queue.Queue" = queue.Queue()
+        done = object()
+        cancelled = threading.Event()
+
+        def produce():
+            try:
+                for item in make_iterator():
+                    items.put((True, item))
+                    if cancelled.is_set():
+                        break
+            except BaseException as e:
+                items.put((False, e))
+            finally:
+                items.put((True, done))
+
+        self.submit(produce)
+        return self._drain(items, done, cancelled)
+
+    @staticmethod
+    def _drain(items: "queue.Queue", done, cancelled: threading.Event) -> Iterator:
+        try:
+            while True:
+                ok, item = items.get()
+                if not ok:
+                    raise item
+                if item is done:
+                    return
+                yield item
+        finally:
+            cancelled.set()
+
+    def stats(self) -> Dict[str, int]:
+        """返回线程数、当前任务数（执行中 + 排队）、容量和累计拒绝数"""
+        with self._lock:
+            return {
+                "workers": self.max_workers,
+                "pending": self._pending,
+                "capacity": self.capacity,
+                "rejected": self.rejected
+            }
+
+
+_POOL_SETTINGS = {
+    # 开发板通信线程按开发板数量扩展，增加开发板时吞吐量随之提升
+    "board": (BOARD_WORKERS * len(BOARD_ADDRESSES), BOARD_QUEUE_SIZE * len(BOARD_ADDRESSES)),
+    "llm": (LLM_WORKERS, LLM_QUEUE_SIZE),
+    "render": (RENDER_WORKERS, RENDER_QUEUE_SIZE),
+}
+_pools: Dict[str, BoundedExecutor] = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(name: str) -> BoundedExecutor:
+    """
+    获取共享线程池
+
+    Args:
+        name: "board"（开发板通信）、"llm"（大模型调用）或 "render"（图像与病历渲染）
+    """
+    with _pools_lock:
+        pool = _pools.get(name)
+        if pool is None:
+            if name not in _POOL_SETTINGS:
+                raise ValueError(f"Unknown worker pool: {name}")
+            pool = BoundedExecutor(name, *_POOL_SETTINGS[name])
+            _pools[name] = pool
+        return pool
+
+
+def pool_stats() -> Dict[str, Dict[str, int]]:
+    """返回所有已创建线程池的统计"""
+    with _pools_lock:
+        return {name: pool.stats() for name, pool in _pools.items()}
+
+
+def _pool_gauge(field: str):
+    return lambda: {(name,): stats[field] for name, stats in pool_stats().items()}
+
+
+REGISTRY.gauge_callback("medical_pool_pending", "线程池中执行和排队的任务数", ["pool"], _pool_gauge("pending"))
+REGISTRY.gauge_callback("medical_pool_capacity", "线程池容量（线程数 + 排队上限）", ["pool"], _pool_gauge("capacity"))
+REGISTRY.gauge_callback("medical_pool_rejected", "线程池已满被拒绝的任务累计数", ["pool"], _pool_gauge("rejected"))